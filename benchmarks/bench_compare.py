@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+if not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QPointF
+from PyQt5.QtWidgets import QApplication
+
+from image_pyramid import PyramidCache
+from processing_options import quality_metrics_available
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def generate_pair(directory, megapixels, scale, extension):
+    # A source and its LANCZOS upscale, made in a worker process so the parent's peak memory is its own.
+    from PIL import Image, ImageChops
+
+    height = int((megapixels * 1e6 * 2 / 3) ** 0.5)
+    size = (int(height * 1.5 / scale), int(height / scale))
+    noise = Image.effect_noise(size, 32)
+    gradient = Image.linear_gradient('L').resize(size)
+    source = Image.merge('RGB', [ImageChops.add(noise, gradient, 2), noise, gradient])
+    source_path = os.path.join(directory, f"source.{extension}")
+    output_path = os.path.join(directory, f"upscaled_source.{extension}")
+    source.save(source_path, quality=92)
+    source.resize((int(size[0] * scale), int(size[1] * scale)), Image.LANCZOS).save(output_path, quality=92)
+    return source_path, output_path
+
+
+def build_pyramids(cache_directory, paths):
+    cache = PyramidCache(cache_directory, max_bytes=1 << 50)
+    times = []
+    for path in paths:
+        start = time.perf_counter()
+        cache.open(path).close()
+        times.append(time.perf_counter() - start)
+    return times, peak_rss_mb()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparison viewer on a large output: pyramid build time, "
+                                                 "paint time while panning and zooming, and difference metrics.")
+    parser.add_argument('--megapixels', type=float, default=100, help="Size of the upscaled output.")
+    parser.add_argument('--scale', type=float, default=2, help="Upscale factor from source to output.")
+    parser.add_argument('--format', default='jpg', help="File format of the source and output.")
+    parser.add_argument('--window', default='1200x700', help="Size of the comparison view, as WIDTHxHEIGHT.")
+    parser.add_argument('--views', type=int, default=60, help="Pans and zooms to time.")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    from compare_view import ComparisonCanvas, SIDE_BY_SIDE
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_directory = os.path.join(directory, 'pyramids')
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as processes:
+            paths = processes.submit(generate_pair, directory, args.megapixels, args.scale, args.format).result()
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as processes:
+            build_times, build_rss = processes.submit(build_pyramids, cache_directory, paths).result()
+
+        cache = PyramidCache(cache_directory, max_bytes=1 << 50)
+        start = time.perf_counter()
+        before, after = cache.open(paths[0]), cache.open(paths[1])
+        open_seconds = time.perf_counter() - start
+        print(f"output {after.size[0]}x{after.size[1]} ({after.size[0] * after.size[1] / 1e6:.0f} MP), "
+              f"source {before.size[0]}x{before.size[1]}, {len(after.sizes)} pyramid levels")
+        print(f"pyramid build: source {build_times[0]:.2f}s, output {build_times[1]:.2f}s, "
+              f"peak memory {build_rss:.0f} MB; cached open {open_seconds * 1000:.1f}ms")
+
+        canvas = ComparisonCanvas()
+        canvas.resize(*(int(n) for n in args.window.split('x')))
+        canvas.mode = SIDE_BY_SIDE
+        canvas.set_pyramids(before, after)
+        rng = random.Random(1)
+        paint_times, tiles_cut = [], []
+        for _ in range(args.views):
+            # Small pans and zoom steps from the previous view, as dragging and wheeling would give.
+            rect = canvas.after_rect()
+            point = QPointF(rng.uniform(rect.left(), rect.right()), rng.uniform(rect.top(), rect.bottom()))
+            if rng.random() < 0.5:
+                canvas.zoom_to(canvas.zoom * rng.choice((1.25, 1.25, 0.8)), point)
+            else:
+                canvas.center += QPointF(rng.uniform(-200, 200), rng.uniform(-200, 200)) / canvas.zoom
+                canvas.clamp_center()
+                canvas.changed()
+            cached = len(canvas.tiles)
+            start = time.perf_counter()
+            canvas.grab()
+            paint_times.append(time.perf_counter() - start)
+            tiles_cut.append(max(len(canvas.tiles) - cached, 0))
+        print(f"{args.views} pans and zooms: paint p50 {percentile(paint_times, 0.5) * 1000:.1f}ms, "
+              f"p95 {percentile(paint_times, 0.95) * 1000:.1f}ms, max {max(paint_times) * 1000:.1f}ms, "
+              f"{sum(tiles_cut) / args.views:.1f} new tile(s) per view, final zoom {canvas.zoom * 100:.0f}%")
+
+        if quality_metrics_available():
+            from quality_metrics import region_metrics
+
+            for label, zoom in (("fit", None), ("1:1", 1.0)):
+                if zoom is None:
+                    canvas.fit()
+                else:
+                    canvas.zoom_to(zoom)
+                request = canvas.metrics_request()
+                start = time.perf_counter()
+                region = after.levels[request.after_level].crop(request.after_box)
+                reference = before.resampled_region(request.before_level, request.before_box, request.size())
+                metrics = region_metrics(reference, region, request.rows, request.columns)
+                width, height = request.size()
+                print(f"metrics at {label}: {width}x{height} at 1:{2 ** request.after_level} in "
+                      f"{(time.perf_counter() - start) * 1000:.0f}ms, PSNR {metrics.psnr:.2f} dB, "
+                      f"SSIM {metrics.ssim:.4f}")
+        else:
+            print("NumPy is not installed, so difference metrics were not timed.")
+        print(f"viewer peak memory {peak_rss_mb():.0f} MB")
+        canvas.clear()
+        before.close()
+        after.close()
+    app.quit()
+
+
+if __name__ == '__main__':
+    main()
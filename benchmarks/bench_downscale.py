@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import Image
+
+from engine import DOWNSCALE_SPEEDS, parse_scale_factor, prepare_downscale
+
+
+def generate_jpeg(path, size):
+    # A gradient with noise on top compresses like a photo rather than like a flat fill.
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 32)
+    Image.merge('RGB', (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT))).save(path, quality=90)
+
+
+def peak_rss_mb():
+    # VmHWM is reset on exec, unlike ru_maxrss which inherits the parent's high-water mark on Linux.
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(path, scale_factor, speed):
+    # Runs in a fresh process so ru_maxrss reflects this preset alone.
+    start = time.perf_counter()
+    with Image.open(path) as img:
+        scale = parse_scale_factor(scale_factor)
+        new_dimensions = (int(img.width / scale), int(img.height / scale))
+        reducing_gap = prepare_downscale(img, new_dimensions, speed)
+        decoded = time.perf_counter()
+        img.resize(new_dimensions, Image.LANCZOS, reducing_gap=reducing_gap)
+        resized = time.perf_counter()
+    return {
+        'decode_s': decoded - start,
+        'resize_s': resized - decoded,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode time and peak RSS of the downscale speed presets.")
+    parser.add_argument('--width', type=int, default=7680)
+    parser.add_argument('--height', type=int, default=5120)
+    parser.add_argument('--scale', default='4x')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--child', nargs=3, metavar=('PATH', 'SCALE', 'SPEED'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(*args.child)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'source.jpg')
+        generate_jpeg(path, (args.width, args.height))
+        print(f"{args.width}x{args.height} JPEG ({os.path.getsize(path) / 1e6:.1f} MB) downscaled {args.scale}")
+        print(f"{'preset':<10} {'decode':>9} {'resize':>9} {'peak RSS':>10}")
+
+        for speed in DOWNSCALE_SPEEDS:
+            runs = []
+            for _ in range(args.repeat):
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', path, args.scale, speed],
+                                        check=True, capture_output=True, text=True).stdout
+                runs.append(json.loads(output))
+            best = min(runs, key=lambda run: run['decode_s'] + run['resize_s'])
+            print(f"{speed:<10} {best['decode_s']:8.3f}s {best['resize_s']:8.3f}s {best['peak_rss_mb']:8.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
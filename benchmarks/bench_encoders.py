@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import Image, ImageChops, ImageDraw
+
+from engine import ENCODER_PROFILES
+
+FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'webp': 'WEBP', 'tiff': 'TIFF', 'tga': 'TGA'}
+
+
+def synthetic_photo(size):
+    # Built at a quarter of the size and upscaled, since upscaled output is most of what gets encoded.
+    small = (max(1, size[0] // 4), max(1, size[1] // 4))
+    noise = Image.effect_noise(small, 24)
+    gradient = Image.linear_gradient('L').resize(small)
+    radial = Image.radial_gradient('L').resize(small)
+    img = Image.merge('RGB', [ImageChops.add(noise, gradient, 2), ImageChops.add(noise, radial, 2), gradient])
+    return img.resize(size, Image.LANCZOS)
+
+
+def synthetic_graphic(size):
+    # Flat fills and hard edges, like UI captures and pixel art; compresses very differently from photos.
+    img = Image.new('RGB', size, (240, 240, 240))
+    draw = ImageDraw.Draw(img)
+    for i in range(0, size[0], 48):
+        draw.rectangle((i, i // 2, i + 40, i // 2 + 120), fill=(i % 256, 90, 200 - i % 200))
+        draw.line((0, i, size[0], size[1] - i), fill=(20, 20, 20), width=3)
+    return img
+
+
+def encode(img, image_format, options):
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, **options)
+    return buffer.getbuffer().nbytes
+
+
+def measure(img, image_format, options, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = encode(img, image_format, options)
+        best = min(best, time.perf_counter() - start)
+    return best, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode time against bytes written for each encoder profile.")
+    parser.add_argument('--width', type=int, default=2048)
+    parser.add_argument('--height', type=int, default=1536)
+    parser.add_argument('--formats', default=','.join(FORMATS), help="Comma separated, e.g. png,jpg.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', metavar='PATH', help="Also write the results as JSON.")
+    args = parser.parse_args()
+
+    Image.init()
+    size = (args.width, args.height)
+    images = {'photo': synthetic_photo(size), 'graphic': synthetic_graphic(size)}
+    megapixels = args.width * args.height / 1e6
+    results = []
+    for extension in filter(None, args.formats.split(',')):
+        image_format = FORMATS[extension]
+        if image_format not in Image.SAVE:
+            print(f"\n{extension}: no encoder in this Pillow build, skipped")
+            continue
+        for name, img in images.items():
+            print(f"\n{extension} {name} {args.width}x{args.height}")
+            print(f"{'profile':<10}{'time':>10}{'MP/s':>8}{'size':>11}{'vs default':>18}")
+            baseline = None
+            for profile, formats in ENCODER_PROFILES.items():
+                seconds, written = measure(img, image_format, formats.get(image_format, {}), args.repeat)
+                baseline = baseline or (seconds, written)
+                print(f"{profile:<10}{seconds * 1000:>8.1f}ms{megapixels / seconds:>8.1f}{written / 1024:>9.0f}KB"
+                      f"{baseline[0] / seconds:>8.2f}x {written / baseline[1]:>7.0%}")
+                results.append({'format': extension, 'image': name, 'profile': profile,
+                                'seconds': round(seconds, 6), 'bytes': written})
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'width': args.width, 'height': args.height, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import Image
+
+from engine import ProcessingSettings, create_executor, default_worker_count
+
+
+def generate_images(directory, count, size):
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"bench_{i:04d}.png")
+        Image.effect_noise(size, 64).convert('RGB').save(path)
+        paths.append(path)
+    return paths
+
+
+def time_run(paths, settings, max_workers):
+    executor = create_executor(max_workers)
+    try:
+        start = time.perf_counter()
+        failures = sum(1 for _, _, error in executor.run(paths, settings) if error is not None)
+        elapsed = time.perf_counter() - start
+    finally:
+        executor.shutdown()
+    if failures:
+        raise RuntimeError(f"{failures} file(s) failed during the benchmark run")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare serial and process-pool throughput of the Worker engine.")
+    parser.add_argument('--images', type=int, default=32)
+    parser.add_argument('--size', type=int, default=512, help="Edge length of the square synthetic inputs.")
+    parser.add_argument('--mode', choices=['upscale', 'downscale', 'convert'], default='upscale')
+    parser.add_argument('--scale', default='4x')
+    parser.add_argument('--workers', type=int, default=default_worker_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as input_dir, tempfile.TemporaryDirectory() as output_dir:
+        paths = generate_images(input_dir, args.images, (args.size, args.size))
+        settings = ProcessingSettings(args.mode, output_dir, args.scale, 'png', 'png')
+
+        serial = time_run(paths, settings, 1)
+        parallel = time_run(paths, settings, args.workers)
+
+    print(f"{args.images} x {args.size}px, {args.mode} {args.scale}")
+    print(f"serial:              {serial:8.2f}s  {args.images / serial:8.2f} img/s")
+    print(f"parallel ({args.workers:2d} procs): {parallel:8.2f}s  {args.images / parallel:8.2f} img/s")
+    print(f"speedup:             {serial / parallel:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import Image
+
+from engine import ProcessingSettings, target_dimensions
+from pipeline import PipelineExecutor, resize_into
+from shared_buffers import PICKLE_COPIES, SharedBufferPool, SharedImage, copy_into, image_bytes
+
+
+def median_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def handoff(sizes, repeat, settings):
+    # One resize in a worker process, with the image pickled there and back against passed in shared memory.
+    # The shared source is filled once up front, as the decode stage would have decoded straight into it.
+    print(f"{'image':<12}{'resize only':>12}{'pickled':>10}{'shared':>10}{'copied (pickled)':>18}"
+          f"{'copied (shared)':>17}")
+    pool = SharedBufferPool()
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as processes:
+        processes.submit(int).result()
+        for size in sizes:
+            img = Image.effect_noise((size, size), 40).convert('RGB')
+            new_dimensions = target_dimensions(img.size, settings)
+            source = SharedImage(pool.acquire(image_bytes(img.mode, img.size)), img.mode, img.size)
+            copy_into(pool.image(source), img)
+
+            def shared():
+                target = SharedImage(pool.acquire(image_bytes(img.mode, new_dimensions)), img.mode, new_dimensions)
+                processes.submit(resize_into, source, new_dimensions, settings, target).result()
+                pool.release(target.name)
+
+            local = median_time(lambda: img.resize(new_dimensions, Image.LANCZOS), repeat)
+            pickled = median_time(lambda: processes.submit(resize_into, img, new_dimensions, settings, None).result(),
+                                  repeat)
+            shared_seconds = median_time(shared, repeat)
+            pickled_bytes = PICKLE_COPIES * (image_bytes(img.mode, img.size) + image_bytes(img.mode, new_dimensions))
+            print(f"{f'{size}x{size}':<12}{local * 1000:>10.1f}ms{pickled * 1000:>8.1f}ms"
+                  f"{shared_seconds * 1000:>8.1f}ms{pickled_bytes / 1e6:>15.1f} MB"
+                  f"{image_bytes(img.mode, new_dimensions) / 1e6:>14.1f} MB")
+            pool.release(source.name)
+    print(f"{pool.allocated} buffer(s) allocated, {pool.reused} reuses")
+    pool.close()
+
+
+def pipeline_runs(images, size, workers, settings, directory):
+    paths = []
+    for i in range(images):
+        path = os.path.join(directory, f"bench_{i:03d}.jpg")
+        # Sizes vary a little from file to file, as in a real batch, to show buffers being reused anyway.
+        Image.effect_noise((size + i * 8, size - i * 4), 50).convert('RGB').save(path, quality=90)
+        paths.append(path)
+    for stage_processes in ((), ('resize',), ('decode', 'resize', 'encode')):
+        settings.save_directory = os.path.join(directory, '_'.join(stage_processes) or 'threads')
+        os.makedirs(settings.save_directory, exist_ok=True)
+        executor = PipelineExecutor({'resize': workers}, stage_processes=stage_processes)
+        try:
+            # A first pass starts the worker processes, so only the second one is timed.
+            list(executor.run(paths, settings))
+            start = time.perf_counter()
+            results = [result for _, result, _ in executor.run(paths, settings)]
+            seconds = time.perf_counter() - start
+        finally:
+            executor.shutdown()
+        copied = sum(result.timing.copied_bytes for result in results) / len(results)
+        shared = sum(result.timing.shared_bytes for result in results) / len(results)
+        label = ','.join(stage_processes) or 'threads only'
+        print(f"{label:<24}{seconds:>8.2f}s{copied / 1e6:>11.1f} MB{shared / 1e6:>11.1f} MB", end='')
+        print(f"   {executor.buffer_pool.allocated} allocated, {executor.buffer_pool.reused} reused"
+              if stage_processes else '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pixel hand-off between pipeline stages in different processes: "
+                                                 "pickled against shared memory, and the bytes copied per image.")
+    parser.add_argument('--sizes', default='1024,2048,4096', help="Edge lengths of the square hand-off images.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--images', type=int, default=16, help="Images per pipeline run.")
+    parser.add_argument('--size', type=int, default=1536, help="Edge length of the pipeline run's images.")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        settings = ProcessingSettings('downscale', directory, '2x', None, 'png')
+        handoff([int(size) for size in args.sizes.split(',')], args.repeat, settings)
+        print(f"\n{args.images} downscales through the pipeline, per image:")
+        print(f"{'stage processes':<24}{'time':>9}{'copied':>14}{'shared':>14}")
+        pipeline_runs(args.images, args.size, args.workers or os.cpu_count() or 1, settings, directory)
+
+
+if __name__ == '__main__':
+    main()
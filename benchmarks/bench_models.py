@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import numpy as np
+from PIL import Image
+
+from model_registry import resolve_model
+from upscale_models import DEFAULT_TILE_OVERLAP, load_model, model_upscale
+
+
+def espcn_weights(path, channels, scale, seed=0):
+    # ESPCN's layout (5x5x64, 3x3x32, 3x3 to pixel shuffle) with random weights: the throughput of a model
+    # doesn't depend on what it learned, so no trained weights are needed to time one.
+    rng = np.random.default_rng(seed)
+    shapes = [(64, channels, 5, 5), (32, 64, 3, 3), (channels * scale * scale, 32, 3, 3)]
+    arrays = {'scale': np.array(scale), 'activation': np.array('tanh')}
+    for i, shape in enumerate(shapes):
+        arrays[f'weight{i}'] = (rng.standard_normal(shape) / np.sqrt(np.prod(shape[1:]))).astype(np.float32)
+        arrays[f'bias{i}'] = np.zeros(shape[0], np.float32)
+    np.savez(path, **arrays)
+
+
+def best_time(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU throughput of learned upscaling by tile size, tile batch and "
+                                                 "thread count, against a plain LANCZOS resize.")
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--model', default=None,
+                        help="Model to time (name or path). Default: an ESPCN-sized .npz network with random weights.")
+    parser.add_argument('--channels', type=int, default=1, choices=[1, 3],
+                        help="Input channels of the default network (default: 1, luma only).")
+    parser.add_argument('--scale', type=int, default=2, help="Scale of the default network (default: 2).")
+    parser.add_argument('--tile-sizes', default='64,128,256')
+    parser.add_argument('--batches', default='1,4')
+    parser.add_argument('--threads', default=None, help="Thread counts to try (default: 1 and the CPU count).")
+    parser.add_argument('--repeat', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.model:
+            model_path = resolve_model(args.model)
+        else:
+            model_path = os.path.join(directory, f"espcn_x{args.scale}.npz")
+            espcn_weights(model_path, args.channels, args.scale)
+        start = time.perf_counter()
+        model = load_model(model_path)
+        load_seconds = time.perf_counter() - start
+
+        img = Image.effect_noise((args.width, args.height), 40).convert('RGB')
+        target = (args.width * model.scale, args.height * model.scale)
+        megapixels = target[0] * target[1] / 1e6
+        print(f"{os.path.basename(model_path)} ({model.backend}, {model.channels} channel(s), x{model.scale}) "
+              f"on {args.width}x{args.height}, {os.cpu_count()} CPU(s)")
+        print(f"model load {load_seconds * 1000:.0f}ms (once per process)")
+        lanczos = best_time(lambda: img.resize(target, Image.LANCZOS), args.repeat)
+        print(f"{'lanczos':<28}{lanczos:>8.3f}s{megapixels / lanczos:>9.2f} MP/s")
+
+        threads = [int(n) for n in args.threads.split(',')] if args.threads else sorted({1, os.cpu_count() or 1})
+        for tile_size in (int(n) for n in args.tile_sizes.split(',')):
+            for batch_size in (int(n) for n in args.batches.split(',')):
+                for thread_count in threads:
+                    seconds = best_time(lambda: model_upscale(img, target, model_path, tile_size=tile_size,
+                                                              overlap=DEFAULT_TILE_OVERLAP, batch_size=batch_size,
+                                                              threads=thread_count), args.repeat)
+                    label = f"tile {tile_size} batch {batch_size} threads {thread_count}"
+                    print(f"{label:<28}{seconds:>8.3f}s{megapixels / seconds:>9.2f} MP/s")
+
+
+if __name__ == '__main__':
+    main()
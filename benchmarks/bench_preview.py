@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+if not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PIL import Image
+from PyQt5.QtWidgets import QApplication
+
+from preview_grid import PreviewGrid, PreviewModel
+from thumbnails import ThumbnailCache
+
+TILE = 200
+
+
+def generate_outputs(directory, count, size, distinct=20):
+    # A handful of distinct images copied over and over: every file still has to be decoded on its own.
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"output_{i:05d}.png")
+        if i < distinct:
+            Image.effect_noise(size, 40 + i).convert('RGB').save(path)
+        else:
+            shutil.copyfile(paths[i % distinct], path)
+        paths.append(path)
+    return paths
+
+
+def wait_for(app, condition, timeout=120):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.002)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preview grid with thousands of outputs: time to fill the view, "
+                                                 "images decoded and thumbnail memory while scrolling.")
+    parser.add_argument('--outputs', type=int, default=5000)
+    parser.add_argument('--size', type=int, default=1024, help="Edge length of the square outputs.")
+    parser.add_argument('--budget', type=int, default=16, metavar='MB', help="Thumbnail cache budget.")
+    parser.add_argument('--window', default='1000x700', help="Size of the grid, as WIDTHxHEIGHT.")
+    parser.add_argument('--scroll-steps', type=int, default=40)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    with tempfile.TemporaryDirectory() as directory:
+        paths = generate_outputs(directory, args.outputs, (args.size, args.size))
+        cache = ThumbnailCache(args.budget * 1024 * 1024)
+        model = PreviewModel()
+        grid = PreviewGrid(model, cache, TILE, TILE)
+        grid.resize(*(int(n) for n in args.window.split('x')))
+        grid.show()
+
+        start = time.perf_counter()
+        model.add_paths(paths)
+        added = time.perf_counter() - start
+        wait_for(app, lambda: grid.visible_keys() and all(key in cache for key in grid.visible_keys()))
+        filled = time.perf_counter() - start
+        visible = len(grid.visible_keys())
+        print(f"{args.outputs} outputs of {args.size}x{args.size}, {visible} tiles in view")
+        print(f"added in {added * 1000:.0f}ms, view filled in {filled * 1000:.0f}ms, "
+              f"{grid.loader.decoded} image(s) decoded")
+
+        # Scrolled top to bottom a step at a time, pausing only briefly on each step, as a user skimming would.
+        start = time.perf_counter()
+        peak = cache.total_bytes
+        scroll_bar = grid.verticalScrollBar()
+        for step in range(1, args.scroll_steps + 1):
+            scroll_bar.setValue(scroll_bar.maximum() * step // args.scroll_steps)
+            pause = time.perf_counter() + 0.05
+            while time.perf_counter() < pause:
+                app.processEvents()
+                peak = max(peak, cache.total_bytes)
+        wait_for(app, lambda: all(key in cache for key in grid.visible_keys()))
+        print(f"scrolled through in {time.perf_counter() - start:.2f}s: {grid.loader.decoded} image(s) decoded "
+              f"of {args.outputs}, thumbnail cache peaked at {peak / 1024 / 1024:.1f} MB "
+              f"of {args.budget} MB, {len(cache)} thumbnail(s) kept")
+        grid.stop()
+
+
+if __name__ == '__main__':
+    main()
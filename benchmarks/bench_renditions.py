@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import Image, ImageChops
+
+from engine import RENDITIONS_MODE, ProcessingSettings, process_file
+from renditions import parse_rendition, process_renditions
+
+DEFAULT_RENDITIONS = 'mode=downscale,scale=1.5x;mode=downscale,scale=2x;mode=downscale,scale=4x;' \
+                     'mode=downscale,scale=8x;mode=downscale,scale=16x'
+
+
+def synthetic_photo(size):
+    small = (max(1, size[0] // 4), max(1, size[1] // 4))
+    noise = Image.effect_noise(small, 24)
+    gradient = Image.linear_gradient('L').resize(small)
+    radial = Image.radial_gradient('L').resize(small)
+    img = Image.merge('RGB', [ImageChops.add(noise, gradient, 2), ImageChops.add(noise, radial, 2), gradient])
+    return img.resize(size, Image.LANCZOS)
+
+
+def psnr(first, second):
+    histogram = ImageChops.difference(first.convert('RGB'), second.convert('RGB')).histogram()
+    squared = sum(count * (value % 256) ** 2 for value, count in enumerate(histogram))
+    mse = squared / (first.width * first.height * 3)
+    return float('inf') if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One decode for a set of renditions against one run per rendition.")
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--format', default='jpg', help="Source format (default: jpg).")
+    parser.add_argument('--renditions', default=DEFAULT_RENDITIONS, help="Semicolon separated --rendition values.")
+    parser.add_argument('--speed', default='quality', choices=['quality', 'balanced', 'fast'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', metavar='PATH', help="Also write the results as JSON.")
+    args = parser.parse_args()
+
+    renditions = [parse_rendition(text) for text in args.renditions.split(';') if text]
+    with tempfile.TemporaryDirectory() as directory:
+        source_path = os.path.join(directory, f"source.{args.format}")
+        synthetic_photo((args.width, args.height)).save(source_path)
+        job = ProcessingSettings(RENDITIONS_MODE, os.path.join(directory, 'job'), None, None, None, args.speed,
+                                 renditions=[rendition.as_dict() for rendition in renditions])
+        os.makedirs(job.save_directory)
+
+        separate_seconds = combined_seconds = float('inf')
+        separate_steps = combined_steps = None
+        for _ in range(args.repeat):
+            steps = {}
+            separate_paths = []
+            start = time.perf_counter()
+            for rendition in renditions:
+                settings = rendition.settings_for(job)
+                settings.save_directory = os.path.join(directory, rendition.name)
+                os.makedirs(settings.save_directory, exist_ok=True)
+                separate = process_file(source_path, settings)
+                separate_paths.append(separate.output_path)
+                timing = separate.timing
+                for step, seconds in timing.seconds.items():
+                    steps[step] = steps.get(step, 0.0) + seconds
+            elapsed = time.perf_counter() - start
+            if elapsed < separate_seconds:
+                separate_seconds, separate_steps = elapsed, steps
+
+            start = time.perf_counter()
+            result = process_renditions(source_path, job)
+            elapsed = time.perf_counter() - start
+            if elapsed < combined_seconds:
+                combined_seconds, combined_steps = elapsed, dict(result.timing.seconds)
+
+        print(f"{len(renditions)} renditions of a {args.width}x{args.height} {args.format} ({args.speed})")
+        print(f"{'':<10}{'total':>10}{'decode':>10}{'resize':>10}{'encode':>10}")
+        for name, seconds, steps in (('separate', separate_seconds, separate_steps),
+                                     ('combined', combined_seconds, combined_steps)):
+            print(f"{name:<10}{seconds * 1000:>8.0f}ms{steps['decode'] * 1000:>8.0f}ms"
+                  f"{steps['resize'] * 1000:>8.0f}ms{steps['encode'] * 1000:>8.0f}ms")
+        print(f"speedup {separate_seconds / combined_seconds:.2f}x, "
+              f"decode {separate_steps['decode'] / max(combined_steps['decode'], 1e-9):.1f}x less")
+
+        # Derived renditions against the same rendition resampled straight from the source.
+        quality = {}
+        for rendition, output_path, separate_path in zip(renditions, result.output_paths, separate_paths):
+            with Image.open(output_path) as combined, Image.open(separate_path) as separate:
+                quality[rendition.name] = psnr(combined, separate)
+            print(f"{rendition.name:<18} PSNR vs separate run {quality[rendition.name]:.1f} dB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'width': args.width, 'height': args.height, 'format': args.format, 'speed': args.speed,
+                       'renditions': [rendition.as_dict() for rendition in renditions],
+                       'separate_seconds': round(separate_seconds, 6), 'combined_seconds': round(combined_seconds, 6),
+                       'separate_steps': separate_steps, 'combined_steps': combined_steps,
+                       'psnr': quality}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
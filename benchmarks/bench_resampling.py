@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import Image, ImageChops, ImageStat
+
+from engine import RESAMPLING_STRATEGIES, SCALE_FACTORS, parse_scale_factor, resample_image
+
+
+def synthetic_photo(size):
+    # Smooth gradients plus mid-frequency noise, so both aliasing and over-smoothing cost PSNR.
+    noise = Image.effect_noise(size, 32)
+    gradient = Image.linear_gradient('L').resize(size)
+    radial = Image.radial_gradient('L').resize(size)
+    return Image.merge('RGB', [ImageChops.add(noise, gradient, 2), ImageChops.add(noise, radial, 2), gradient])
+
+
+def psnr(reference, image):
+    rms = ImageStat.Stat(ImageChops.difference(reference, image)).rms
+    mse = sum(value ** 2 for value in rms) / len(rms)
+    return float('inf') if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def best_time(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speed and PSNR of each resampling strategy against Lanczos.")
+    parser.add_argument('--width', type=int, default=3200)
+    parser.add_argument('--height', type=int, default=2400)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    source = synthetic_photo((args.width, args.height))
+    for direction in ('downscale', 'upscale'):
+        # Upscales start from a smaller source so every factor finishes in reasonable time.
+        image = source if direction == 'downscale' else source.resize((args.width // 8, args.height // 8))
+        print(f"\n{direction} {image.width}x{image.height}")
+        print(f"{'scale':<7}{'strategy':<10}{'time':>10}{'speedup':>9}{'PSNR':>9}")
+        for scale_factor in SCALE_FACTORS:
+            scale = parse_scale_factor(scale_factor)
+            if direction == 'downscale':
+                size = (int(image.width / scale), int(image.height / scale))
+            else:
+                size = (int(image.width * scale), int(image.height * scale))
+            reference_time, reference = best_time(lambda: image.resize(size, Image.LANCZOS), args.repeat)
+            for strategy in RESAMPLING_STRATEGIES:
+                elapsed, result = best_time(lambda: resample_image(image, size, strategy), args.repeat)
+                quality = psnr(reference, result)
+                print(f"{scale_factor:<7}{strategy:<10}{elapsed * 1000:>8.1f}ms{reference_time / elapsed:>8.1f}x"
+                      + (f"{quality:>7.1f}dB" if quality != float('inf') else f"{'exact':>9}"))
+
+
+if __name__ == '__main__':
+    main()
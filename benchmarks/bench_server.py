@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+from PIL import Image
+
+from job_client import JobClient
+
+CLI = [sys.executable, os.path.join(SRC, 'cli.py')]
+
+
+def generate_images(directory, count, size):
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"bench_{i:04d}.png")
+        Image.effect_noise(size, 64).convert('RGB').save(path)
+        paths.append(path)
+    return paths
+
+
+def wait_for_server(client, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("the job server exited during startup")
+        try:
+            client.jobs()
+            return
+        except ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError("the job server did not start in time")
+
+
+def time_batches(batches, run):
+    latencies = []
+    for i in range(batches):
+        start = time.perf_counter()
+        run(i)
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Small batches run cold, one CLI process each, against the same "
+                                                 "batches submitted to a warm job server.")
+    parser.add_argument('--batches', type=int, default=5)
+    parser.add_argument('--images', type=int, default=4, help="Images per batch.")
+    parser.add_argument('--size', type=int, default=512, help="Edge length of the square synthetic inputs.")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    workers = str(args.workers or os.cpu_count() or 1)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = generate_images(directory, args.images, (args.size, args.size))
+        address = os.path.join(directory, 'server.sock')
+        options = ['--no-cache', '--scale', '2x']
+
+        def cold(i):
+            subprocess.run(CLI + ['downscale', *paths, '--out', os.path.join(directory, f"cold{i}"), *options,
+                                  '--workers', workers, '--no-journal', '--quiet'],
+                           check=True, stdout=subprocess.DEVNULL)
+
+        def warm_cli(i):
+            subprocess.run(CLI + ['downscale', *paths, '--out', os.path.join(directory, f"cli{i}"), *options,
+                                  '--server', address, '--quiet'], check=True, stdout=subprocess.DEVNULL)
+
+        client = JobClient(address)
+
+        def warm_api(i):
+            settings = {'processing_mode': 'downscale', 'save_directory': os.path.join(directory, f"api{i}"),
+                        'scale_factor': '2x', 'convert_from_format': None, 'convert_to_format': None}
+            job = client.submit(settings, paths)
+            finished = [event for event in client.events(job['id']) if event['event'] == 'finished']
+            if not finished or finished[0]['status'] != 'completed':
+                raise RuntimeError(f"job {job['id']} did not complete")
+
+        server = subprocess.Popen(CLI + ['serve', '--listen', address, '--workers', workers, '--no-journal'],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            start = time.perf_counter()
+            wait_for_server(client, server)
+            startup = time.perf_counter() - start
+            print(f"{args.batches} batches of {args.images} x {args.size}px, {workers} worker(s); "
+                  f"server startup {startup:.2f}s, paid once")
+            print(f"{'':<24}{'median':>9}{'max':>9}")
+            for label, run in (('cold CLI run', cold), ('CLI --server', warm_cli), ('API client', warm_api)):
+                latencies = time_batches(args.batches, run)
+                print(f"{label:<24}{latencies[len(latencies) // 2]:>8.3f}s{latencies[-1]:>8.3f}s")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# Imported lazily by the GUI; any of them loaded before the window shows is startup time spent for nothing.
+LAZY_MODULES = ('PIL', 'numpy', 'engine', 'multiprocessing', 'concurrent.futures.process')
+
+
+def run_child(started):
+    # Time from launch to a painted window: interpreter start, imports, building the window, first show.
+    sys.path.insert(0, SRC)
+    os.chdir(tempfile.gettempdir())
+    begin_wall = time.time()
+    begin = time.perf_counter()
+    import PyImgScale
+    from PyQt5.QtWidgets import QApplication
+
+    imported = time.perf_counter()
+    app = QApplication(sys.argv[:1])
+    PyImgScale.apply_style_sheet(app)
+    window = PyImgScale.ImageProcessor()
+    built = time.perf_counter()
+    window.show()
+    app.processEvents()
+    shown = time.perf_counter()
+    shown_wall = time.time()
+    print(json.dumps({
+        'interpreter_seconds': begin_wall - started,
+        'import_seconds': imported - begin,
+        'build_seconds': built - imported,
+        'show_seconds': shown - built,
+        'total_seconds': shown_wall - started,
+        'loaded': [name for name in LAZY_MODULES if name in sys.modules],
+    }))
+
+
+def child_environment(directory):
+    environment = dict(os.environ)
+    if not environment.get('DISPLAY') and not environment.get('WAYLAND_DISPLAY'):
+        environment.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    # A fresh journal and settings, so no resume prompt or saved state changes what starts up.
+    environment['XDG_STATE_HOME'] = os.path.join(directory, 'state')
+    environment['XDG_CONFIG_HOME'] = os.path.join(directory, 'config')
+    return environment
+
+
+def import_profile(environment, top):
+    # The -X importtime view of the same startup, largest cumulative imports first.
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import PyImgScale'], cwd=SRC,
+                               env=environment, capture_output=True, text=True)
+    rows = []
+    for line in completed.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time from launch to a shown GUI window, in fresh processes, "
+                                                 "against a budget.")
+    parser.add_argument('--runs', type=int, default=5, help="fresh processes to time (default: %(default)s)")
+    parser.add_argument('--budget', type=float, default=1.5, metavar='SECONDS',
+                        help="fail when the median time to window exceeds this (default: %(default)s)")
+    parser.add_argument('--imports', type=int, default=15, metavar='N',
+                        help="show the N largest imports by cumulative time (default: %(default)s, 0 to skip)")
+    parser.add_argument('--output', metavar='PATH', help="write the results as JSON")
+    parser.add_argument('--baseline', metavar='PATH', help="compare against results saved earlier with --output")
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help="relative slowdown flagged as a regression (default: %(default)s)")
+    parser.add_argument('--child', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child)
+        return
+
+    runs = []
+    with tempfile.TemporaryDirectory() as directory:
+        environment = child_environment(directory)
+        for _ in range(args.runs):
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', repr(time.time())],
+                                       env=environment, capture_output=True, text=True)
+            if completed.returncode != 0:
+                sys.exit(f"startup failed:\n{completed.stderr}")
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        profile = import_profile(environment, args.imports) if args.imports else []
+
+    phases = ('interpreter_seconds', 'import_seconds', 'build_seconds', 'show_seconds', 'total_seconds')
+    results = {phase: median([run[phase] for run in runs]) for phase in phases}
+    results['loaded'] = runs[-1]['loaded']
+    print(f"{'phase':<16}{'median':>10}")
+    for phase in phases:
+        print(f"{phase.replace('_seconds', ''):<16}{results[phase] * 1000:>8.0f}ms")
+    print(f"loaded before the window showed: {', '.join(results['loaded']) or 'none of ' + ', '.join(LAZY_MODULES)}")
+    if profile:
+        print(f"\n{'cumulative':>10}  import")
+        for microseconds, name in profile:
+            print(f"{microseconds / 1000:>8.1f}ms  {name}")
+
+    report = {'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+              'runs': args.runs, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    failed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        for phase in phases:
+            if baseline.get(phase, 0) > 0 and results[phase] > baseline[phase] * (1 + args.threshold):
+                print(f"Regression: {phase} {baseline[phase] * 1000:.0f}ms -> {results[phase] * 1000:.0f}ms "
+                      f"({results[phase] / baseline[phase] - 1:+.0%})")
+                failed = True
+    if results['total_seconds'] > args.budget:
+        print(f"\nTime to window {results['total_seconds']:.2f}s is over the {args.budget:.2f}s budget.")
+        failed = True
+    else:
+        print(f"\nTime to window {results['total_seconds']:.2f}s is within the {args.budget:.2f}s budget.")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
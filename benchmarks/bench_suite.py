@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import PIL
+from PIL import Image
+
+from engine import SCALE_FACTORS, ProcessingSettings, run_operation
+from image_formats import PREFERRED_FORMATS, writable_formats
+
+SIZES = {
+    'thumb': (160, 120),
+    'small': (800, 600),
+    'medium': (1920, 1080),
+    'large': (4000, 3000),
+    'huge': (10000, 10000),
+}
+MODES = ['L', 'RGB', 'RGBA', 'P']
+OPERATIONS = ['upscale', 'downscale', 'convert']
+DEFAULT_SIZES = ['thumb', 'small', 'medium']
+
+
+def peak_rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def synthetic_image(mode, size):
+    noise = Image.effect_noise(size, 48)
+    gradient = Image.linear_gradient('L').resize(size)
+    bands = {'L': [noise], 'RGB': [noise, gradient, noise.rotate(90)],
+             'RGBA': [noise, gradient, noise.rotate(90), gradient.rotate(180)]}
+    if mode == 'P':
+        return Image.merge('RGB', bands['RGB']).quantize(64)
+    return Image.merge(mode, bands[mode])
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def case_name(case):
+    return f"{case['size']}/{case['mode']}/{case['operation']}/{case['variant']}"
+
+
+def build_cases(sizes, modes, operations, max_output_mp):
+    cases = []
+    for size in sizes:
+        width, height = SIZES[size]
+        for mode in modes:
+            for operation in operations:
+                if operation == 'convert':
+                    variants = [info.name for info in writable_formats() if info.pillow_format in PREFERRED_FORMATS]
+                else:
+                    variants = SCALE_FACTORS
+                for variant in variants:
+                    if operation == 'upscale':
+                        # 100 MP at 8x is 6.4 GP of output; let the cap decide what is worth waiting for.
+                        output_mp = width * height * float(variant.rstrip('x')) ** 2 / 1e6
+                        if output_mp > max_output_mp:
+                            continue
+                    cases.append({'size': size, 'mode': mode, 'operation': operation, 'variant': variant})
+    return cases
+
+
+def run_case(source_path, case, repeat, warmup):
+    # Runs in a fresh interpreter per case, so VmHWM only ever reflects this one operation.
+    imported_rss = peak_rss_mb()
+    with tempfile.TemporaryDirectory() as directory:
+        settings = ProcessingSettings(case['operation'], directory,
+                                      case['variant'] if case['operation'] != 'convert' else SCALE_FACTORS[0],
+                                      None, case['variant'])
+        latencies = []
+        try:
+            for i in range(warmup + repeat):
+                start = time.perf_counter()
+                output_path, _ = run_operation(source_path, settings)
+                elapsed = time.perf_counter() - start
+                if i >= warmup:
+                    latencies.append(elapsed)
+            output_bytes = os.path.getsize(output_path)
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}"}
+
+    with Image.open(source_path) as source:
+        input_mp = source.width * source.height / 1e6
+    p50 = percentile(latencies, 0.5)
+    return {
+        'latencies': [round(latency, 6) for latency in latencies],
+        'p50_seconds': round(p50, 6),
+        'p95_seconds': round(percentile(latencies, 0.95), 6),
+        'megapixels_per_second': round(input_mp / p50, 3) if p50 > 0 else 0.0,
+        'input_megapixels': round(input_mp, 3),
+        'output_bytes': output_bytes,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'imported_rss_mb': round(imported_rss, 1),
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    # A case regresses when its median latency or its peak memory grows by more than the threshold.
+    regressions = []
+    baseline_cases = baseline.get('cases', {})
+    for name, result in results.items():
+        previous = baseline_cases.get(name)
+        if not previous or 'error' in result or 'error' in previous:
+            continue
+        for metric in ('p50_seconds', 'peak_rss_mb'):
+            if previous[metric] > 0 and result[metric] > previous[metric] * (1 + threshold):
+                regressions.append((name, metric, previous[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time upscale, downscale and convert for every scale factor and output format.")
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                        help=f"comma separated subset of {', '.join(SIZES)} (default: %(default)s)")
+    parser.add_argument('--modes', default=','.join(MODES), help="comma separated image modes (default: %(default)s)")
+    parser.add_argument('--operations', default=','.join(OPERATIONS), help="default: %(default)s")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per case (default: %(default)s)")
+    parser.add_argument('--warmup', type=int, default=1, help="untimed runs per case (default: %(default)s)")
+    parser.add_argument('--max-output-mp', type=float, default=400.0,
+                        help="skip upscales producing more megapixels than this (default: %(default)s)")
+    parser.add_argument('--output', metavar='PATH', help="write the results as JSON")
+    parser.add_argument('--baseline', metavar='PATH', help="compare against results saved earlier with --output")
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help="relative slowdown or memory growth flagged as a regression (default: %(default)s)")
+    parser.add_argument('--child', nargs=2, metavar=('SOURCE', 'CASE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_case(args.child[0], json.loads(args.child[1]), args.repeat, args.warmup)))
+        return
+
+    sizes = [size for size in args.sizes.split(',') if size]
+    modes = [mode for mode in args.modes.split(',') if mode]
+    operations = [operation for operation in args.operations.split(',') if operation]
+    for name, chosen, known in (('size', sizes, SIZES), ('mode', modes, MODES), ('operation', operations, OPERATIONS)):
+        unknown = [value for value in chosen if value not in known]
+        if unknown:
+            parser.error(f"unknown {name}: {', '.join(unknown)}")
+
+    cases = build_cases(sizes, modes, operations, args.max_output_mp)
+    results = {}
+    print(f"{'case':<34}{'p50':>10}{'p95':>10}{'MP/s':>9}{'peak RSS':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        sources = {}
+        for case in cases:
+            key = (case['size'], case['mode'])
+            if key not in sources:
+                sources[key] = os.path.join(directory, f"source_{case['size']}_{case['mode']}.png")
+                synthetic_image(case['mode'], SIZES[case['size']]).save(sources[key])
+
+            command = [sys.executable, os.path.abspath(__file__), '--child', sources[key], json.dumps(case),
+                       '--repeat', str(args.repeat), '--warmup', str(args.warmup)]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                result = {'error': completed.stderr.strip().splitlines()[-1] if completed.stderr.strip()
+                          else f"exit status {completed.returncode}"}
+            else:
+                result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results[case_name(case)] = result
+
+            if 'error' in result:
+                print(f"{case_name(case):<34} failed: {result['error']}")
+            else:
+                print(f"{case_name(case):<34}{result['p50_seconds'] * 1000:>8.1f}ms"
+                      f"{result['p95_seconds'] * 1000:>8.1f}ms{result['megapixels_per_second']:>9.1f}"
+                      f"{result['peak_rss_mb']:>8.1f} MB")
+
+    report = {'environment': environment(), 'repeat': args.repeat, 'cases': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('environment', {}).get('pillow') != PIL.__version__:
+            print(f"\nBaseline was recorded with Pillow {baseline.get('environment', {}).get('pillow')}, "
+                  f"now running {PIL.__version__}.")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for name, metric, before, after in regressions:
+                print(f"  {name:<34} {metric:<12} {before:>10} -> {after:<10} ({after / before - 1:+.0%})")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}.")
+
+
+if __name__ == '__main__':
+    main()
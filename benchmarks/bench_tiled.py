@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import Image, ImageChops
+
+from tiling import MAPPED_MODES, iter_resized_strips, strip_height_for_budget, tiled_resize
+
+MODES = ['L', 'LA', 'RGB', 'RGBA', 'P']
+LOSSLESS_FORMATS = ['png', 'tiff']
+
+
+def peak_rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def synthetic_image(mode, size):
+    noise = Image.effect_noise(size, 48)
+    gradient = Image.linear_gradient('L').resize(size)
+    bands = {'L': [noise], 'LA': [noise, gradient], 'RGB': [noise, gradient, noise.rotate(90)],
+             'RGBA': [noise, gradient, noise.rotate(90), gradient.rotate(180)]}
+    if mode == 'P':
+        return Image.merge('RGB', bands['RGB']).quantize(64)
+    return Image.merge(mode, bands[mode])
+
+
+def max_difference(a, b):
+    # Pillow resamples alpha images premultiplied, so compare there; unpremultiplying a
+    # one-level alpha difference would blow it up at nearly transparent pixels.
+    if a.mode in ('LA', 'RGBA'):
+        a, b = a.convert('RGBA').convert('RGBa'), b.convert('RGBA').convert('RGBa')
+    elif a.mode == 'P':
+        a, b = a.convert('RGB'), b.convert('RGB')
+    extrema = ImageChops.difference(a, b).getextrema()
+    return extrema[1] if isinstance(extrema[0], int) else max(high for _, high in extrema)
+
+
+def check_parity(directory, scale, budget):
+    # Strips assembled in memory must match a whole-image resize within one level, and lossless
+    # outputs written by the streaming encoders must decode to exactly those strips.
+    failures = 0
+    for mode in MODES:
+        source = synthetic_image(mode, (173, 121))
+        size = (int(source.width * scale), int(source.height * scale))
+        expected = source.resize(size, Image.LANCZOS)
+
+        assembled = Image.new(mode, size)
+        if mode == 'P':
+            assembled.putpalette(source.getpalette())
+        strip_height = strip_height_for_budget(source, size, Image.LANCZOS, budget)
+        for y0, strip in iter_resized_strips(source, size, Image.LANCZOS, strip_height):
+            assembled.paste(strip, (0, y0))
+        difference = max_difference(expected, assembled)
+        failures += difference > 1
+        print(f"parity  {mode:<4} {scale}x strips of {strip_height} rows: max abs diff {difference}")
+
+        for output_format in LOSSLESS_FORMATS:
+            if output_format != 'png' and mode not in MAPPED_MODES:
+                continue
+            target = os.path.join(directory, f"tiled_{mode}.{output_format}")
+            tiled_resize(source, size, Image.LANCZOS, target, budget)
+            with Image.open(target) as tiled:
+                tiled.load()
+                difference = max_difference(assembled, tiled if tiled.mode == mode else tiled.convert(mode))
+            failures += difference != 0
+            print(f"encoder {mode:<4} {output_format:<4}: max abs diff {difference}")
+    return failures
+
+
+def measure(mode, size, scale, budget, tiled):
+    source = synthetic_image(mode, size)
+    out_size = (int(size[0] * scale), int(size[1] * scale))
+    with tempfile.TemporaryDirectory() as directory:
+        target = os.path.join(directory, 'out.png')
+        start = time.perf_counter()
+        if tiled:
+            tiled_resize(source, out_size, Image.LANCZOS, target, budget)
+        else:
+            source.resize(out_size, Image.LANCZOS).save(target)
+        elapsed = time.perf_counter() - start
+    return {'seconds': elapsed, 'peak_rss_mb': peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity and peak memory of tiled versus whole-image resize.")
+    parser.add_argument('--width', type=int, default=1500)
+    parser.add_argument('--height', type=int, default=1000)
+    parser.add_argument('--mode', default='RGBA', choices=MODES)
+    parser.add_argument('--scale', type=float, default=8.0)
+    parser.add_argument('--budget-mb', type=int, default=64)
+    parser.add_argument('--child', nargs=1, choices=['tiled', 'whole'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    budget = args.budget_mb * 1024 * 1024
+
+    if args.child:
+        print(json.dumps(measure(args.mode, (args.width, args.height), args.scale, budget,
+                                 args.child[0] == 'tiled')))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        failures = sum(check_parity(directory, scale, 256 * 1024) for scale in (1.5, 2.0, 3.7, 4.0, 8.0))
+
+    print(f"\n{args.width}x{args.height} {args.mode} upscaled {args.scale}x, budget {args.budget_mb} MB")
+    for variant in ('whole', 'tiled'):
+        command = [sys.executable, os.path.abspath(__file__), '--child', variant, '--width', str(args.width),
+                   '--height', str(args.height), '--mode', args.mode, '--scale', str(args.scale),
+                   '--budget-mb', str(args.budget_mb)]
+        result = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+        print(f"{variant:<6} {result['seconds']:8.2f}s  peak RSS {result['peak_rss_mb']:8.1f} MB")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import numpy as np
+from PIL import Image
+
+from engine import ProcessingSettings, SerialExecutor
+from vector_resample import BatchResizeExecutor, FILTERS, resize_images
+
+PIL_FILTERS = {'lanczos': Image.LANCZOS, 'bicubic': Image.BICUBIC, 'bilinear': Image.BILINEAR, 'box': Image.BOX}
+MODES = ['L', 'LA', 'RGB', 'RGBA']
+# The batched path rounds its weights as Pillow does and sums exactly, so it should match outright; the
+# tolerance allows for a BLAS that sums in a different order.
+TOLERANCE = {'L': 1, 'RGB': 1, 'LA': 1, 'RGBA': 1}
+
+
+def synthetic_frame(mode, size, seed):
+    bands = [Image.effect_noise(size, 40 + seed % 20), Image.linear_gradient('L').resize(size).rotate(seed * 7),
+             Image.radial_gradient('L').resize(size), Image.effect_noise(size, 80)]
+    return Image.merge('RGBA', bands).convert(mode)
+
+
+def premultiplied(img):
+    return np.asarray(img.convert({'LA': 'La', 'RGBA': 'RGBa'}.get(img.mode, img.mode))).astype(int)
+
+
+def check_parity():
+    failures = 0
+    for mode in MODES:
+        source = synthetic_frame(mode, (173, 121), 1)
+        for filter_name in FILTERS:
+            worst = 0
+            for size in ((346, 242), (259, 181), (86, 60), (21, 15)):
+                expected = source.resize(size, PIL_FILTERS[filter_name])
+                actual = resize_images([source], size, filter_name)[0]
+                worst = max(worst, int(np.abs(premultiplied(expected) - premultiplied(actual)).max()))
+            failures += worst > TOLERANCE[mode]
+            print(f"parity {mode:<5}{filter_name:<9} max abs diff {worst} (tolerance {TOLERANCE[mode]})")
+    return failures
+
+
+def best_time(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched NumPy resampling versus one PIL resize per image.")
+    parser.add_argument('--images', type=int, default=32)
+    parser.add_argument('--width', type=int, default=256)
+    parser.add_argument('--height', type=int, default=256)
+    parser.add_argument('--mode', default='RGBA', choices=MODES)
+    parser.add_argument('--scale', type=float, default=2.0)
+    parser.add_argument('--filter', default='lanczos', choices=list(FILTERS))
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    failures = check_parity()
+
+    frames = [synthetic_frame(args.mode, (args.width, args.height), i) for i in range(args.images)]
+    size = (int(args.width * args.scale), int(args.height * args.scale))
+    megapixels = args.images * args.width * args.height / 1e6
+    print(f"\n{args.images} x {args.width}x{args.height} {args.mode} -> {size[0]}x{size[1]} ({args.filter})")
+
+    pil_seconds = best_time(lambda: [frame.resize(size, PIL_FILTERS[args.filter]) for frame in frames], args.repeat)
+    batches = [frames[i:i + args.batch_size] for i in range(0, len(frames), args.batch_size)]
+    vector_seconds = best_time(lambda: [resize_images(batch, size, args.filter) for batch in batches], args.repeat)
+    print(f"resize only   PIL {megapixels / pil_seconds:8.1f} MP/s   batched {megapixels / vector_seconds:8.1f} MP/s"
+          f"   ({pil_seconds / vector_seconds:.2f}x)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i, frame in enumerate(frames):
+            paths.append(os.path.join(directory, f"frame_{i:04d}.png"))
+            frame.save(paths[-1])
+        out_directory = os.path.join(directory, 'out')
+        os.makedirs(out_directory)
+        settings = ProcessingSettings('upscale' if args.scale > 1 else 'downscale', out_directory,
+                                      f"{args.scale if args.scale > 1 else 1 / args.scale}x", None, None,
+                                      resampling=args.filter)
+        for name, executor in (('serial', SerialExecutor()), ('batched', BatchResizeExecutor(args.batch_size))):
+            seconds = best_time(lambda: list(executor.run(paths, settings)), args.repeat)
+            print(f"end to end    {name:<8}{megapixels / seconds:8.1f} MP/s   {seconds:.2f}s")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import Image
+
+from engine import ProcessingSettings, SerialExecutor, process_file
+
+
+def generate_images(directory, count, size):
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"bench_{i:04d}.png")
+        Image.effect_noise(size, 64).convert('RGB').save(path)
+        paths.append(path)
+    return paths
+
+
+def time_direct(paths, settings):
+    # Every output written on the processing thread, as before the background writer.
+    start = time.perf_counter()
+    for path in paths:
+        process_file(path, settings)
+    return time.perf_counter() - start
+
+
+def time_buffered(paths, settings, threads, buffer_bytes):
+    executor = SerialExecutor(threads, buffer_bytes)
+    start = time.perf_counter()
+    failures = sum(1 for _, _, error in executor.run(paths, settings) if error is not None)
+    elapsed = time.perf_counter() - start
+    if failures:
+        raise RuntimeError(f"{failures} file(s) failed during the benchmark run")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outputs written on the processing thread against the background "
+                                                 "writer, with and without fsync.")
+    parser.add_argument('--images', type=int, default=32)
+    parser.add_argument('--size', type=int, default=1024, help="Edge length of the square synthetic inputs.")
+    parser.add_argument('--mode', choices=['upscale', 'downscale', 'convert'], default='upscale')
+    parser.add_argument('--scale', default='2x')
+    parser.add_argument('--out', default=None,
+                        help="Directory to write to, e.g. on a network share (default: a temporary directory).")
+    parser.add_argument('--write-threads', type=int, default=4)
+    parser.add_argument('--write-buffer', type=int, default=256, metavar='MB')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as input_dir, tempfile.TemporaryDirectory(dir=args.out) as output_dir:
+        paths = generate_images(input_dir, args.images, (args.size, args.size))
+        print(f"{args.images} x {args.size}px, {args.mode} {args.scale} -> {output_dir}")
+        print(f"{'':<10}{'direct':>10}{'buffered':>10}{'speedup':>9}")
+        for fsync in (False, True):
+            settings = ProcessingSettings(args.mode, output_dir, args.scale, 'any', 'png', fsync=fsync)
+            direct = time_direct(paths, settings)
+            buffered = time_buffered(paths, settings, args.write_threads, args.write_buffer * 1024 * 1024)
+            print(f"{'fsync' if fsync else 'no fsync':<10}{direct:>9.2f}s{buffered:>9.2f}s{direct / buffered:>8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,38 @@
 
 #!/usr/bin/python3
 
+import html
 import os
+import sqlite3
 import sys
-from pathlib import Path
+import time
 
-from PIL import Image
-from PyQt5.QtCore import Qt, QSize, QSettings, pyqtSignal, QStandardPaths, QThread
-from PyQt5.QtGui import QPixmap
+from PyQt5.QtCore import QSize, QSettings, pyqtSignal, QStandardPaths, QThread, QTimer
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QVBoxLayout, QWidget,
-                             QHBoxLayout, QFileDialog, QLabel, QListWidget,
-                             QComboBox, QMessageBox, QListWidgetItem, QGridLayout, QDesktopWidget, QProgressBar,
+                             QHBoxLayout, QFileDialog, QLabel, QListView, QAbstractItemView,
+                             QComboBox, QMessageBox, QGridLayout, QDesktopWidget, QProgressBar,
                              QGroupBox,
-                             QRadioButton, QTreeView, QFileSystemModel, QScrollArea,
-                             QTabWidget)
+                             QRadioButton, QTreeView, QFileSystemModel,
+                             QTabWidget, QSpinBox, QCheckBox, QLineEdit)
+
+# Only modules that don't load Pillow or NumPy are imported up front, so the window shows without waiting
+# for the imaging stack; engine, image_formats and upscale_models are imported where they are first needed.
+from file_list_model import FileListModel
+from folder_scanner import parse_extensions, read_image_header, scan_directory
+from instrumentation import FileTiming, RunStats, format_duration
+from job_journal import DONE, JobJournal, default_journal_path
+from model_registry import available_models
+from processing_options import (ANY_FORMAT, DEFAULT_MEMORY_BUDGET, DOWNSCALE_SPEEDS, ENCODER_PROFILES,
+                                EXECUTION_BACKENDS, PROCESS_STAGES, RESAMPLING_STRATEGIES, SCALE_FACTORS,
+                                check_name_template, default_worker_count, upscale_models_available,
+                                vectorized_available)
+from preview_grid import PreviewGrid, PreviewModel
+from thumbnails import DEFAULT_CACHE_BYTES, ThumbnailCache
+from result_cache import DEFAULT_CACHE_BYTES as DEFAULT_RESULT_CACHE_BYTES, ResultCache, default_cache_directory
+from run_control import RunControl, failure_record, summarize_failures
 
 PREVIEW_IMAGE_WIDTH = 200
 PREVIEW_IMAGE_HEIGHT = 200
-MARGIN = 10
 
 class FolderView(QWidget):
     default_root_changed = pyqtSignal(str)
@@ -84,13 +99,31 @@ class FolderView(QWidget):
             self.tree.setRootIndex(new_index)
             self.tree.setCurrentIndex(new_index)
 
-class imageItem(QListWidgetItem):
-    def __init__(self, fileName, fullPath):
-        super().__init__(fileName)
+class imageItem:
+    # Plain slotted records instead of QListWidgetItems; the list models hold tens of thousands of these.
+    __slots__ = ('fullPath', 'fileName', 'fileType', 'fileSize', 'displayName', 'header', 'headerError',
+                 'outputPath')
+
+    def __init__(self, fileName, fullPath, fileSize=None, displayName=None, outputPath=None):
         self.fullPath = fullPath
         self.fileName = fileName
         self.fileType = os.path.splitext(fileName)[1]
-        self.fileSize = os.path.getsize(fullPath)
+        self.fileSize = os.path.getsize(fullPath) if fileSize is None else fileSize
+        self.displayName = displayName or fileName
+        self.header = None
+        self.headerError = None
+        # Set on saved queue items: the output the source was processed into.
+        self.outputPath = outputPath
+
+    def image_header(self):
+        # (width, height, mode, format), read from the file header the first time anyone asks.
+        if self.header is None:
+            self.header = read_image_header(self.fullPath, self.set_header_error) or ()
+        return self.header
+
+    def set_header_error(self, file_path, error):
+        # Shown in the row's tooltip rather than printed to a console the GUI user never sees.
+        self.headerError = str(error)
 
     @staticmethod
     def format_size(size_in_bytes):
@@ -103,10 +136,19 @@ class imageItem(QListWidgetItem):
 class Worker(QThread):
     progress = pyqtSignal(int)
     file_processed = pyqtSignal(imageItem, str)
+    file_failed = pyqtSignal(object)
     finished_processing_all = pyqtSignal(bool)
+    cache_stats = pyqtSignal(int, int)
+    run_stats = pyqtSignal(object)
+    stage_metrics = pyqtSignal(object, str)
+    status_message = pyqtSignal(str)
 
     def __init__(self, imagesToProcess, processing_mode, save_directory, scale_factor, convert_from_format,
-                 convert_to_format):
+                 convert_to_format, max_workers=None, downscale_speed='quality',
+                 memory_budget=DEFAULT_MEMORY_BUDGET, cache_directory=None, cache_max_bytes=None,
+                 backend='process', report_path=None, resampling='quality', journal_path=None, run_id=None,
+                 file_timeout=None, memory_limit=None, encoder_profile='default', name_template=None,
+                 fsync=False, upscale_model=None, stage_processes=None):
         super().__init__()
         self.imagesToProcess = imagesToProcess
         self.processing_mode = processing_mode
@@ -114,63 +156,119 @@ class Worker(QThread):
         self.scale_factor = scale_factor
         self.convert_from_format = convert_from_format
         self.convert_to_format = convert_to_format
+        self.max_workers = max_workers
+        self.downscale_speed = downscale_speed
+        self.memory_budget = memory_budget
+        self.cache_directory = cache_directory
+        self.cache_max_bytes = cache_max_bytes
+        self.backend = backend
+        self.report_path = report_path
+        self.resampling = resampling
+        self.journal_path = journal_path
+        self.run_id = run_id
+        self.file_timeout = file_timeout
+        self.memory_limit = memory_limit
+        self.encoder_profile = encoder_profile
+        self.name_template = name_template
+        self.fsync = fsync
+        self.upscale_model = upscale_model
+        self.stage_processes = stage_processes
+        self.control = RunControl()
 
     def run(self):
-        total_files = len(self.imagesToProcess)
-        self.finished_processing_all.emit(False)
-        for i, image in enumerate(self.imagesToProcess):
-            if isinstance(image, imageItem):
-                file_path = image.fullPath
-                try:
-                    if not os.path.exists(file_path):
-                        print(f"File does not exist: {file_path}")
-                        continue
-
-                    operation_suffix = ''
-                    if self.processing_mode == 'upscale':
-                        operation_suffix = "_upscaled"
-                        self.upscale_image(file_path)
-                    elif self.processing_mode == 'downscale':
-                        operation_suffix = "_downscaled"
-                        self.downscale_image(file_path)
-                    elif self.processing_mode == 'convert':
-                        operation_suffix = f"_converted_to_{self.convert_to_format}"
-                        self.convert_image(file_path)
-
-                    self.file_processed.emit(image, operation_suffix)
-
-                except Exception as e:
-                    print(f"An error occurred while processing {file_path}: {e}")
-
-                progress_percent = int(((i + 1) / total_files) * 100)
-                self.progress.emit(progress_percent)
-        self.finished_processing_all.emit(True)
+        # Signal order is fixed regardless of backend: finished(False), then for every file in queue order
+        # file_processed (on success) followed by progress, then finished(True).
+        from engine import ProcessingSettings, create_executor
 
-    def upscale_image(self, file_path):
-        with Image.open(file_path) as img:
-            scale = float(self.scale_factor.rstrip('x'))
-            new_dimensions = (int(img.width * scale), int(img.height * scale))
-            upscaled_img = img.resize(new_dimensions, Image.LANCZOS)
+        images = [image for image in self.imagesToProcess if isinstance(image, imageItem)]
+        total_files = len(images)
+        self.finished_processing_all.emit(False)
 
-            new_file_name = f"upscaled_{os.path.basename(file_path)}"
-            target_path = os.path.join(self.save_directory, new_file_name)
-            upscaled_img.save(target_path)
+        settings = ProcessingSettings(self.processing_mode, self.save_directory, self.scale_factor,
+                                      self.convert_from_format, self.convert_to_format, self.downscale_speed,
+                                      self.memory_budget, self.cache_directory, self.cache_max_bytes,
+                                      self.resampling, self.file_timeout, self.memory_limit, self.encoder_profile,
+                                      name_template=self.name_template, fsync=self.fsync,
+                                      upscale_model=self.upscale_model)
+        max_workers = min(self.max_workers or default_worker_count(), max(total_files, 1))
+        executor = create_executor(max_workers, self.backend, file_timeout=self.file_timeout,
+                                   stage_processes=self.stage_processes)
+        cache_hits = cache_misses = 0
+        self.cache_stats.emit(cache_hits, cache_misses)
+        stats = RunStats(total_files, sum(image.fileSize for image in images))
+        self.run_stats.emit(stats)
+        journal = self.open_journal(images, settings)
+        names = self.output_names(images, settings, journal)
+        try:
+            for i, result, error in executor.run([image.fullPath for image in images], settings, self.control,
+                                                 names):
+                if error is None:
+                    if result.cache_hit:
+                        cache_hits += 1
+                    else:
+                        cache_misses += 1
+                    stats.record(result.timing)
+                    self.cache_stats.emit(cache_hits, cache_misses)
+                    if journal is not None:
+                        journal.mark_done(self.run_id, images[i].fullPath, result.output_path)
+                    self.file_processed.emit(images[i], result.output_path)
+                else:
+                    failure = failure_record(images[i].fullPath, error)
+                    if failure.kind == 'skipped':
+                        # Not in the Convert From format; done as far as a resume is concerned.
+                        stats.record(FileTiming(images[i].fullPath, images[i].fileSize))
+                        if journal is not None:
+                            journal.mark_done(self.run_id, images[i].fullPath, None)
+                    else:
+                        stats.record(FileTiming(images[i].fullPath, images[i].fileSize), failure)
+                        if journal is not None:
+                            journal.mark_failed(self.run_id, images[i].fullPath, failure)
+                    self.file_failed.emit(failure)
+
+                self.progress.emit(int(stats.fraction_done() * 100))
+                self.run_stats.emit(stats)
+        finally:
+            executor.shutdown()
+            stats.finish()
+            if journal is not None:
+                journal.finish_run(self.run_id, self.control.is_cancelled())
+                journal.close()
+        metadata = {'processing_mode': self.processing_mode, 'backend': self.backend,
+                    'workers': executor.max_workers}
+        if self.backend == 'pipeline':
+            metadata['stages'] = executor.metrics_summary()
+            self.stage_metrics.emit(metadata['stages'], executor.metrics_report())
+        if self.report_path:
+            try:
+                stats.write_report(self.report_path, metadata)
+            except OSError as e:
+                self.status_message.emit(f"Could not write timing report {self.report_path}: {e}")
+        self.run_stats.emit(stats)
+        self.finished_processing_all.emit(True)
 
-    def downscale_image(self, file_path):
-        with Image.open(file_path) as img:
-            scale = float(self.scale_factor.rstrip('x'))
-            new_dimensions = (int(img.width / scale), int(img.height / scale))
-            downscaled_img = img.resize(new_dimensions, Image.LANCZOS)
+    def open_journal(self, images, settings):
+        # Opened on the worker thread because SQLite connections can't be shared across threads.
+        if self.journal_path is None:
+            return None
+        try:
+            journal = JobJournal(self.journal_path)
+            if self.run_id is None:
+                self.run_id = journal.start_run([image.fullPath for image in images], settings.as_dict(), 'gui')
+            else:
+                journal.resume_run(self.run_id)
+            return journal
+        except sqlite3.Error as e:
+            self.status_message.emit(f"Could not open the job journal {self.journal_path}: {e}")
+            return None
 
-            new_file_name = f"downscaled_{os.path.basename(file_path)}"
-            target_path = os.path.join(self.save_directory, new_file_name)
-            downscaled_img.save(target_path)
+    def output_names(self, images, settings, journal):
+        # A resumed run is named against all of its files, so renamed duplicates keep their first names.
+        from engine import resolve_output_names
 
-    def convert_image(self, file_path):
-        with Image.open(file_path) as img:
-            new_file_name = f"{os.path.splitext(os.path.basename(file_path))[0]}.{self.convert_to_format}"
-            target_path = os.path.join(self.save_directory, new_file_name)
-            img.save(target_path)
+        file_paths = [image.fullPath for image in images]
+        if journal is not None and self.run_id is not None:
+            file_paths = [file_path for file_path, _, _ in journal.files(self.run_id)]
+        return resolve_output_names(file_paths, settings)
 
     def get_new_file_path(self, file_path, suffix):
         base, original_ext = os.path.splitext(file_path)
@@ -181,6 +279,97 @@ class Worker(QThread):
         new_file_path = os.path.join(self.save_directory, new_file_name)
         return new_file_path
 
+class FolderScanner(QThread):
+    files_found = pyqtSignal(list)
+    path_skipped = pyqtSignal(str, str)
+    scan_finished = pyqtSignal(int)
+
+    def __init__(self, root, extensions=None, recursive=True):
+        super().__init__()
+        self.root = root
+        self.extensions = extensions
+        self.recursive = recursive
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+        self.wait()
+
+    def run(self):
+        # Items are built here and handed over a chunk at a time, so the GUI thread only ever inserts.
+        found = 0
+        for chunk in scan_directory(self.root, self.extensions, self.recursive, should_stop=lambda: self.stopped,
+                                    on_error=lambda path, error: self.path_skipped.emit(path, str(error))):
+            self.files_found.emit([imageItem(name, path, size) for path, name, size in chunk])
+            found += len(chunk)
+        self.scan_finished.emit(found)
+
+def format_choices(source):
+    # What Pillow can read (source) or write here. Working that out loads every codec, so it waits until
+    # a format list is first opened.
+    from engine import convert_formats, source_formats
+    return source_formats() if source else convert_formats()
+
+class LazyComboBox(QComboBox):
+    # Starts out holding only its first item and fills in the rest the first time it is opened, focused or
+    # scrolled through, for lists that are slow to build.
+    def __init__(self, first_item, load_items, parent=None):
+        super().__init__(parent)
+        self.load_items = load_items
+        self.addItem(first_item)
+
+    def ensure_loaded(self):
+        if self.load_items is None:
+            return
+        load_items, self.load_items = self.load_items, None
+        current = self.currentText()
+        self.blockSignals(True)
+        self.clear()
+        self.addItems(load_items())
+        self.setCurrentIndex(max(self.findText(current), 0))
+        self.blockSignals(False)
+
+    def showPopup(self):
+        self.ensure_loaded()
+        super().showPopup()
+
+    def focusInEvent(self, event):
+        self.ensure_loaded()
+        super().focusInEvent(event)
+
+    def wheelEvent(self, event):
+        self.ensure_loaded()
+        super().wheelEvent(event)
+
+    def keyPressEvent(self, event):
+        self.ensure_loaded()
+        super().keyPressEvent(event)
+
+class LazyTabWidget(QTabWidget):
+    # Each tab is built the first time it is shown, so startup only pays for what is on screen.
+    def __init__(self):
+        super().__init__()
+        self.builders = {}
+        self.currentChanged.connect(self.build_tab)
+
+    def add_lazy_tab(self, builder, title):
+        index = self.addTab(QWidget(), title)
+        self.builders[index] = builder
+        return index
+
+    def build_tab(self, index):
+        builder = self.builders.pop(index, None)
+        if builder is None:
+            return
+        layout = QVBoxLayout(self.widget(index))
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(builder())
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        # Deferred a turn of the event loop, so the window is up before the visible tab is built.
+        QTimer.singleShot(0, lambda: self.build_tab(self.currentIndex()))
+
 class ImageProcessor(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -189,12 +378,24 @@ class ImageProcessor(QMainWindow):
         self.filesystem_panel.default_root_changed.connect(self.ask_set_default_root)
         self.settings = QSettings("User", "PyImgScale")
         self.scale_factor = "1.5"
-        self.convert_from_format = "png"
+        self.convert_from_format = ANY_FORMAT
         self.convert_to_format = "png"
         self.upscale_model = None
         self.worker = None
-        self.preview_layout = QGridLayout()
+        self.failures = []
+        self.folder_scanner = None
+        self.scan_skipped = []
+        # The views are built with their tabs; until then finished files only collect in these models.
+        self.saved_queue_model = FileListModel(self)
+        self.preview_model = PreviewModel(self)
+        self.preview_grid = None
+        self.pyramid_cache = None
+        self.comparison_dialogs = []
+        self.thumbnail_cache = ThumbnailCache(
+            int(self.settings.value("previewCacheMB", DEFAULT_CACHE_BYTES // (1024 * 1024))) * 1024 * 1024)
+        self.journal_path = default_journal_path()
         self.initUI()
+        QTimer.singleShot(0, self.offer_resume)
 
         qtRectangle = self.frameGeometry()
         centerPoint = QDesktopWidget().availableGeometry().center()
@@ -202,13 +403,24 @@ class ImageProcessor(QMainWindow):
         self.move(qtRectangle.topLeft())
 
     def prepare_worker(self, imagesToProcess, processing_mode, save_directory, scale_factor, convert_from_format,
-                       convert_to_format):
+                       convert_to_format, max_workers=None, downscale_speed='quality',
+                       memory_budget=DEFAULT_MEMORY_BUDGET, cache_directory=None, cache_max_bytes=None,
+                       backend='process', report_path=None, resampling='quality', journal_path=None, run_id=None,
+                       file_timeout=None, memory_limit=None, encoder_profile='default', name_template=None,
+                       fsync=False, upscale_model=None, stage_processes=None):
         self.worker = Worker(
             imagesToProcess, processing_mode, save_directory,
-            scale_factor, convert_from_format, convert_to_format
+            scale_factor, convert_from_format, convert_to_format, max_workers, downscale_speed, memory_budget,
+            cache_directory, cache_max_bytes, backend, report_path, resampling, journal_path, run_id,
+            file_timeout, memory_limit, encoder_profile, name_template, fsync, upscale_model, stage_processes
         )
         self.worker.progress.connect(self.update_progress_bar)
+        self.worker.run_stats.connect(self.update_eta_label)
+        self.worker.cache_stats.connect(self.update_cache_stats_label)
+        self.worker.stage_metrics.connect(self.update_stage_metrics_label)
         self.worker.file_processed.connect(self.file_processed)
+        self.worker.file_failed.connect(self.on_file_failed)
+        self.worker.status_message.connect(self.show_status)
         self.worker.finished_processing_all.connect(self.on_all_files_processed)
 
     def initialize_worker_settings(self):
@@ -233,15 +445,16 @@ class ImageProcessor(QMainWindow):
         center_layout = QVBoxLayout()
         center_layout.addWidget(self.create_type_processing_buttons_layout())
         center_layout.addWidget(self.create_eta_label())
+        center_layout.addWidget(self.create_cache_stats_label())
         center_layout.addWidget(self.create_progress_bar_layout())
         center_layout.addWidget(self.create_process_button())
         center_layout.addWidget(self.create_processing_queue_control_panel_layout())
 
         main_layout.addLayout(center_layout)
 
-        tabsRight = QTabWidget()
-        tabsRight.addTab(self.completedFilesPreviewTabUI(), "Completed Files Preview")
-        tabsRight.addTab(self.savedFilesTabUI(), "Saved Files")
+        tabsRight = LazyTabWidget()
+        tabsRight.add_lazy_tab(self.completedFilesPreviewTabUI, "Completed Files Preview")
+        tabsRight.add_lazy_tab(self.savedFilesTabUI, "Saved Files")
         main_layout.addWidget(tabsRight)
 
         container = QWidget()
@@ -251,7 +464,6 @@ class ImageProcessor(QMainWindow):
     def fileSystemTabUI(self):
         optionsTab = QWidget()
         layout = QVBoxLayout()
-        self.filesystem_panel = FolderView()
         layout.addWidget(self.filesystem_panel)
         optionsTab.setLayout(layout)
         return optionsTab
@@ -268,10 +480,14 @@ class ImageProcessor(QMainWindow):
         layout = QVBoxLayout()
         layout.addWidget(self.create_process_settings_layout())
         layout.addWidget(self.create_scale_settings_layout())
+        layout.addWidget(self.create_model_settings_layout())
         layout.addWidget(self.create_save_dir_settings_layout())
-        # layout.addWidget(self.create_model_settings_layout())
-        newWidget = QComboBox(self)
-        layout.addWidget(newWidget)
+        layout.addWidget(self.create_output_files_layout())
+        layout.addWidget(self.create_execution_settings_layout())
+        layout.addWidget(self.create_file_limits_layout())
+        layout.addWidget(self.create_cache_settings_layout())
+        layout.addWidget(self.create_preview_settings_layout())
+        layout.addWidget(self.create_folder_scan_settings_layout())
         optionsTab.setLayout(layout)
         return optionsTab
 
@@ -293,9 +509,17 @@ class ImageProcessor(QMainWindow):
         save_group = QGroupBox("Saved Queue: ", self)
         save_group_layout = QVBoxLayout()
 
-        self.saved_queue_list = QListWidget(self)
+        self.saved_queue_list = self.create_file_list_view(self.saved_queue_model)
+        self.saved_queue_list.doubleClicked.connect(lambda index: self.compare_saved_item(index.row()))
         save_group_layout.addWidget(self.saved_queue_list)
 
+        compare_btn = QPushButton('Compare Before/After', self)
+        compare_btn.setToolTip(
+            "Opens the selected file and its output side by side or with a swipe divider, with PSNR and SSIM of "
+            "the region in view. Double-clicking a file does the same.")
+        compare_btn.clicked.connect(self.compare_selected_saved_item)
+        save_group_layout.addWidget(compare_btn)
+
         save_group.setLayout(save_group_layout)
         return save_group
 
@@ -313,6 +537,16 @@ class ImageProcessor(QMainWindow):
         p_layout.addWidget(QLabel("Open Save Directory After Processing?"))
         p_layout.addWidget(self.open_save_dir_combo)
 
+        self.timing_report_checkbox = QCheckBox("Write Timing Report", self)
+        self.timing_report_checkbox.setChecked(self.settings.value("writeTimingReport", False, type=bool))
+        self.timing_report_checkbox.toggled.connect(self.on_timing_report_toggled)
+
+        self.timing_report_checkbox.setToolTip(
+            "Saves per-file decode/resize/encode timings and pixel counts as JSON in the save directory "
+            "after each run, for capacity planning.")
+
+        p_layout.addWidget(self.timing_report_checkbox)
+
         p_group.setLayout(p_layout)
         return p_group
         
@@ -320,20 +554,40 @@ class ImageProcessor(QMainWindow):
         m_group = QGroupBox("Model Selection: ", self)
         m_layout = QHBoxLayout()
 
+        # The first entry upscales with the Resampling filter; the rest are the installed models.
         self.model_option_combo = QComboBox(self)
-        self.model_option_combo.addItems(["LASCOZ", "ESRGAN", "ESRGAN 2"])
+        self.model_option_combo.addItem("None (Resampling Filter)", None)
+        if upscale_models_available():
+            for info in available_models():
+                self.model_option_combo.addItem(info.name if info.usable else f"{info.name} (needs onnxruntime)",
+                                                info.path)
+                if not info.usable:
+                    self.model_option_combo.model().item(self.model_option_combo.count() - 1).setEnabled(False)
+        saved_model = self.settings.value("upscaleModel", "")
+        for index in range(self.model_option_combo.count()):
+            if self.model_option_combo.itemText(index) == saved_model:
+                self.model_option_combo.setCurrentIndex(index)
+        self.model_option_combo.currentIndexChanged.connect(self.on_upscale_model_changed)
+
+        self.upscale_model = self.model_option_combo.currentData()
+
+        self.model_option_combo.setToolTip(
+            "Upscale with a learned super-resolution model instead of a resampling filter. Models run on the CPU "
+            "and are much slower than filters. Put .onnx (needs onnxruntime) or .npz models in "
+            "~/.local/share/pyimgscale/models to list them here.")
+
         m_layout.addWidget(QLabel("Model Option:"))
         m_layout.addWidget(self.model_option_combo)
 
         m_group.setLayout(m_layout)
-        return m_layout
+        return m_group
 
     def create_scale_settings_layout(self):
         h_group = QGroupBox("Scale Settings: ", self)
         h_layout = QHBoxLayout()
 
         self.scale_factor_combo = QComboBox(self)
-        self.scale_factor_combo.addItems(["1.5x", "2x", "4x", "6x", "8x"])
+        self.scale_factor_combo.addItems(SCALE_FACTORS)
 
         self.scale_factor_combo.setToolTip(
             "Sets the scale factor to process with when upscaling/downscaling images.")
@@ -343,11 +597,207 @@ class ImageProcessor(QMainWindow):
         h_layout.addWidget(QLabel("Scale Factor:"))
         h_layout.addWidget(self.scale_factor_combo)
 
+        self.downscale_speed_combo = QComboBox(self)
+        self.downscale_speed_combo.addItems([speed.capitalize() for speed in DOWNSCALE_SPEEDS])
+
+        self.downscale_speed_combo.setToolTip(
+            "Quality fully decodes images before downscaling. Balanced and Fast decode large JPEGs close to the "
+            "target size first, which is much quicker and uses far less memory at a small cost in sharpness.")
+
+        h_layout.addWidget(QLabel("Downscale Mode:"))
+        h_layout.addWidget(self.downscale_speed_combo)
+
+        self.resampling_combo = QComboBox(self)
+        self.resampling_combo.addItems([strategy.capitalize() for strategy in RESAMPLING_STRATEGIES])
+        self.resampling_combo.setCurrentIndex(int(self.settings.value("resampling", 0)))
+        self.resampling_combo.currentIndexChanged.connect(self.on_resampling_changed)
+
+        self.resampling_combo.setToolTip(
+            "Quality uses Lanczos throughout. Balanced upscales with Bicubic and box-reduces large downscales "
+            "before refining with Lanczos. Fast upscales with Bilinear and box-averages exact 2x/4x/8x "
+            "downscales, which is much quicker and fine for previews. The filter names apply that filter as is.")
+
+        h_layout.addWidget(QLabel("Resampling:"))
+        h_layout.addWidget(self.resampling_combo)
+
         h_group.setLayout(h_layout)
         return h_group
 		
-    def create_upscale_model_option(self):
-        pass
+    def create_execution_settings_layout(self):
+        e_group = QGroupBox("Execution Settings: ", self)
+        e_layout = QHBoxLayout()
+
+        self.worker_count_spin = QSpinBox(self)
+        self.worker_count_spin.setRange(1, default_worker_count())
+        self.worker_count_spin.setValue(int(self.settings.value("workerCount", default_worker_count())))
+        self.worker_count_spin.valueChanged.connect(self.on_worker_count_changed)
+
+        self.worker_count_spin.setToolTip(
+            "Number of processes used to process images in parallel. 1 processes files serially on a single core.")
+
+        e_layout.addWidget(QLabel("Worker Processes:"))
+        e_layout.addWidget(self.worker_count_spin)
+
+        self.backend_combo = QComboBox(self)
+        self.backend_combo.addItems(["Process Pool", "Pipeline", "Batched (NumPy)"])
+        if not vectorized_available():
+            self.backend_combo.model().item(EXECUTION_BACKENDS.index('vectorized')).setEnabled(False)
+        backend_index = int(self.settings.value("executionBackend", 0))
+        self.backend_combo.setCurrentIndex(backend_index if self.backend_combo.model().item(backend_index).isEnabled()
+                                           else 0)
+        self.backend_combo.currentIndexChanged.connect(self.on_backend_changed)
+
+        self.backend_combo.setToolTip(
+            "Process Pool processes whole files in parallel worker processes. Pipeline overlaps disk reads, decoding, "
+            "resizing, encoding and writes in separate stages, which helps on slow or network storage. Batched "
+            "resizes runs of same-size images (sprite sheets, frame sequences) together and needs NumPy.")
+
+        e_layout.addWidget(QLabel("Execution:"))
+        e_layout.addWidget(self.backend_combo)
+
+        self.stage_processes_checkbox = QCheckBox("Stages in Processes", self)
+        self.stage_processes_checkbox.setChecked(self.settings.value("pipelineStageProcesses", False, type=bool))
+        self.stage_processes_checkbox.setEnabled(EXECUTION_BACKENDS[self.backend_combo.currentIndex()] == 'pipeline')
+        self.stage_processes_checkbox.toggled.connect(self.on_stage_processes_toggled)
+
+        self.stage_processes_checkbox.setToolTip(
+            "Pipeline only: decode, resize and encode in worker processes instead of threads. Decoded images "
+            "pass between them in shared memory rather than being copied.")
+
+        e_layout.addWidget(self.stage_processes_checkbox)
+
+        self.memory_budget_spin = QSpinBox(self)
+        self.memory_budget_spin.setRange(64, 65536)
+        self.memory_budget_spin.setSingleStep(64)
+        self.memory_budget_spin.setSuffix(" MB")
+        self.memory_budget_spin.setValue(
+            int(self.settings.value("memoryBudgetMB", DEFAULT_MEMORY_BUDGET // (1024 * 1024))))
+        self.memory_budget_spin.valueChanged.connect(self.on_memory_budget_changed)
+
+        self.memory_budget_spin.setToolTip(
+            "Upscaled images larger than this are resized and written in strips, so each worker process stays "
+            "within roughly this much memory no matter how large the output is.")
+
+        e_layout.addWidget(QLabel("Memory Budget Per Worker:"))
+        e_layout.addWidget(self.memory_budget_spin)
+
+        e_group.setLayout(e_layout)
+        return e_group
+
+    def create_file_limits_layout(self):
+        l_group = QGroupBox("Per-File Limits: ", self)
+        l_layout = QHBoxLayout()
+
+        self.file_timeout_spin = QSpinBox(self)
+        self.file_timeout_spin.setRange(0, 86400)
+        self.file_timeout_spin.setSpecialValueText("None")
+        self.file_timeout_spin.setSuffix(" s")
+        self.file_timeout_spin.setValue(int(self.settings.value("fileTimeoutSeconds", 0)))
+        self.file_timeout_spin.valueChanged.connect(self.on_file_timeout_changed)
+
+        self.file_timeout_spin.setToolTip(
+            "Give up on any single file that takes longer than this, so one pathological image can't stall the "
+            "batch. Process Pool stops the file outright; Pipeline and Batched check between steps.")
+
+        l_layout.addWidget(QLabel("Time Limit:"))
+        l_layout.addWidget(self.file_timeout_spin)
+
+        self.file_memory_limit_spin = QSpinBox(self)
+        self.file_memory_limit_spin.setRange(0, 65536)
+        self.file_memory_limit_spin.setSingleStep(256)
+        self.file_memory_limit_spin.setSpecialValueText("None")
+        self.file_memory_limit_spin.setSuffix(" MB")
+        self.file_memory_limit_spin.setValue(int(self.settings.value("fileMemoryLimitMB", 0)))
+        self.file_memory_limit_spin.valueChanged.connect(self.on_file_memory_limit_changed)
+
+        self.file_memory_limit_spin.setToolTip(
+            "Skip images whose decoded pixels would need more memory than this. The check reads only the file "
+            "header, so decompression bombs are rejected before anything is decoded.")
+
+        l_layout.addWidget(QLabel("Memory Limit:"))
+        l_layout.addWidget(self.file_memory_limit_spin)
+
+        l_group.setLayout(l_layout)
+        return l_group
+
+    def create_cache_settings_layout(self):
+        c_group = QGroupBox("Result Cache Settings: ", self)
+        c_layout = QHBoxLayout()
+
+        self.use_cache_checkbox = QCheckBox("Reuse Previous Results", self)
+        self.use_cache_checkbox.setChecked(self.settings.value("useResultCache", True, type=bool))
+        self.use_cache_checkbox.toggled.connect(self.on_use_cache_toggled)
+
+        self.use_cache_checkbox.setToolTip(
+            "Skips reprocessing files whose contents and processing options match an earlier run, "
+            "copying the cached result instead.")
+
+        self.cache_size_spin = QSpinBox(self)
+        self.cache_size_spin.setRange(64, 1024 * 1024)
+        self.cache_size_spin.setSingleStep(256)
+        self.cache_size_spin.setSuffix(" MB")
+        self.cache_size_spin.setValue(
+            int(self.settings.value("resultCacheMB", DEFAULT_RESULT_CACHE_BYTES // (1024 * 1024))))
+        self.cache_size_spin.valueChanged.connect(self.on_cache_size_changed)
+
+        self.cache_size_spin.setToolTip(
+            f"Maximum disk space used by cached results in {default_cache_directory()}. "
+            "Least recently used results are removed first.")
+
+        clear_cache_btn = QPushButton('Clear Cache', self)
+        clear_cache_btn.clicked.connect(self.clear_result_cache)
+
+        c_layout.addWidget(self.use_cache_checkbox)
+        c_layout.addWidget(QLabel("Cache Size:"))
+        c_layout.addWidget(self.cache_size_spin)
+        c_layout.addWidget(clear_cache_btn)
+
+        c_group.setLayout(c_layout)
+        return c_group
+
+    def create_preview_settings_layout(self):
+        pv_group = QGroupBox("Preview Settings: ", self)
+        pv_layout = QHBoxLayout()
+
+        self.preview_cache_spin = QSpinBox(self)
+        self.preview_cache_spin.setRange(8, 4096)
+        self.preview_cache_spin.setSuffix(" MB")
+        self.preview_cache_spin.setValue(self.thumbnail_cache.max_bytes // (1024 * 1024))
+        self.preview_cache_spin.valueChanged.connect(self.on_preview_cache_size_changed)
+
+        self.preview_cache_spin.setToolTip(
+            "Maximum memory used to keep decoded preview thumbnails. Only thumbnails in view are decoded, and those "
+            "scrolled out of view longest ago are dropped first.")
+
+        pv_layout.addWidget(QLabel("Preview Cache:"))
+        pv_layout.addWidget(self.preview_cache_spin)
+
+        pv_group.setLayout(pv_layout)
+        return pv_group
+
+    def create_folder_scan_settings_layout(self):
+        fs_group = QGroupBox("Folder Scan Settings: ", self)
+        fs_layout = QHBoxLayout()
+
+        self.scan_extensions_edit = QLineEdit(self)
+        self.scan_extensions_edit.setText(self.settings.value("scanExtensions", ""))
+        # Left empty, Add Folder picks up every format the installed Pillow can read.
+        self.scan_extensions_edit.setPlaceholderText("All readable formats")
+        self.scan_extensions_edit.editingFinished.connect(self.on_scan_extensions_changed)
+
+        self.scan_extensions_edit.setToolTip("File extensions picked up by Add Folder, separated by spaces. "
+                                             "Leave empty for every readable format.")
+
+        fs_layout.addWidget(QLabel("Extensions:"))
+        fs_layout.addWidget(self.scan_extensions_edit)
+
+        self.scan_recursive_checkbox = QCheckBox("Include Subfolders", self)
+        self.scan_recursive_checkbox.setChecked(self.settings.value("scanRecursive", True, type=bool))
+        self.scan_recursive_checkbox.toggled.connect(self.on_scan_recursive_toggled)
+        fs_layout.addWidget(self.scan_recursive_checkbox)
+
+        fs_group.setLayout(fs_layout)
+        return fs_group
 
     def create_save_dir_settings_layout(self):
         all_save_dir_group = QGroupBox("Save Settings Options: ", self)
@@ -363,9 +813,52 @@ class ImageProcessor(QMainWindow):
         all_save_dir_layout.addWidget(self.change_save_dir_btn)
         all_save_dir_layout.addWidget(self.save_directory_label)
 
+        self.encoder_profile_combo = QComboBox(self)
+        self.encoder_profile_combo.addItems([profile.capitalize() for profile in ENCODER_PROFILES])
+        self.encoder_profile_combo.setCurrentIndex(int(self.settings.value("encoderProfile", 0)))
+        self.encoder_profile_combo.currentIndexChanged.connect(self.on_encoder_profile_changed)
+
+        self.encoder_profile_combo.setToolTip(
+            "How hard outputs are compressed. Fast writes PNGs several times quicker at a somewhat larger size, "
+            "Smallest spends much longer for the smallest files, Balanced sits in between. JPEG and WebP quality "
+            "is the same in every profile. Default keeps Pillow's own settings.")
+
+        all_save_dir_layout.addWidget(QLabel("Encoder Profile:"))
+        all_save_dir_layout.addWidget(self.encoder_profile_combo)
+
         all_save_dir_group.setLayout(all_save_dir_layout)
         return all_save_dir_group
 
+    def create_output_files_layout(self):
+        of_group = QGroupBox("Output Files: ", self)
+        of_layout = QHBoxLayout()
+
+        self.name_template_edit = QLineEdit(self)
+        self.name_template_edit.setPlaceholderText("{mode}_{name}.{ext}, or {name}.{ext} when converting")
+        self.name_template_edit.setText(self.settings.value("nameTemplate", ""))
+        self.name_template_edit.editingFinished.connect(self.on_name_template_changed)
+
+        self.name_template_edit.setToolTip(
+            "How output files are named, from {name} (the source name), {ext}, {mode}, {scale} and {parent} "
+            "(the source's folder). Leave empty for the usual names. Sources that would write the same file, "
+            "such as two photo.jpg from different folders, get numbered names (photo_2).")
+
+        of_layout.addWidget(QLabel("Name Template:"))
+        of_layout.addWidget(self.name_template_edit)
+
+        self.fsync_checkbox = QCheckBox("Flush to Disk", self)
+        self.fsync_checkbox.setChecked(self.settings.value("fsyncOutputs", False, type=bool))
+        self.fsync_checkbox.toggled.connect(self.on_fsync_toggled)
+
+        self.fsync_checkbox.setToolTip(
+            "Wait for every output to reach the disk before counting it as done. Slower, especially on network "
+            "drives, but nothing reported as finished is lost to a crash or power cut.")
+
+        of_layout.addWidget(self.fsync_checkbox)
+
+        of_group.setLayout(of_layout)
+        return of_group
+
     def create_type_processing_buttons_layout(self):
         control_process_group = QGroupBox("Processing Options: ", self)
         process_selection_layout = QHBoxLayout()
@@ -385,8 +878,7 @@ class ImageProcessor(QMainWindow):
 
         process_selection_layout.addWidget(self.convert_btn)
 
-        self.convert_from_combo = QComboBox(self)
-        self.convert_from_combo.addItems(["png", "jpg/jpeg", "pdf", "tga", "bmp"])
+        self.convert_from_combo = LazyComboBox(ANY_FORMAT, lambda: format_choices(True), self)
 
         self.convert_from_format = self.convert_from_combo.itemText(0).split('/')[0]
         self.convert_from_combo.currentTextChanged.connect(self.on_convert_from_format_changed)
@@ -394,8 +886,7 @@ class ImageProcessor(QMainWindow):
         process_selection_layout.addWidget(QLabel("Convert From:"))
         process_selection_layout.addWidget(self.convert_from_combo)
 
-        self.convert_to_combo = QComboBox(self)
-        self.convert_to_combo.addItems(["png", "jpg/jpeg", "pdf", "tga", "bmp"])
+        self.convert_to_combo = LazyComboBox('png', lambda: format_choices(False), self)
 
         self.convert_to_format = self.convert_to_combo.itemText(0).split('/')[0]
         self.convert_to_combo.currentTextChanged.connect(self.on_convert_to_format_changed)
@@ -413,19 +904,44 @@ class ImageProcessor(QMainWindow):
 
         self.eta_label = QLabel("Estimated Time: Not Calculated", self)
         eta_label_layout.addWidget(self.eta_label)
+        # Filled in after a Pipeline run; the per-stage table is its tooltip.
+        self.stage_metrics_label = QLabel(self)
+        self.stage_metrics_label.hide()
+        eta_label_layout.addWidget(self.stage_metrics_label)
 
         eta_label_group.setLayout(eta_label_layout)
         return eta_label_group
 
+    def create_cache_stats_label(self):
+        cache_label_group = QGroupBox(self)
+        cache_label_layout = QHBoxLayout()
+
+        self.cache_stats_label = QLabel("Result Cache: 0 hits, 0 misses", self)
+        cache_label_layout.addWidget(self.cache_stats_label)
+
+        cache_label_group.setLayout(cache_label_layout)
+        return cache_label_group
+
     def create_process_button(self):
         process_button_group = QGroupBox(self)
         process_button_layout = QHBoxLayout()
 
         process_btn = QPushButton('Process', self)
-        process_btn.clicked.connect(self.process_queue)
+        process_btn.clicked.connect(lambda: self.process_queue())
         process_button_layout.addWidget(process_btn)
 
+        self.pause_btn = QPushButton('Pause', self)
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        process_button_layout.addWidget(self.pause_btn)
+
+        self.cancel_btn = QPushButton('Cancel', self)
+        self.cancel_btn.clicked.connect(self.cancel_processing)
+        process_button_layout.addWidget(self.cancel_btn)
+        self.set_run_controls_enabled(False)
+
         process_btn.setMinimumHeight(50)
+        self.pause_btn.setMinimumHeight(50)
+        self.cancel_btn.setMinimumHeight(50)
         process_button_group.setMinimumHeight(50)
 
         process_button_group.setLayout(process_button_layout)
@@ -438,8 +954,9 @@ class ImageProcessor(QMainWindow):
         self.file_info_panel = QLabel("File Information:", self)
         file_info_control_layout.addWidget(self.file_info_panel)
 
-        self.file_info_list = QListWidget(self)
-        self.file_info_list.setSelectionMode(QListWidget.ExtendedSelection)
+        self.file_info_model = FileListModel(self)
+        self.file_info_model.totals_changed.connect(self.update_file_info_list)
+        self.file_info_list = self.create_file_list_view(self.file_info_model)
         file_info_control_layout.addWidget(self.file_info_list)
 
         self.file_info_list.setMinimumWidth(200)
@@ -452,11 +969,20 @@ class ImageProcessor(QMainWindow):
         add_btn.clicked.connect(self.add_images)
         file_info_control_layout.addWidget(add_btn)
 
+        self.add_folder_btn = QPushButton('Add Folder', self)
+        self.add_folder_btn.clicked.connect(self.add_folder)
+        file_info_control_layout.addWidget(self.add_folder_btn)
+
+        self.add_folder_btn.setToolTip(
+            "Adds every image in a folder (and its subfolders, see Folder Scan Settings in the Options tab). "
+            "Scanning runs in the background; click again to cancel.")
+
         remove_btn = QPushButton('Remove Selected Image', self)
         remove_btn.clicked.connect(self.remove_selected_image)
         file_info_control_layout.addWidget(remove_btn)
 
         add_btn.setMinimumHeight(50)
+        self.add_folder_btn.setMinimumHeight(50)
         remove_btn.setMinimumHeight(50)
 
         file_info_control_group.setLayout(file_info_control_layout)
@@ -469,8 +995,9 @@ class ImageProcessor(QMainWindow):
         self.processing_queue_panel = QLabel("Processing Queue List:", self)
         queue_control_layout.addWidget(self.processing_queue_panel)
 
-        self.processing_queue_list = QListWidget(self)
-        self.processing_queue_list.setSelectionMode(QListWidget.ExtendedSelection)
+        self.processing_queue_model = FileListModel(self)
+        self.processing_queue_model.totals_changed.connect(self.update_processing_queue_label)
+        self.processing_queue_list = self.create_file_list_view(self.processing_queue_model)
         queue_control_layout.addWidget(self.processing_queue_list)
 
         self.processing_queue_list.setMinimumWidth(200)
@@ -493,21 +1020,32 @@ class ImageProcessor(QMainWindow):
         queue_control_group.setLayout(queue_control_layout)
         return queue_control_group
 
+    def create_file_list_view(self, model):
+        view = QListView(self)
+        view.setModel(model)
+        view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        # Lets the view lay out rows arithmetically instead of measuring every item.
+        view.setUniformItemSizes(True)
+        return view
+
+    def selected_rows(self, view):
+        # Walks the selection ranges; selectedRows() deduplicates indexes and goes quadratic on big selections.
+        rows = []
+        for selection_range in view.selectionModel().selection():
+            rows.extend(range(selection_range.top(), selection_range.bottom() + 1))
+        return rows
+
     def create_image_preview_section_layout(self):
         preview_widget_group = QGroupBox("Image Preview Panel: ", self)
 
-        preview_widget = QWidget()
-        self.preview_layout = QGridLayout(preview_widget)
-
-        scroll_area = QScrollArea(self)
-        scroll_area.setWidgetResizable(True)
-        scroll_area.setWidget(preview_widget)
-
-        scroll_area.setMinimumWidth(250)
-        scroll_area.setMinimumHeight(250)
+        self.preview_grid = PreviewGrid(self.preview_model, self.thumbnail_cache, PREVIEW_IMAGE_WIDTH,
+                                        PREVIEW_IMAGE_HEIGHT, self)
+        self.preview_grid.preview_failed.connect(self.on_preview_failed)
+        self.preview_grid.setMinimumWidth(250)
+        self.preview_grid.setMinimumHeight(250)
 
         preview_layout = QVBoxLayout()
-        preview_layout.addWidget(scroll_area)
+        preview_layout.addWidget(self.preview_grid)
 
         preview_widget_group.setLayout(preview_layout)
 
@@ -522,6 +1060,17 @@ class ImageProcessor(QMainWindow):
         progress_bar_layout.addWidget(self.progress_bar)
         self.progress_bar.setHidden(True)
 
+        # Counts this run's failures as they happen; the tooltip lists each file and why it failed.
+        self.failures_label = QLabel(self)
+        progress_bar_layout.addWidget(self.failures_label)
+        self.failures_label.setHidden(True)
+
+        # Notices that aren't about one processed file: skipped duplicates, scan results, journal errors.
+        self.status_label = QLabel(self)
+        self.status_label.setWordWrap(True)
+        progress_bar_layout.addWidget(self.status_label)
+        self.status_label.setHidden(True)
+
         progress_bar_group.setLayout(progress_bar_layout)
 
         return progress_bar_group
@@ -535,6 +1084,73 @@ class ImageProcessor(QMainWindow):
     def on_scale_factor_changed(self, text):
         self.scale_factor = text
 
+    def on_encoder_profile_changed(self, index):
+        self.settings.setValue("encoderProfile", index)
+
+    def on_name_template_changed(self):
+        template = self.name_template_edit.text().strip()
+        if template:
+            try:
+                check_name_template(template, 'upscale')
+            except ValueError as e:
+                QMessageBox.warning(self, "Name Template", str(e))
+                self.name_template_edit.setText(self.settings.value("nameTemplate", ""))
+                return
+        self.settings.setValue("nameTemplate", template)
+
+    def on_fsync_toggled(self, checked):
+        self.settings.setValue("fsyncOutputs", checked)
+
+    def on_upscale_model_changed(self, index):
+        self.upscale_model = self.model_option_combo.itemData(index)
+        self.settings.setValue("upscaleModel", self.model_option_combo.itemText(index) if index else "")
+
+    def on_resampling_changed(self, index):
+        self.settings.setValue("resampling", index)
+
+    def on_worker_count_changed(self, value):
+        self.settings.setValue("workerCount", value)
+
+    def on_timing_report_toggled(self, checked):
+        self.settings.setValue("writeTimingReport", checked)
+
+    def on_file_timeout_changed(self, value):
+        self.settings.setValue("fileTimeoutSeconds", value)
+
+    def on_file_memory_limit_changed(self, value):
+        self.settings.setValue("fileMemoryLimitMB", value)
+
+    def on_backend_changed(self, index):
+        self.settings.setValue("executionBackend", index)
+        self.stage_processes_checkbox.setEnabled(EXECUTION_BACKENDS[index] == 'pipeline')
+
+    def on_stage_processes_toggled(self, checked):
+        self.settings.setValue("pipelineStageProcesses", checked)
+
+    def on_use_cache_toggled(self, checked):
+        self.settings.setValue("useResultCache", checked)
+
+    def on_cache_size_changed(self, value):
+        self.settings.setValue("resultCacheMB", value)
+
+    def clear_result_cache(self):
+        if QMessageBox.question(self, "Clear Cache", "Remove all cached results?",
+                                QMessageBox.Yes | QMessageBox.No) == QMessageBox.Yes:
+            ResultCache(default_cache_directory()).clear()
+
+    def on_memory_budget_changed(self, value):
+        self.settings.setValue("memoryBudgetMB", value)
+
+    def on_scan_extensions_changed(self):
+        self.settings.setValue("scanExtensions", self.scan_extensions_edit.text())
+
+    def on_scan_recursive_toggled(self, checked):
+        self.settings.setValue("scanRecursive", checked)
+
+    def on_preview_cache_size_changed(self, value):
+        self.settings.setValue("previewCacheMB", value)
+        self.thumbnail_cache.set_max_bytes(value * 1024 * 1024)
+
     def on_convert_from_format_changed(self, text):
         self.convert_from_format = text.split('/')[0]
 
@@ -559,164 +1175,314 @@ class ImageProcessor(QMainWindow):
         self.save_directory_label.setText(f"Save to: {directory or 'Not Set'}")
 
     def add_images(self):
-        files, _ = QFileDialog.getOpenFileNames(self, "Select Images", "", "Images (*.png *.jpg *.jpeg *.bmp *.gif)")
-        existing_paths = {self.file_info_list.item(i).fullPath for i in range(self.file_info_list.count())}
-
-        for file_path in files:
-            if file_path not in existing_paths:
-                fileName = os.path.basename(file_path)
-                fileType = os.path.splitext(fileName)[1]
-                fileSize = os.path.getsize(file_path)
-
-                newItem = imageItem(fileName, file_path)
-                newItem.fileType = fileType
-                newItem.fileSize = fileSize
-
-                self.file_info_list.addItem(newItem)
-                existing_paths.add(file_path)
-            else:
-                print(f"Duplicate file skipped: {file_path}")
-        self.update_file_info_list()
+        from image_formats import readable_extensions
+
+        patterns = ' '.join(f"*{extension}" for extension in readable_extensions())
+        files, _ = QFileDialog.getOpenFileNames(self, "Select Images", "", f"Images ({patterns});;All Files (*)")
+        new_items = [imageItem(os.path.basename(file_path), file_path)
+                     for file_path in files if file_path not in self.file_info_model]
+        self.file_info_model.add_items(new_items)
+        if len(new_items) < len(files):
+            self.show_status(f"Skipped {len(files) - len(new_items)} duplicate file(s).")
+
+    def add_folder(self):
+        if self.folder_scanner is not None and self.folder_scanner.isRunning():
+            self.folder_scanner.stop()
+            return
+        directory = QFileDialog.getExistingDirectory(self, "Select Folder")
+        if directory:
+            self.scan_folder(directory)
+
+    def scan_folder(self, directory):
+        extensions = parse_extensions(self.scan_extensions_edit.text()) or None
+        self.folder_scanner = FolderScanner(directory, extensions, self.scan_recursive_checkbox.isChecked())
+        self.folder_scanner.files_found.connect(self.on_folder_files_found)
+        self.folder_scanner.path_skipped.connect(self.on_folder_path_skipped)
+        self.folder_scanner.scan_finished.connect(self.on_folder_scan_finished)
+        self.add_folder_btn.setText("Cancel Folder Scan")
+        self.scan_skipped = []
+        self.folder_scanner.start()
+
+    def on_folder_files_found(self, items):
+        self.file_info_model.add_items(items)
+        self.file_info_panel.setText(f"File Information: scanning, {len(self.file_info_model)} files...")
+
+    def on_folder_path_skipped(self, path, error):
+        self.scan_skipped.append(f"{path}: {error}")
+
+    def on_folder_scan_finished(self, found):
+        self.add_folder_btn.setText("Add Folder")
+        self.file_info_panel.setText("File Information:")
+        message = f"Folder scan found {found} image(s)."
+        if self.scan_skipped:
+            message += f" Skipped {len(self.scan_skipped)} unreadable path(s)."
+        self.show_status(message, '\n'.join(self.scan_skipped))
 
     def remove_selected_image(self):
-        for item in self.file_info_list.selectedItems():
-            self.file_info_list.takeItem(self.file_info_list.row(item))
+        self.file_info_model.remove_rows(self.selected_rows(self.file_info_list))
 
     def update_file_info_list(self):
-        total_size = 0
-        for i in range(self.file_info_list.count()):
-            image_item = self.file_info_list.item(i)
-            if isinstance(image_item, imageItem):
-                total_size += image_item.fileSize
-            else:
-                print(f"The item at index {i} is not an instance of imageItem.")
-
-        total_size_mb = total_size / (1024 * 1024)
+        total_size_mb = self.file_info_model.total_bytes / (1024 * 1024)
         self.total_info_label.setText(
-            f"Total Files: {self.file_info_list.count()}, Total Size: {total_size_mb:.2f} MB"
+            f"Total Files: {len(self.file_info_model)}, Total Size: {total_size_mb:.2f} MB"
         )
 
     def add_to_processing_queue(self):
-        selected_items = self.file_info_list.selectedItems()
+        selected_items = self.file_info_model.items_for_rows(self.selected_rows(self.file_info_list))
         if not selected_items:
             QMessageBox.warning(self, "No Selection", "Please select at least one file to add to the queue.")
             return
 
-        existing_paths = [self.processing_queue_list.item(i).fullPath for i in range(self.processing_queue_list.count())
-                          if isinstance(self.processing_queue_list.item(i), imageItem)]
-
-        for item in selected_items:
-            if isinstance(item, imageItem) and item.fullPath not in existing_paths:
-                fileName = item.fileName
-                fileType = item.fileType
-                fileSize = item.fileSize
-
-                newItem = imageItem(item.fileName, item.fullPath)
-                newItem.fileType = fileType
-                newItem.fileSize = fileSize
-                self.processing_queue_list.addItem(newItem)
-                existing_paths.append(item.fullPath)
-            elif isinstance(item, imageItem):
-                QMessageBox.warning(self, "Duplicate", f"The file {item.fileName} is already in the queue.")
-
-        self.update_processing_queue_label()
+        _, duplicates = self.processing_queue_model.add_items(
+            [imageItem(item.fileName, item.fullPath, item.fileSize) for item in selected_items])
+        if len(duplicates) == 1:
+            QMessageBox.warning(self, "Duplicate", f"The file {duplicates[0].fileName} is already in the queue.")
+        elif duplicates:
+            QMessageBox.warning(self, "Duplicate", f"{len(duplicates)} of the selected files are already in the queue.")
 
     def remove_from_queue(self):
-        selected_items = self.processing_queue_list.selectedItems()
-        if not selected_items:
+        selected_rows = self.selected_rows(self.processing_queue_list)
+        if not selected_rows:
             QMessageBox.warning(self, "No Selection", "Please select at least one file to remove from the queue.")
             return
 
-        for item in selected_items:
-            self.processing_queue_list.takeItem(self.processing_queue_list.row(item))
-
-        self.update_processing_queue_label()
+        self.processing_queue_model.remove_rows(selected_rows)
 
     def remove_from_queue_by_item(self, file_path):
-        for i in range(self.processing_queue_list.count()):
-            item = self.processing_queue_list.item(i)
-            if item.fullPath == file_path:  # Compare file paths
-                self.processing_queue_list.takeItem(i)
-                return
+        self.processing_queue_model.remove_paths([file_path])
 
     def update_processing_queue_label(self):
-        total_size = 0
-        for i in range(self.processing_queue_list.count()):
-            image_item = self.processing_queue_list.item(i)
-            if isinstance(image_item, imageItem):
-                total_size += image_item.fileSize
-            else:
-                print(f"The item at index {i} is not an instance of imageItem.")
-
-        total_size_mb = total_size / (1024 * 1024)
+        total_size_mb = self.processing_queue_model.total_bytes / (1024 * 1024)
         self.total_processing_queue_label.setText(
-            f"Total Files: {self.processing_queue_list.count()}, Total Size: {total_size_mb:.2f} MB"
+            f"Total Files: {len(self.processing_queue_model)}, Total Size: {total_size_mb:.2f} MB"
         )
 
     def get_saved_queue_items(self):
-        return [self.saved_queue_list.item(i) for i in range(self.saved_queue_list.count())
-                if isinstance(self.saved_queue_list.item(i), imageItem)]
-
-    def add_to_saved_queue(self, image_item, operation_suffix):
-        existing_items = self.get_saved_queue_items()
-        if not any(item.fullPath == image_item.fullPath for item in existing_items):
-            saved_image_item_name = self.generate_display_name(image_item, operation_suffix)
-            saved_image_item = imageItem(saved_image_item_name, image_item.fullPath)
-            saved_image_item.fileType = image_item.fileType
-            saved_image_item.fileSize = image_item.fileSize
-            self.saved_queue_list.addItem(saved_image_item)
-
-    def generate_display_name(self, image_item, operation_suffix):
-        base_filename = image_item.fileName
-        name, ext = os.path.splitext(base_filename)
-        return f"{name}{operation_suffix}{ext}"
-
-    def process_queue(self):
-        imagesToProcess = [self.processing_queue_list.item(i) for i in range(self.processing_queue_list.count())]
+        return self.saved_queue_model.all_items()
+
+    def add_to_saved_queue(self, image_item, output_path):
+        if image_item.fullPath in self.saved_queue_model:
+            return None
+        saved_image_item = imageItem(image_item.fileName, image_item.fullPath, image_item.fileSize,
+                                     os.path.basename(output_path), output_path)
+        self.saved_queue_model.add_items([saved_image_item])
+        return saved_image_item
+
+    def compare_selected_saved_item(self):
+        rows = self.selected_rows(self.saved_queue_list)
+        if not rows:
+            QMessageBox.information(self, "Compare", "Select a saved file to compare with its output.")
+            return
+        self.compare_saved_item(min(rows))
+
+    def compare_saved_item(self, row):
+        from compare_view import ComparisonDialog
+        from image_pyramid import PyramidCache
+
+        item = self.saved_queue_model.item(row)
+        for file_path in (item.fullPath, item.outputPath):
+            if not file_path or not os.path.isfile(file_path):
+                QMessageBox.warning(self, "Compare", f"{file_path or item.displayName} no longer exists.")
+                return
+        if self.pyramid_cache is None:
+            self.pyramid_cache = PyramidCache()
+        dialog = ComparisonDialog(item.fullPath, item.outputPath, self.pyramid_cache, self.settings, self)
+        dialog.finished.connect(lambda: self.comparison_dialogs.remove(dialog))
+        self.comparison_dialogs.append(dialog)
+        dialog.show()
+
+    def process_queue(self, run_id=None):
+        imagesToProcess = self.processing_queue_model.all_items()
         if self.worker is None or not self.worker.isRunning():
             self.prepare_worker(
                 imagesToProcess, self.processing_mode, self.save_directory,
-                self.scale_factor, self.convert_from_format, self.convert_to_format
+                self.scale_factor, self.convert_from_format, self.convert_to_format,
+                self.worker_count_spin.value(), self.downscale_speed_combo.currentText().lower(),
+                self.memory_budget_spin.value() * 1024 * 1024,
+                default_cache_directory() if self.use_cache_checkbox.isChecked() else None,
+                self.cache_size_spin.value() * 1024 * 1024,
+                EXECUTION_BACKENDS[self.backend_combo.currentIndex()], self.timing_report_path(),
+                RESAMPLING_STRATEGIES[self.resampling_combo.currentIndex()], self.journal_path, run_id,
+                self.file_timeout_spin.value() or None,
+                self.file_memory_limit_spin.value() * 1024 * 1024 or None,
+                list(ENCODER_PROFILES)[self.encoder_profile_combo.currentIndex()],
+                self.settings.value("nameTemplate", "") or None, self.fsync_checkbox.isChecked(),
+                self.upscale_model, PROCESS_STAGES if self.stage_processes_checkbox.isChecked() else None
             )
+            self.failures = []
+            self.failures_label.hide()
+            self.status_label.hide()
+            self.stage_metrics_label.hide()
+            self.set_run_controls_enabled(True)
             self.progress_bar.show()
             self.worker.start()
         else:
-            print("A processing task is already running.")
-
-    def file_processed(self, image_item, operation_suffix):
-        for i in range(self.processing_queue_list.count()):
-            processing_item = self.processing_queue_list.item(i)
-            if processing_item == image_item:
-                self.processing_queue_list.takeItem(i)
-                break
-
-        self.add_to_saved_queue(image_item, operation_suffix)
-        self.update_processing_queue_label()
-        self.update_image_preview()
-
-    def update_image_preview(self):
-        while self.preview_layout.count():
-            item = self.preview_layout.takeAt(0)
-            widget = item.widget()
-            if widget is not None:
-                widget.deleteLater()
-
-        for i in range(self.saved_queue_list.count()):
-            saved_item = self.saved_queue_list.item(i)
-            pixmap = QPixmap(saved_item.fullPath)
-            scaled_pixmap = pixmap.scaled(PREVIEW_IMAGE_WIDTH, PREVIEW_IMAGE_HEIGHT, Qt.KeepAspectRatio,
-                                          Qt.SmoothTransformation)
-            label = QLabel()
-            label.setPixmap(scaled_pixmap)
-            label.setAlignment(Qt.AlignCenter)
-            label.setMargin(MARGIN)
-            self.preview_layout.addWidget(label)
+            self.show_status("A processing task is already running.")
+
+    def offer_resume(self):
+        if self.worker is not None and self.worker.isRunning():
+            return
+        try:
+            journal = JobJournal(self.journal_path)
+        except sqlite3.Error as e:
+            self.show_status(f"Could not open the job journal {self.journal_path}: {e}")
+            return
+        try:
+            run = journal.latest_unfinished_run('gui')
+            if run is None:
+                return
+            files = journal.files(run.id)
+            remaining = [source_path for source_path, status, _ in files
+                         if status != DONE and os.path.isfile(source_path)]
+            if not remaining:
+                journal.abandon_run(run.id)
+                return
+            answer = QMessageBox.question(
+                self, "Resume Processing",
+                f"A previous {run.settings['processing_mode']} run did not finish. "
+                f"Resume the {len(remaining)} remaining file(s)?",
+                QMessageBox.Yes | QMessageBox.No)
+            if answer != QMessageBox.Yes:
+                journal.abandon_run(run.id)
+                return
+            # Sources skipped by the Convert From filter are done but produced nothing to show.
+            done = [(source_path, output_path) for source_path, status, output_path in files
+                    if status == DONE and output_path]
+        finally:
+            journal.close()
+        self.restore_run(run, remaining, done)
+        self.process_queue(run.id)
+
+    def restore_run(self, run, remaining, done):
+        settings = run.settings
+        {'upscale': self.upscale_btn, 'downscale': self.downscale_btn,
+         'convert': self.convert_btn}[settings['processing_mode']].setChecked(True)
+        self.processing_logic()
+        self.save_directory = settings['save_directory']
+        self.save_directory_label.setText(f"Save to: {self.save_directory}")
+        if settings['scale_factor']:
+            self.scale_factor_combo.setCurrentText(settings['scale_factor'])
+        for combo, value in ((self.convert_from_combo, settings['convert_from_format']),
+                             (self.convert_to_combo, settings['convert_to_format'])):
+            combo.ensure_loaded()
+            for index in range(combo.count()):
+                if combo.itemText(index).split('/')[0] == value:
+                    combo.setCurrentIndex(index)
+        self.downscale_speed_combo.setCurrentText(settings['downscale_speed'].capitalize())
+        self.resampling_combo.setCurrentIndex(RESAMPLING_STRATEGIES.index(settings['resampling']))
+        self.encoder_profile_combo.setCurrentIndex(
+            list(ENCODER_PROFILES).index(settings.get('encoder_profile', 'default')))
+        self.name_template_edit.setText(settings.get('name_template') or "")
+        self.on_name_template_changed()
+        self.fsync_checkbox.setChecked(settings.get('fsync', False))
+        self.model_option_combo.setCurrentIndex(max(self.model_option_combo.findData(settings.get('upscale_model')), 0))
+
+        self.processing_queue_model.clear()
+        self.processing_queue_model.add_items(
+            [imageItem(os.path.basename(file_path), file_path) for file_path in remaining])
+        # Finished sources may since have moved, so their sizes are not looked up again.
+        saved_items = [imageItem(os.path.basename(file_path), file_path, 0, os.path.basename(output_path), output_path)
+                       for file_path, output_path in done]
+        self.saved_queue_model.add_items(saved_items)
+
+    def set_run_controls_enabled(self, enabled):
+        self.pause_btn.setText('Pause')
+        self.pause_btn.setEnabled(enabled)
+        self.cancel_btn.setEnabled(enabled)
+
+    def toggle_pause(self):
+        if self.worker is None or not self.worker.isRunning():
+            return
+        if self.worker.control.is_paused():
+            self.worker.control.resume()
+            self.pause_btn.setText('Pause')
+        else:
+            # Files already being processed finish; no new ones start until resumed.
+            self.worker.control.pause()
+            self.pause_btn.setText('Resume')
+            self.eta_label.setText("Paused")
+
+    def cancel_processing(self):
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.control.cancel()
+            self.set_run_controls_enabled(False)
+
+    def on_file_failed(self, failure):
+        self.failures.append(failure)
+        self.failures_label.setText(f"Not processed: {len(self.failures)} file(s) "
+                                    f"({summarize_failures(self.failures)})")
+        self.failures_label.setToolTip(self.failure_details())
+        self.failures_label.show()
+
+    def show_status(self, message, details=""):
+        self.status_label.setText(message)
+        self.status_label.setToolTip(details)
+        self.status_label.show()
+
+    def failure_details(self):
+        return '\n'.join(f"{failure.source_path}: {failure}" for failure in self.failures)
+
+    def timing_report_path(self):
+        if not self.timing_report_checkbox.isChecked() or not self.save_directory:
+            return None
+        return os.path.join(self.save_directory, f"pyimgscale_timing_{time.strftime('%Y%m%d_%H%M%S')}.json")
+
+    def file_processed(self, image_item, output_path):
+        self.remove_from_queue_by_item(image_item.fullPath)
+
+        saved_item = self.add_to_saved_queue(image_item, output_path)
+        if saved_item is not None:
+            self.add_image_preview(saved_item.outputPath)
+
+    def add_image_preview(self, file_path):
+        self.preview_model.add_paths([file_path])
+        if file_path in self.preview_model.errors:
+            self.on_preview_failed(file_path, self.preview_model.errors[file_path])
+
+    def on_preview_failed(self, file_path, error):
+        self.show_status(f"Could not load preview for {os.path.basename(file_path)}: {error}", file_path)
+
+    def closeEvent(self, event):
+        if self.folder_scanner is not None and self.folder_scanner.isRunning():
+            self.folder_scanner.stop()
+        if self.preview_grid is not None:
+            self.preview_grid.stop()
+        for dialog in list(self.comparison_dialogs):
+            dialog.close()
+        super().closeEvent(event)
 
     def on_all_files_processed(self, all_processed):
         if all_processed:
             self.progress_bar.hide()
+            self.set_run_controls_enabled(False)
             self.show_processing_complete_dialog()
 
+    def update_eta_label(self, stats):
+        if self.worker is not None and self.worker.control.is_paused() and stats.end_time is None:
+            return
+        if stats.end_time is not None:
+            self.eta_label.setText(f"Completed in {format_duration(stats.elapsed())} "
+                                   f"({stats.megapixels_per_second():.1f} MP/s)")
+            return
+        eta = stats.eta_seconds()
+        if eta is None:
+            self.eta_label.setText("Estimated Time: Calculating...")
+        else:
+            self.eta_label.setText(f"Estimated Time: {format_duration(eta)} remaining "
+                                   f"({stats.megapixels_per_second():.1f} MP/s)")
+
+    def update_stage_metrics_label(self, summaries, report):
+        if not summaries:
+            return
+        bottleneck = max(summaries, key=lambda summary: summary['utilization'])
+        self.stage_metrics_label.setText(f"Bottleneck: {bottleneck['stage']} stage "
+                                         f"({bottleneck['utilization']:.0%} busy)")
+        self.stage_metrics_label.setToolTip(f"<pre>{html.escape(report)}</pre>")
+        self.stage_metrics_label.show()
+
+    def update_cache_stats_label(self, hits, misses):
+        self.cache_stats_label.setText(f"Result Cache: {hits} hits, {misses} misses")
+
     def update_progress_bar(self, value):
         if hasattr(self, 'progress_bar') and self.progress_bar is not None:
             self.progress_bar.setValue(value)
@@ -724,16 +1490,30 @@ class ImageProcessor(QMainWindow):
     def show_processing_complete_dialog(self):
         msg_box = QMessageBox()
         msg_box.setIcon(QMessageBox.Information)
-        msg_box.setText("Processing complete.")
+        cancelled = self.worker is not None and self.worker.control.is_cancelled()
+        msg_box.setText("Processing cancelled." if cancelled else "Processing complete.")
+        if self.failures:
+            msg_box.setIcon(QMessageBox.Warning)
+            msg_box.setInformativeText(f"{len(self.failures)} file(s) were not processed "
+                                       f"({summarize_failures(self.failures)}) and were left in the queue.")
+            msg_box.setDetailedText(self.failure_details())
         msg_box.setWindowTitle("Done")
         msg_box.setStandardButtons(QMessageBox.Ok)
         msg_box.buttonClicked.connect(msg_box.hide)
         msg_box.exec_()
 
+def apply_style_sheet(app):
+    # Next to this script, not the working directory, so the app looks the same wherever it is launched from.
+    style_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.qss')
+    try:
+        with open(style_path) as f:
+            app.setStyleSheet(f.read())
+    except OSError as e:
+        print(f"Could not load style sheet {style_path}: {e}")
+
 def main():
     app = QApplication(sys.argv)
-    style = 'Windows'
-    app.setStyleSheet(Path('main.qss').read_text())
+    apply_style_sheet(app)
     ex = ImageProcessor()
     ex.show()
     sys.exit(app.exec_())
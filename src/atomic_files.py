@@ -0,0 +1,69 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+def _current_umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# mkstemp creates owner-only files; finished outputs get the permissions a plain open() would have given.
+FILE_MODE = 0o666 & ~_current_umask()
+
+
+def fsync_path(path):
+    # Opened for writing because Windows refuses to flush a read-only handle.
+    fd = os.open(path, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_directory(directory):
+    # Makes a rename itself durable. Directories can't be opened on Windows, where it isn't needed.
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_path(target_path, mode=FILE_MODE, fsync=False):
+    # Yields a temporary path next to the target and renames it over the target once the block succeeds,
+    # so a crash or kill mid-write never leaves a truncated output behind. The temporary name keeps the
+    # target's extension because Pillow picks the encoder from it. With fsync the data and the rename
+    # reach the disk before this returns, rather than whenever the OS gets round to it.
+    directory = os.path.dirname(os.path.abspath(target_path))
+    base, extension = os.path.splitext(os.path.basename(target_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{base}.", suffix=f".tmp{extension}")
+    os.close(fd)
+    try:
+        yield temp_path
+        if mode is not None:
+            os.chmod(temp_path, mode)
+        if fsync:
+            fsync_path(temp_path)
+        os.replace(temp_path, target_path)
+        if fsync:
+            fsync_directory(directory)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_bytes_atomic(target_path, data, fsync=False):
+    with atomic_path(target_path, fsync=fsync) as temp_path:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
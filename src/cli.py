@@ -0,0 +1,506 @@
+#!/usr/bin/python3
+
+import argparse
+import glob
+import os
+import sys
+
+from processing_options import (DOWNSCALE_SPEEDS, ENCODER_PROFILES, EXECUTION_BACKENDS, PRIORITIES,
+                                RESAMPLING_STRATEGIES)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pyimgscale",
+                                     description="Headless batch frontend for the PyImgScale processing engine.")
+    subparsers = parser.add_subparsers(dest='processing_mode', required=True)
+
+    # Options that control how a batch runs, shared by the processing modes and resume.
+    execution = argparse.ArgumentParser(add_help=False)
+    execution.add_argument('--workers', type=int, default=None,
+                           help="Number of worker processes. Defaults to the CPU count, 1 runs serially.")
+    execution.add_argument('--backend', choices=EXECUTION_BACKENDS, default='process',
+                           help="process: one worker process per file (default). pipeline: threaded "
+                                "read/decode/resize/encode/write stages joined by bounded queues. vectorized: "
+                                "resize runs of same-size images together as NumPy matrix products (needs numpy).")
+    execution.add_argument('--stage-workers', default='', metavar='STAGE=N,...',
+                           help="Pipeline concurrency per stage, e.g. read=4,decode=2,write=4. "
+                                "The resize stage defaults to --workers.")
+    execution.add_argument('--queue-size', type=int, default=None, help="Pipeline queue bound between stages.")
+    execution.add_argument('--stage-processes', default='', metavar='STAGE,...',
+                           help="Pipeline stages to run in worker processes instead of threads, any of decode, "
+                                "resize and encode. Images pass between them in shared memory.")
+    execution.add_argument('--batch-size', type=int, default=None,
+                           help="Most images the vectorized backend resizes together (default: 16).")
+    execution.add_argument('--write-threads', type=int, default=None, metavar='N',
+                           help="Background threads writing outputs for the serial and vectorized backends, which "
+                                "keep processing while slow storage catches up (default: 4).")
+    execution.add_argument('--write-buffer', type=int, default=256, metavar='MB',
+                           help="Most encoded output held in memory waiting to be written (default: 256).")
+    execution.add_argument('--report', metavar='PATH',
+                           help="Write a per-file timing report (decode/resize/encode seconds, pixel counts) "
+                                "as JSON, or CSV if PATH ends in .csv.")
+    execution.add_argument('--quiet', action='store_true', help="Only print the final summary.")
+    execution.add_argument('--journal', default=None, metavar='PATH',
+                           help="SQLite job journal used to resume interrupted runs "
+                                "(default: ~/.local/state/pyimgscale/journal.sqlite3).")
+    execution.add_argument('--no-journal', action='store_true', help="Don't record this run for resuming.")
+
+    common = argparse.ArgumentParser(add_help=False, parents=[execution])
+    common.add_argument('inputs', nargs='+',
+                        help="Input files, directories (scanned recursively) or glob patterns "
+                             "(quote patterns to use ** recursion).")
+    common.add_argument('--extensions', default=None, metavar='EXT,...',
+                        help="Extensions picked up when scanning directories (default: every format Pillow can read).")
+    common.add_argument('--out', required=True, help="Directory processed images are written to.")
+    common.add_argument('--cache-dir', default=None,
+                        help="Directory of the content-addressed result cache (default: ~/.cache/pyimgscale/results).")
+    common.add_argument('--cache-size', type=int, default=1024, metavar='MB',
+                        help="Evict least recently used cache entries beyond this size (default: 1024).")
+    common.add_argument('--no-cache', action='store_true', help="Always reprocess, bypassing the result cache.")
+    common.add_argument('--memory-budget', type=int, default=1024, metavar='MB',
+                        help="Resize outputs larger than this in strips so peak memory stays bounded (default: 1024).")
+    common.add_argument('--encoder', dest='encoder_profile', default='default',
+                        choices=list(ENCODER_PROFILES),
+                        help="Encoder profile: fast writes quickly at a larger size, smallest spends more time "
+                             "on compression, default keeps Pillow's own settings (default: default).")
+    common.add_argument('--name-template', default=None, metavar='TEMPLATE',
+                        help="Output file names, from the fields {name} {ext} {mode} {scale} {parent} and, for "
+                             "renditions, {rendition}, e.g. '{parent}_{name}@{scale}.{ext}'. Sources that would "
+                             "write the same file get numbered names (photo_2) (default: {mode}_{name}.{ext}, "
+                             "{name}.{ext} when converting, {name}_{rendition}.{ext} for renditions).")
+    common.add_argument('--fsync', action='store_true',
+                        help="Flush every output to disk before counting it as written: slower, but nothing "
+                             "reported as done is lost to a crash or power cut.")
+    common.add_argument('--file-timeout', type=float, default=None, metavar='SECONDS',
+                        help="Give up on any single file that takes longer than this. The process backend stops "
+                             "it outright; the threaded backends check between steps.")
+    common.add_argument('--file-memory-limit', type=int, default=None, metavar='MB',
+                        help="Skip images whose decoded pixels would need more than this, judged from the "
+                             "header before decoding (guards against decompression bombs).")
+    common.add_argument('--server', nargs='?', const='', default=None, metavar='ADDRESS',
+                        help="Submit the job to a running job server (see 'pyimgscale serve') instead of "
+                             "processing here, and follow its progress. The server's own workers run it, so "
+                             "the execution options above don't apply (default address: the server's).")
+    common.add_argument('--priority', choices=list(PRIORITIES), default='normal',
+                        help="Job server priority: waiting jobs share the server's workers 4:2:1 by "
+                             "priority (default: normal).")
+    common.add_argument('--detach', action='store_true',
+                        help="With --server, return once the job is accepted instead of following it.")
+
+    for mode in ('upscale', 'downscale'):
+        mode_parser = subparsers.add_parser(mode, parents=[common], help=f"{mode.capitalize()} images.")
+        mode_parser.add_argument('--scale', default="1.5x", help="Scale factor, e.g. 1.5x, 2x or 4x.")
+        mode_parser.add_argument(
+            '--resample', dest='resampling', default='quality',
+            choices=RESAMPLING_STRATEGIES,
+            help="Resampling strategy. The quality/balanced/fast presets take shortcuts for whole-number "
+                 "ratios; a filter name applies that filter everywhere (default: quality).")
+    subparsers.choices['upscale'].add_argument(
+        '--model', default=None, metavar='NAME',
+        help="Upscale with a learned model instead of a resampling filter: the name of a model in the models "
+             "directory or the path of an .onnx (needs onnxruntime) or .npz file. See 'pyimgscale models'.")
+    subparsers.choices['downscale'].add_argument(
+        '--speed', dest='downscale_speed', default='quality', choices=list(DOWNSCALE_SPEEDS),
+        help="Trade quality for speed by decoding large JPEGs close to the target size (default: quality).")
+
+    convert_parser = subparsers.add_parser('convert', parents=[common], help="Convert images to another format.")
+    convert_parser.add_argument('--to', dest='convert_to_format', required=True,
+                                help="Target format, e.g. png, jpg, webp or avif.")
+    convert_parser.add_argument('--from', dest='convert_from_format', default='any',
+                                help="Only convert sources in this format; others are skipped (default: any).")
+
+    renditions_parser = subparsers.add_parser(
+        'renditions', parents=[common],
+        help="Write several outputs per image (e.g. a responsive set) from a single decode.")
+    renditions_parser.add_argument('--spec', metavar='PATH',
+                                   help="JSON job spec: a list of renditions, each with mode (upscale, downscale or "
+                                        "convert), scale, and optionally format, encoder and name.")
+    renditions_parser.add_argument('--rendition', action='append', default=[], metavar='KEY=VALUE,...',
+                                   help="Add one rendition, e.g. mode=downscale,scale=2x,format=webp. Repeatable.")
+    renditions_parser.add_argument(
+        '--resample', dest='resampling', default='quality',
+        choices=RESAMPLING_STRATEGIES,
+        help="Resampling strategy for every rendition (default: quality).")
+    renditions_parser.add_argument(
+        '--speed', dest='downscale_speed', default='quality', choices=list(DOWNSCALE_SPEEDS),
+        help="Downscale speed; faster speeds also derive small renditions from larger ones more eagerly "
+             "(default: quality).")
+
+    models_parser = subparsers.add_parser('models', help="List the upscale models that --model can use.")
+    models_parser.add_argument('--dir', default=None,
+                               help="Models directory (default: ~/.local/share/pyimgscale/models).")
+
+    serve_parser = subparsers.add_parser(
+        'serve', help="Run a job server: one warm, shared worker pool that takes jobs from many clients.")
+    serve_parser.add_argument('--listen', default=None, metavar='ADDRESS',
+                              help="Unix socket path, or localhost:port for HTTP over TCP. Anyone who can connect "
+                                   "can read and write files as this user, so TCP is only served on loopback "
+                                   "addresses (default: ~/.local/state/pyimgscale/server.sock).")
+    serve_parser.add_argument('--workers', type=int, default=None,
+                              help="Worker processes shared by all jobs (default: the CPU count).")
+    serve_parser.add_argument('--journal', default=None, metavar='PATH',
+                              help="Job journal jobs are recorded in, for 'pyimgscale resume' "
+                                   "(default: ~/.local/state/pyimgscale/journal.sqlite3).")
+    serve_parser.add_argument('--no-journal', action='store_true', help="Don't record jobs for resuming.")
+
+    jobs_parser = subparsers.add_parser('jobs', help="List, follow or cancel jobs on a job server.")
+    jobs_parser.add_argument('--server', default=None, metavar='ADDRESS',
+                             help="Job server address (default: ~/.local/state/pyimgscale/server.sock).")
+    jobs_action = jobs_parser.add_mutually_exclusive_group()
+    jobs_action.add_argument('--watch', type=int, metavar='ID', help="Follow a job's progress until it finishes.")
+    jobs_action.add_argument('--cancel', type=int, metavar='ID',
+                             help="Cancel a job; files already running finish, the rest never start.")
+
+    resume_parser = subparsers.add_parser('resume', parents=[execution],
+                                          help="Finish an interrupted run, processing only its unfinished files.")
+    resume_parser.add_argument('--run', type=int, default=None,
+                               help="Journal run to resume (default: the most recent unfinished one).")
+    resume_parser.add_argument('--list', action='store_true', help="List recent runs and exit.")
+    return parser
+
+
+def expand_inputs(patterns, extensions=None):
+    from folder_scanner import scan_directory
+
+    file_paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            path = os.path.abspath(match)
+            if os.path.isdir(path):
+                # Directories are walked recursively, keeping only image extensions.
+                candidates = [entry[0] for chunk in scan_directory(path, extensions or None)
+                              for entry in chunk]
+            else:
+                candidates = [path] if os.path.isfile(path) else []
+            for candidate in candidates:
+                if candidate not in seen:
+                    seen.add(candidate)
+                    file_paths.append(candidate)
+    return file_paths
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.processing_mode == 'jobs':
+        return manage_jobs(parser, args)
+    if args.processing_mode == 'serve':
+        # The server imports the engine itself, once, for every job it will run.
+        from job_server import serve
+        try:
+            return serve(args.listen, args.workers, args.journal, not args.no_journal)
+        except (OSError, ValueError) as e:
+            parser.error(f"could not start the job server: {e}")
+
+    # Imported after argument parsing so --help and usage errors never pay for PIL.
+    from engine import (ProcessingSettings, check_name_template, convert_formats, normalize_format,
+                        normalize_source_format, parse_scale_factor, resolve_output_names, source_formats,
+                        vectorized_available)
+    from folder_scanner import parse_extensions
+    from job_journal import JobJournal
+    from pipeline import parse_stage_processes, parse_stage_workers
+    from renditions import check_renditions, load_job_spec, parse_rendition
+    from result_cache import default_cache_directory
+
+    if args.processing_mode == 'models':
+        return list_models(parser, args.dir)
+
+    try:
+        stage_workers = parse_stage_workers(args.stage_workers)
+        args.stage_processes = parse_stage_processes(args.stage_processes)
+    except ValueError as e:
+        parser.error(str(e))
+    if (args.write_threads is not None and args.write_threads < 1) or args.write_buffer < 1:
+        parser.error("--write-threads and --write-buffer must be at least 1")
+    if args.backend == 'vectorized' and not vectorized_available():
+        parser.error("the vectorized backend needs numpy (pip install numpy)")
+
+    if args.processing_mode == 'resume':
+        journal = JobJournal(args.journal)
+        if args.list:
+            for run, done, total in journal.list_runs():
+                print(f"{run.id:>5}  {run.origin:<4} {run.status:<11} {done}/{total} files  "
+                      f"{run.settings['processing_mode']} -> {run.settings['save_directory']}")
+            return 0
+        run = journal.get_run(args.run) if args.run is not None else journal.latest_unfinished_run()
+        if run is None:
+            parser.error(f"no run {args.run} in the journal" if args.run is not None else "nothing to resume")
+        file_paths = [file_path for file_path in journal.unfinished_files(run.id) if os.path.isfile(file_path)]
+        if not file_paths:
+            # Whatever is left no longer exists on disk, so there is nothing a later resume could do either.
+            journal.abandon_run(run.id)
+            print(f"Run {run.id} has no unfinished files left that still exist.")
+            return 0
+        print(f"Resuming run {run.id}: {len(file_paths)} unfinished file(s)")
+        journal.resume_run(run.id)
+        os.makedirs(run.settings['save_directory'], exist_ok=True)
+        settings = ProcessingSettings.from_dict(run.settings)
+        # Named against the whole run, so a renamed duplicate gets the same name it had the first time.
+        names = resolve_output_names([file_path for file_path, _, _ in journal.files(run.id)], settings)
+        return execute(args, settings, file_paths, stage_workers, journal, run.id, names)
+
+    if args.processing_mode == 'convert':
+        target_format = normalize_format(args.convert_to_format)
+        if target_format is None:
+            parser.error(f"unsupported format '{args.convert_to_format}', choose from {', '.join(convert_formats())}")
+        args.convert_to_format = target_format
+        source_format = normalize_source_format(args.convert_from_format)
+        if source_format is None:
+            parser.error(f"unknown source format '{args.convert_from_format}', "
+                         f"choose from {', '.join(source_formats())}")
+        args.convert_from_format = source_format
+    elif args.processing_mode == 'renditions':
+        try:
+            renditions = load_job_spec(args.spec) if args.spec else []
+            renditions += [parse_rendition(text) for text in args.rendition]
+            check_renditions(renditions)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        if not renditions:
+            parser.error("give the renditions to write with --spec or --rendition")
+        args.renditions = [rendition.as_dict() for rendition in renditions]
+    else:
+        try:
+            if parse_scale_factor(args.scale) <= 0:
+                raise ValueError
+        except ValueError:
+            parser.error(f"invalid scale factor '{args.scale}'")
+        if getattr(args, 'model', None):
+            args.model = load_upscale_model(parser, args.model)
+
+    if args.name_template is not None:
+        try:
+            check_name_template(args.name_template, args.processing_mode)
+        except ValueError as e:
+            parser.error(str(e))
+
+    file_paths = expand_inputs(args.inputs, parse_extensions(args.extensions or ''))
+    if not file_paths:
+        parser.error("no input files matched")
+    os.makedirs(args.out, exist_ok=True)
+
+    settings = ProcessingSettings(args.processing_mode, os.path.abspath(args.out),
+                                  getattr(args, 'scale', None), getattr(args, 'convert_from_format', None),
+                                  getattr(args, 'convert_to_format', None),
+                                  getattr(args, 'downscale_speed', 'quality'),
+                                  args.memory_budget * 1024 * 1024,
+                                  None if args.no_cache else args.cache_dir or default_cache_directory(),
+                                  args.cache_size * 1024 * 1024,
+                                  getattr(args, 'resampling', 'quality'), args.file_timeout,
+                                  args.file_memory_limit * 1024 * 1024 if args.file_memory_limit else None,
+                                  args.encoder_profile, getattr(args, 'renditions', None), args.name_template,
+                                  args.fsync, getattr(args, 'model', None))
+    if args.server is not None:
+        return submit_job(parser, args, settings, file_paths)
+    journal = run_id = None
+    if not args.no_journal:
+        journal = JobJournal(args.journal)
+        run_id = journal.start_run(file_paths, settings.as_dict(), 'cli')
+    return execute(args, settings, file_paths, stage_workers, journal, run_id)
+
+
+def list_models(parser, directory=None):
+    from engine import upscale_models_available
+
+    if not upscale_models_available():
+        parser.error("upscale models need numpy (pip install numpy)")
+    from model_registry import available_models, default_models_directory
+
+    models = available_models(directory)
+    print(f"Models in {directory or default_models_directory()}:")
+    for info in models:
+        print(f"  {info.name:<24} {info.backend}{'' if info.usable else ' (needs onnxruntime)'}")
+    if not models:
+        print("  none; put .onnx or .npz models there, or pass a model file to --model")
+    return 0
+
+
+def load_upscale_model(parser, name):
+    # Loaded once here as well, so a missing or broken model fails before any file is queued.
+    from engine import upscale_models_available
+
+    if not upscale_models_available():
+        parser.error("upscale models need numpy (pip install numpy)")
+    from model_registry import resolve_model
+    from upscale_models import load_model
+
+    try:
+        path = resolve_model(name)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        load_model(path)
+    except (OSError, KeyError, ValueError) as e:
+        parser.error(f"could not load upscale model {path}: {e}")
+    return path
+
+
+def submit_job(parser, args, settings, file_paths):
+    from job_client import JobClient, JobServerError
+
+    client = JobClient(args.server or None)
+    try:
+        job = client.submit(settings.as_dict(), file_paths, args.priority)
+    except (ConnectionError, JobServerError) as e:
+        parser.error(str(e))
+    print(f"Submitted job {job['id']} ({len(file_paths)} file(s), {job['priority']} priority) to {client.address}")
+    if args.detach:
+        return 0
+    return follow_job(client, job['id'], args.quiet)
+
+
+def follow_job(client, job_id, quiet=False):
+    # Prints the job's progress the way a local run does; Ctrl+C stops following, not the job.
+    from instrumentation import format_duration
+    from job_client import JobServerError
+
+    # The 'finished' event carries the job's final status, which still arrives when the server is stopping.
+    finished = None
+    try:
+        for event in client.events(job_id):
+            if event['event'] == 'finished':
+                finished = event
+            elif event['event'] != 'file':
+                continue
+            elif event['status'] == 'failed':
+                error = event['error']
+                print(f"Failed {event['source']} ({error['kind']}: {error['message']})", file=sys.stderr)
+            elif quiet:
+                continue
+            elif event['status'] == 'skipped':
+                print(f"Skipped {event['source']} ({event['error']['message']})")
+            else:
+                print(f"[{event['fraction_done']:4.0%} ETA {format_duration(event['eta_seconds'] or 0)}] "
+                      f"{event['source']} -> {', '.join(event['outputs'])}{' (cached)' if event['cache_hit'] else ''}")
+    except KeyboardInterrupt:
+        print(f"Job {job_id} keeps running on the server; cancel it with: pyimgscale jobs --cancel {job_id}")
+        return 130
+    except (ConnectionError, JobServerError) as e:
+        print(f"Lost track of job {job_id}: {e}", file=sys.stderr)
+        return 1
+    job = finished
+    if job is None:
+        print(f"Job {job_id} stopped reporting before it finished", file=sys.stderr)
+        return 1
+    print(f"Job {job_id} {job['status']}: processed {job['done']}/{job['total']} files in "
+          f"{job['elapsed_seconds']:.2f}s ({job['megapixels_per_second']:.1f} MP/s)")
+    if job['skipped']:
+        print(f"Skipped {job['skipped']} file(s) in another format")
+    if job['failed']:
+        print(f"Failures: {job['failed']}")
+    if job['cache_hits']:
+        print(f"Result cache: {job['cache_hits']} hits")
+    if job['run_id'] is not None and job['status'] != 'completed':
+        print(f"Run {job['run_id']} is unfinished; retry the remaining files with: "
+              f"pyimgscale resume --run {job['run_id']}")
+    return 0 if job['status'] == 'completed' else 1
+
+
+def manage_jobs(parser, args):
+    from job_client import JobClient, JobServerError
+
+    client = JobClient(args.server)
+    try:
+        if args.watch is not None:
+            client.status(args.watch)
+            return follow_job(client, args.watch)
+        if args.cancel is not None:
+            job = client.cancel(args.cancel)
+            print(f"Cancelling job {job['id']}: {job['done']}/{job['total']} files done, "
+                  f"{job['running']} still running")
+            return 0
+        jobs = client.jobs()
+    except (ConnectionError, JobServerError) as e:
+        parser.error(str(e))
+    for job in jobs:
+        print(f"{job['id']:>5}  {job['status']:<11} {job['priority']:<6} {job['done']}/{job['total']} files  "
+              f"{job['processing_mode']} -> {job['save_directory']}")
+    if not jobs:
+        print(f"No jobs on {client.address}")
+    return 0
+
+
+def execute(args, settings, file_paths, stage_workers, journal=None, run_id=None, names=None):
+    from engine import create_executor, default_worker_count
+    from instrumentation import FileTiming, RunStats, format_duration
+    from run_control import failure_record, summarize_failures
+
+    max_workers = min(args.workers or default_worker_count(), len(file_paths))
+    if args.backend == 'pipeline':
+        max_workers = args.workers or default_worker_count()
+
+    failures = 0
+    skipped = 0
+    cache_hits = 0
+    interrupted = False
+    file_sizes = [os.path.getsize(file_path) for file_path in file_paths]
+    stats = RunStats(len(file_paths), sum(file_sizes))
+    executor = create_executor(max_workers, args.backend, stage_workers, args.queue_size, args.batch_size,
+                               settings.file_timeout, args.write_threads, args.write_buffer * 1024 * 1024,
+                               args.stage_processes)
+    try:
+        for i, result, error in executor.run(file_paths, settings, names=names):
+            if error is None:
+                cache_hits += result.cache_hit
+                stats.record(result.timing)
+                if journal is not None:
+                    journal.mark_done(run_id, file_paths[i], result.output_path)
+                if not args.quiet:
+                    eta = stats.eta_seconds()
+                    outputs = ', '.join(result.output_paths)
+                    print(f"[{stats.fraction_done():4.0%} ETA {format_duration(eta or 0)}] "
+                          f"{file_paths[i]} -> {outputs}{' (cached)' if result.cache_hit else ''}")
+            else:
+                failure = failure_record(file_paths[i], error)
+                if failure.kind == 'skipped':
+                    # Filtered out by --from; recorded as done so a resume never brings it back.
+                    skipped += 1
+                    stats.record(FileTiming(file_paths[i], file_sizes[i]))
+                    if journal is not None:
+                        journal.mark_done(run_id, file_paths[i], None)
+                    if not args.quiet:
+                        print(f"Skipped {file_paths[i]} ({failure.message})")
+                    continue
+                failures += 1
+                stats.record(FileTiming(file_paths[i], file_sizes[i]), failure)
+                if journal is not None:
+                    journal.mark_failed(run_id, file_paths[i], failure)
+                print(f"Failed {file_paths[i]} ({failure})", file=sys.stderr)
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        executor.shutdown()
+        stats.finish()
+        if journal is not None:
+            journal.finish_run(run_id, interrupted)
+            journal.close()
+
+    print(f"Processed {stats.processed_files - failures - skipped}/{len(file_paths)} files in {stats.elapsed():.2f}s "
+          f"({executor.max_workers} worker(s), {stats.megapixels_per_second():.1f} MP/s)")
+    if skipped:
+        print(f"Skipped {skipped} file(s) not in {settings.convert_from_format} format")
+    if failures:
+        print(f"Failures: {summarize_failures(stats.failures)}")
+    if args.backend == 'pipeline':
+        print(executor.metrics_report())
+    if settings.cache_directory is not None:
+        print(f"Result cache: {cache_hits} hits, {stats.processed_files - failures - skipped - cache_hits} misses")
+    if args.report:
+        metadata = {'processing_mode': settings.processing_mode, 'backend': args.backend,
+                    'workers': executor.max_workers}
+        if args.backend == 'pipeline':
+            metadata['stages'] = executor.metrics_summary()
+        stats.write_report(args.report, metadata)
+        print(f"Timing report written to {args.report}")
+    if journal is not None and (failures or interrupted):
+        print(f"Run {run_id} is unfinished; retry the remaining files with: pyimgscale resume --run {run_id}")
+    if interrupted:
+        return 130
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,558 @@
+import math
+import os
+import threading
+
+from PyQt5.QtCore import QPointF, QRectF, Qt, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPainter, QPen, QPixmap
+from PyQt5.QtWidgets import (QCheckBox, QComboBox, QDialog, QHBoxLayout, QLabel, QProgressBar, QPushButton,
+                             QVBoxLayout, QWidget)
+
+from processing_options import quality_metrics_available
+from thumbnails import ThumbnailCache
+
+# A before/after viewer for a source and its output. Both are drawn in the output's pixel coordinates, each
+# from the level of its own pyramid (see image_pyramid.py) that matches the zoom, one tile at a time.
+
+SIDE_BY_SIDE, SWIPE = 'side_by_side', 'swipe'
+COMPARISON_MODES = {SIDE_BY_SIDE: "Side by Side", SWIPE: "Swipe"}
+TILE_CACHE_BYTES = 256 * 1024 * 1024
+# Past 1:1 pixels are magnified without smoothing, so single pixels can be told apart.
+MAX_ZOOM = 8.0
+ZOOM_STEP = 1.25
+PANE_GAP = 4
+# How close to the swipe divider a press has to be to drag it rather than pan.
+DIVIDER_GRAB = 6
+# Difference metrics are computed once the view has been still for this long, over blocks of this many
+# screen pixels a side.
+METRICS_SETTLE_MS = 150
+METRIC_BLOCK = 64
+# Larger visible regions are measured on a pyramid level instead. The levels are box filtered while the
+# source is resampled with Lanczos, so figures measured there reflect that difference as well as the output's.
+METRIC_PIXELS = 2 * 1024 * 1024
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+def pixmap_from_image(img):
+    data = img.tobytes()
+    return QPixmap.fromImage(QImage(data, img.width, img.height, 4 * img.width, QImage.Format_RGBA8888))
+
+
+class PyramidLoader(QThread):
+    progress = pyqtSignal(int)
+    loaded = pyqtSignal(object, object)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, cache, before_path, after_path):
+        super().__init__()
+        self.cache = cache
+        self.before_path = before_path
+        self.after_path = after_path
+        self.cancelled = False
+
+    def report(self, percent):
+        # Raising out of the progress callback abandons a build; the cache removes what it had written.
+        if self.cancelled:
+            raise BuildCancelled()
+        self.progress.emit(percent)
+
+    def cancel(self):
+        self.cancelled = True
+        self.wait()
+
+    def run(self):
+        # Pyramids already in the cache open at once; otherwise each image is decoded once to build its own.
+        file_path = self.before_path
+        try:
+            before = self.cache.open(file_path, lambda done: self.report(int(done * 50)))
+            file_path = self.after_path
+            after = self.cache.open(file_path, lambda done: self.report(50 + int(done * 50)), keep=[before.key])
+        except BuildCancelled:
+            return
+        except Exception as e:
+            self.failed.emit(file_path, str(e) or type(e).__name__)
+            return
+        self.loaded.emit(before, after)
+
+
+class MetricsRequest:
+    # The visible part of the output at the level on screen, and the same area of the source at a level at
+    # least as detailed, which is resampled onto the output's pixels.
+    def __init__(self, view_id, after_level, after_box, before_level, before_box, rows, columns, output_box):
+        self.view_id = view_id
+        self.after_level = after_level
+        self.after_box = after_box
+        self.before_level = before_level
+        self.before_box = before_box
+        self.rows = rows
+        self.columns = columns
+        self.output_box = output_box
+
+    def size(self):
+        return self.after_box[2] - self.after_box[0], self.after_box[3] - self.after_box[1]
+
+
+class MetricsWorker(QThread):
+    metrics_ready = pyqtSignal(object, object)
+
+    def __init__(self, before, after):
+        super().__init__()
+        self.before = before
+        self.after = after
+        self.condition = threading.Condition()
+        # Only the latest view matters; a newer request replaces one not yet started.
+        self.pending = None
+        self.stopped = False
+
+    def request(self, request):
+        with self.condition:
+            self.pending = request
+            self.condition.notify()
+        if not self.isRunning():
+            self.stopped = False
+            self.start()
+
+    def stop(self):
+        if self.isRunning():
+            with self.condition:
+                self.stopped = True
+                self.condition.notify()
+            self.wait()
+
+    def run(self):
+        from quality_metrics import region_metrics
+
+        while True:
+            with self.condition:
+                while self.pending is None and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                request, self.pending = self.pending, None
+            after = self.after.levels[request.after_level].crop(request.after_box)
+            before = self.before.resampled_region(request.before_level, request.before_box, request.size())
+            self.metrics_ready.emit(request, region_metrics(before, after, request.rows, request.columns))
+
+
+class ComparisonCanvas(QWidget):
+    view_changed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.before = None
+        self.after = None
+        self.mode = SIDE_BY_SIDE
+        self.center = QPointF()
+        self.zoom = 1.0
+        self.fitted = True
+        # Where the swipe divider sits, as a fraction of the width.
+        self.divider = 0.5
+        self.drag = None
+        self.drag_origin = None
+        self.show_difference_map = False
+        self.metrics = None
+        self.view_id = 0
+        self.tiles = ThumbnailCache(TILE_CACHE_BYTES)
+        self.setMouseTracking(True)
+        self.setMinimumSize(400, 300)
+
+    def set_pyramids(self, before, after):
+        self.before = before
+        self.after = after
+        self.tiles.clear()
+        self.fit()
+
+    def clear(self):
+        self.before = None
+        self.after = None
+        self.metrics = None
+        self.tiles.clear()
+
+    def set_mode(self, mode):
+        self.mode = mode
+        if self.fitted:
+            self.fit()
+        else:
+            self.changed()
+
+    def set_show_difference_map(self, show):
+        self.show_difference_map = show
+        self.update()
+
+    def set_metrics(self, request, metrics):
+        if request.view_id == self.view_id:
+            self.metrics = (request, metrics)
+            self.update()
+
+    def changed(self):
+        # Any change of view makes the metrics on screen stale.
+        self.view_id += 1
+        self.metrics = None
+        self.update()
+        self.view_changed.emit()
+
+    def view_rects(self):
+        # Each pane's area, and the part of it that is drawn: in swipe mode both panes span the widget and
+        # the divider splits what each shows.
+        rect = QRectF(self.rect())
+        if self.mode == SWIPE:
+            split = rect.width() * self.divider
+            return [(rect, QRectF(0, 0, split, rect.height()), self.before),
+                    (rect, QRectF(split, 0, rect.width() - split, rect.height()), self.after)]
+        width = (rect.width() - PANE_GAP) / 2
+        left = QRectF(0, 0, width, rect.height())
+        right = QRectF(width + PANE_GAP, 0, width, rect.height())
+        return [(left, left, self.before), (right, right, self.after)]
+
+    def after_rect(self):
+        return self.view_rects()[1][0]
+
+    def fit_zoom(self):
+        rect = self.after_rect()
+        return min(rect.width() / self.after.size[0], rect.height() / self.after.size[1], 1.0)
+
+    def fit(self):
+        if self.after is None:
+            return
+        self.zoom = self.fit_zoom()
+        self.center = QPointF(self.after.size[0] / 2, self.after.size[1] / 2)
+        self.fitted = True
+        self.changed()
+
+    def actual_size(self, point=None):
+        self.zoom_to(1.0, point)
+
+    def zoom_to(self, zoom, point=None):
+        # Zooms about a widget point, which keeps showing the same image pixel.
+        if self.after is None:
+            return
+        zoom = max(min(zoom, MAX_ZOOM), self.fit_zoom())
+        rect = self.pane_at(point) if point is not None else self.after_rect()
+        if point is not None:
+            anchor = self.to_image(point, rect)
+            self.center = anchor - (point - rect.center()) / zoom
+        self.zoom = zoom
+        self.fitted = False
+        self.clamp_center()
+        self.changed()
+
+    def clamp_center(self):
+        # Keeps the image filling the pane along any axis it is larger than the pane, and centred along the others.
+        rect = self.after_rect()
+        center = []
+        for value, size, extent in ((self.center.x(), self.after.size[0], rect.width()),
+                                    (self.center.y(), self.after.size[1], rect.height())):
+            half_view = extent / 2 / self.zoom
+            center.append(min(max(value, half_view), size - half_view) if 2 * half_view < size else size / 2)
+        self.center = QPointF(*center)
+
+    def pane_at(self, point):
+        for rect, _, _ in self.view_rects():
+            if rect.contains(point):
+                return rect
+        return self.after_rect()
+
+    def to_image(self, point, rect):
+        return self.center + (point - rect.center()) / self.zoom
+
+    def visible_box(self, rect):
+        # The part of the output, in its full resolution pixels, that a pane shows.
+        half_width, half_height = rect.width() / 2 / self.zoom, rect.height() / 2 / self.zoom
+        return (max(self.center.x() - half_width, 0), max(self.center.y() - half_height, 0),
+                min(self.center.x() + half_width, self.after.size[0]),
+                min(self.center.y() + half_height, self.after.size[1]))
+
+    def pyramid_scale(self, pyramid):
+        # The pyramid's full resolution pixels per output pixel; the source of an upscale has fewer.
+        return pyramid.size[0] / self.after.size[0], pyramid.size[1] / self.after.size[1]
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.palette().dark())
+        if self.after is None:
+            painter.end()
+            return
+        visible = set()
+        for rect, clip, pyramid in self.view_rects():
+            painter.save()
+            painter.setClipRect(clip)
+            visible.update(self.draw_pyramid(painter, rect, pyramid))
+            painter.restore()
+        self.tiles.pin(visible)
+        if self.show_difference_map and self.metrics is not None:
+            self.draw_difference_map(painter, *self.metrics)
+        painter.setPen(self.palette().brightText().color())
+        for (rect, clip, _), label in zip(self.view_rects(), ("Before", "After")):
+            painter.drawText(clip.adjusted(8, 8, -8, -8), Qt.AlignTop | (Qt.AlignLeft if label == "Before"
+                                                                          else Qt.AlignRight), label)
+        if self.mode == SWIPE:
+            x = self.width() * self.divider
+            painter.setPen(QPen(self.palette().highlight().color(), 2))
+            painter.drawLine(QPointF(x, 0), QPointF(x, self.height()))
+        painter.end()
+
+    def draw_pyramid(self, painter, rect, pyramid):
+        scale_x, scale_y = self.pyramid_scale(pyramid)
+        level = pyramid.level_for(self.zoom / scale_x)
+        level_x, level_y = pyramid.level_scale(level)
+        # Output pixels to level pixels, per axis.
+        to_level_x, to_level_y = scale_x * level_x, scale_y * level_y
+        box = self.visible_box(rect)
+        # Smoothing only while the output is shown at or below 1:1.
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, self.zoom <= 1.0)
+        painter.translate(rect.center())
+        painter.scale(self.zoom, self.zoom)
+        painter.translate(-self.center)
+        painter.scale(1 / to_level_x, 1 / to_level_y)
+        keys = []
+        for column, row in pyramid.tiles_for(level, (box[0] * to_level_x, box[1] * to_level_y,
+                                                     box[2] * to_level_x, box[3] * to_level_y)):
+            key = (pyramid.key, level, column, row)
+            entry = self.tiles.get(key)
+            if entry is None:
+                img, offset = pyramid.tile(level, column, row)
+                entry = (pixmap_from_image(img), offset)
+                self.tiles.put(key, entry, img.width * img.height * 4)
+            # Drawn margin and all: neighbouring tiles overlap by the margin, which also covers the hairline
+            # gaps rounding could otherwise leave between them.
+            pixmap, (offset_x, offset_y) = entry
+            left, top, _, _ = pyramid.tile_box(level, column, row)
+            painter.drawPixmap(QPointF(left - offset_x, top - offset_y), pixmap)
+            keys.append(key)
+        return keys
+
+    def draw_difference_map(self, painter, request, metrics):
+        # Blocks are tinted by how far their SSIM falls short of 1; identical blocks stay clear.
+        rect = self.after_rect()
+        left, top, right, bottom = request.output_box
+        rows, columns = metrics.block_ssim.shape
+        painter.save()
+        painter.setClipRect(self.view_rects()[1][1])
+        painter.translate(rect.center())
+        painter.scale(self.zoom, self.zoom)
+        painter.translate(-self.center)
+        painter.setPen(Qt.NoPen)
+        row_edges = [top + (bottom - top) * row / rows for row in range(rows + 1)]
+        column_edges = [left + (right - left) * column / columns for column in range(columns + 1)]
+        for row in range(rows):
+            for column in range(columns):
+                shortfall = min(max(1 - metrics.block_ssim[row, column], 0) * 4, 1)
+                painter.fillRect(QRectF(column_edges[column], row_edges[row],
+                                        column_edges[column + 1] - column_edges[column],
+                                        row_edges[row + 1] - row_edges[row]),
+                                 QColor(255, 0, 0, int(shortfall * 160)))
+        painter.restore()
+
+    def metrics_request(self):
+        # The visible part of the output, widened to whole pixels, at full resolution unless that is more than
+        # METRIC_PIXELS; then at the most detailed level within it.
+        if self.after is None:
+            return None
+        box = self.visible_box(self.after_rect())
+        for after_level in range(len(self.after.sizes)):
+            level_x, level_y = self.after.level_scale(after_level)
+            width, height = self.after.sizes[after_level]
+            after_box = (max(math.floor(box[0] * level_x), 0), max(math.floor(box[1] * level_y), 0),
+                         min(math.ceil(box[2] * level_x), width), min(math.ceil(box[3] * level_y), height))
+            if (after_box[2] - after_box[0]) * (after_box[3] - after_box[1]) <= METRIC_PIXELS:
+                break
+        if after_box[2] <= after_box[0] or after_box[3] <= after_box[1]:
+            return None
+        output_box = (after_box[0] / level_x, after_box[1] / level_y, after_box[2] / level_x, after_box[3] / level_y)
+        scale_x, scale_y = self.pyramid_scale(self.before)
+        before_level = self.before.level_for(width / self.before.size[0])
+        before_x, before_y = self.before.level_scale(before_level)
+        before_width, before_height = self.before.sizes[before_level]
+        before_box = (output_box[0] * scale_x * before_x, output_box[1] * scale_y * before_y,
+                      min(output_box[2] * scale_x * before_x, before_width),
+                      min(output_box[3] * scale_y * before_y, before_height))
+        columns = max(round((output_box[2] - output_box[0]) * self.zoom / METRIC_BLOCK), 1)
+        rows = max(round((output_box[3] - output_box[1]) * self.zoom / METRIC_BLOCK), 1)
+        return MetricsRequest(self.view_id, after_level, after_box, before_level, before_box, rows, columns,
+                              output_box)
+
+    def divider_x(self):
+        return self.width() * self.divider
+
+    def mousePressEvent(self, event):
+        if self.after is None or event.button() != Qt.LeftButton:
+            return
+        if self.mode == SWIPE and abs(event.x() - self.divider_x()) <= DIVIDER_GRAB:
+            self.drag = 'divider'
+        else:
+            self.drag = 'pan'
+            self.drag_origin = (QPointF(event.pos()), self.center)
+            self.setCursor(Qt.ClosedHandCursor)
+
+    def mouseMoveEvent(self, event):
+        if self.drag == 'divider':
+            self.divider = min(max(event.x() / max(self.width(), 1), 0.0), 1.0)
+            self.update()
+        elif self.drag == 'pan':
+            origin, center = self.drag_origin
+            self.center = center - (QPointF(event.pos()) - origin) / self.zoom
+            self.fitted = False
+            self.clamp_center()
+            self.changed()
+        elif self.mode == SWIPE and self.after is not None:
+            near = abs(event.x() - self.divider_x()) <= DIVIDER_GRAB
+            self.setCursor(Qt.SplitHCursor if near else Qt.ArrowCursor)
+
+    def mouseReleaseEvent(self, event):
+        self.drag = None
+        self.unsetCursor()
+
+    def mouseDoubleClickEvent(self, event):
+        # Toggles between fitting the window and 1:1 at the pixel clicked.
+        if self.fitted:
+            self.actual_size(QPointF(event.pos()))
+        else:
+            self.fit()
+
+    def wheelEvent(self, event):
+        steps = event.angleDelta().y() / 120
+        if steps:
+            self.zoom_to(self.zoom * ZOOM_STEP ** steps, QPointF(event.pos()))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.fitted:
+            self.fit()
+        else:
+            self.changed()
+
+
+class ComparisonDialog(QDialog):
+    def __init__(self, before_path, after_path, cache, settings, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Compare: {os.path.basename(before_path)} / {os.path.basename(after_path)}")
+        self.resize(1200, 760)
+        self.settings = settings
+        self.before = None
+        self.after = None
+        self.metrics_worker = None
+        self.closed = False
+
+        self.canvas = ComparisonCanvas(self)
+        self.canvas.view_changed.connect(self.on_view_changed)
+
+        self.mode_combo = QComboBox(self)
+        for mode, label in COMPARISON_MODES.items():
+            self.mode_combo.addItem(label, mode)
+        self.mode_combo.setCurrentIndex(max(self.mode_combo.findData(self.settings.value("comparisonMode")), 0))
+        self.mode_combo.currentIndexChanged.connect(self.on_mode_changed)
+        self.canvas.set_mode(self.mode_combo.currentData())
+
+        fit_btn = QPushButton('Fit', self)
+        fit_btn.clicked.connect(self.canvas.fit)
+        actual_size_btn = QPushButton('1:1', self)
+        actual_size_btn.clicked.connect(lambda: self.canvas.actual_size())
+
+        self.difference_map_checkbox = QCheckBox("Difference Map", self)
+        self.difference_map_checkbox.setToolTip(
+            "Tints each block of the output by how much its SSIM against the source falls short of 1.")
+        self.difference_map_checkbox.setChecked(self.settings.value("comparisonDifferenceMap", False, type=bool))
+        self.difference_map_checkbox.toggled.connect(self.on_difference_map_toggled)
+        self.canvas.set_show_difference_map(self.difference_map_checkbox.isChecked())
+
+        self.zoom_label = QLabel(self)
+
+        controls_layout = QHBoxLayout()
+        controls_layout.addWidget(QLabel("View:"))
+        controls_layout.addWidget(self.mode_combo)
+        controls_layout.addWidget(fit_btn)
+        controls_layout.addWidget(actual_size_btn)
+        controls_layout.addWidget(self.difference_map_checkbox)
+        controls_layout.addStretch()
+        controls_layout.addWidget(self.zoom_label)
+
+        self.progress_bar = QProgressBar(self)
+        self.metrics_label = QLabel("Building image pyramids...", self)
+        self.metrics_label.setWordWrap(True)
+
+        layout = QVBoxLayout()
+        layout.addLayout(controls_layout)
+        layout.addWidget(self.canvas, 1)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.metrics_label)
+        self.setLayout(layout)
+
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.setInterval(METRICS_SETTLE_MS)
+        self.settle_timer.timeout.connect(self.request_metrics)
+
+        self.loader = PyramidLoader(cache, before_path, after_path)
+        self.loader.progress.connect(self.progress_bar.setValue)
+        self.loader.loaded.connect(self.on_pyramids_loaded)
+        self.loader.failed.connect(self.on_pyramids_failed)
+        self.loader.start()
+
+    def on_pyramids_loaded(self, before, after):
+        if self.closed:
+            # Finished just as the dialog closed.
+            before.close()
+            after.close()
+            return
+        self.before = before
+        self.after = after
+        self.progress_bar.hide()
+        if quality_metrics_available():
+            self.metrics_worker = MetricsWorker(before, after)
+            self.metrics_worker.metrics_ready.connect(self.on_metrics_ready)
+            self.metrics_label.setText("Measuring the visible region...")
+        else:
+            self.difference_map_checkbox.setEnabled(False)
+            self.metrics_label.setText("PSNR and SSIM need NumPy (pip install numpy).")
+        self.canvas.set_pyramids(before, after)
+
+    def on_pyramids_failed(self, file_path, message):
+        self.progress_bar.hide()
+        self.difference_map_checkbox.setEnabled(False)
+        self.metrics_label.setText(f"Could not build the comparison: {os.path.basename(file_path)}: {message}")
+        self.metrics_label.setToolTip(f"{file_path}: {message}")
+
+    def on_mode_changed(self, index):
+        self.settings.setValue("comparisonMode", self.mode_combo.itemData(index))
+        self.canvas.set_mode(self.mode_combo.itemData(index))
+
+    def on_difference_map_toggled(self, checked):
+        self.settings.setValue("comparisonDifferenceMap", checked)
+        self.canvas.set_show_difference_map(checked)
+
+    def on_view_changed(self):
+        self.zoom_label.setText(f"Zoom: {self.canvas.zoom * 100:.0f}%")
+        if self.metrics_worker is not None:
+            self.settle_timer.start()
+
+    def request_metrics(self):
+        request = self.canvas.metrics_request()
+        if request is not None:
+            self.metrics_worker.request(request)
+
+    def on_metrics_ready(self, request, metrics):
+        self.canvas.set_metrics(request, metrics)
+        if request.view_id != self.canvas.view_id:
+            return
+        width, height = request.size()
+        psnr = "identical" if math.isinf(metrics.psnr) else f"PSNR {metrics.psnr:.2f} dB"
+        resolution = ("full resolution" if request.after_level == 0
+                      else f"1:{2 ** request.after_level}, zoom in for full resolution figures")
+        self.metrics_label.setText(
+            f"Visible region ({width}x{height}, {resolution}) against the source resampled with Lanczos: {psnr}, "
+            f"SSIM {metrics.ssim:.4f}, lowest block SSIM {metrics.block_ssim.min():.4f} over "
+            f"{request.rows}x{request.columns} blocks.")
+
+    def done(self, result):
+        self.closed = True
+        self.loader.cancel()
+        self.settle_timer.stop()
+        if self.metrics_worker is not None:
+            self.metrics_worker.stop()
+        self.canvas.clear()
+        for pyramid in (self.before, self.after):
+            if pyramid is not None:
+                pyramid.close()
+        super().done(result)
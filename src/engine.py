@@ -0,0 +1,617 @@
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait as wait_futures
+
+from PIL import Image, TiffImagePlugin
+
+from atomic_files import atomic_path
+from output_writer import DEFAULT_WRITE_BUFFER_BYTES, DEFAULT_WRITE_THREADS, OutputWriter, settled
+# Re-exported as well: the run options are engine settings as far as every caller is concerned.
+from processing_options import (ANY_FORMAT, DEFAULT_MEMORY_BUDGET, DEFAULT_NAME_TEMPLATES, DOWNSCALE_SPEEDS,
+                                ENCODER_PROFILES, EXECUTION_BACKENDS, MODE_NAMES, NAME_FIELDS, PROCESSING_MODES,
+                                RENDITIONS_MODE, RESAMPLING_PRESETS, RESAMPLING_STRATEGIES, SCALE_FACTORS,
+                                check_name_template, default_worker_count, parse_scale_factor,
+                                upscale_models_available, vectorized_available)
+from image_formats import (compatible_image, format_for_name, readable_formats, source_format_matches,
+                           writable_formats)
+from instrumentation import FileTiming
+from result_cache import DEFAULT_CACHE_BYTES, ResultCache
+from run_control import FileMemoryError, FileTimeoutError, SourceFormatError, should_start
+from tiling import needs_tiling, tiled_resize
+
+# The Pillow filter behind each of processing_options.RESAMPLING_FILTER_NAMES.
+RESAMPLING_FILTERS = {
+    'lanczos': Image.LANCZOS,
+    'bicubic': Image.BICUBIC,
+    'bilinear': Image.BILINEAR,
+    'box': Image.BOX,
+    'nearest': Image.NEAREST,
+}
+PRESET_UPSCALE_FILTERS = {
+    'quality': Image.LANCZOS,
+    'balanced': Image.BICUBIC,
+    'fast': Image.BILINEAR,
+}
+# Image.reduce averages raw values, which is meaningless for palette indices and bilevel images.
+REDUCE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'CMYK', 'I', 'F')
+
+# How often a waiting run wakes to check for a cancel or an expired time limit.
+POLL_INTERVAL = 0.1
+
+
+class ProcessingSettings:
+    def __init__(self, processing_mode, save_directory, scale_factor, convert_from_format, convert_to_format,
+                 downscale_speed='quality', memory_budget=DEFAULT_MEMORY_BUDGET, cache_directory=None,
+                 cache_max_bytes=None, resampling='quality', file_timeout=None, memory_limit=None,
+                 encoder_profile='default', renditions=None, name_template=None, fsync=False, upscale_model=None):
+        self.processing_mode = processing_mode
+        self.save_directory = save_directory
+        self.scale_factor = scale_factor
+        self.convert_from_format = convert_from_format
+        self.convert_to_format = convert_to_format
+        self.downscale_speed = downscale_speed
+        self.memory_budget = memory_budget
+        self.cache_directory = cache_directory
+        self.cache_max_bytes = cache_max_bytes
+        self.resampling = resampling
+        # Per-file limits: seconds before a file is abandoned, and bytes its decoded pixels may take.
+        self.file_timeout = file_timeout
+        self.memory_limit = memory_limit
+        self.encoder_profile = encoder_profile
+        # For RENDITIONS_MODE: the job spec entries, as Rendition.as_dict() gives them.
+        self.renditions = renditions
+        # None uses DEFAULT_NAME_TEMPLATES; fsync flushes every output to disk before it counts as written.
+        self.name_template = name_template
+        self.fsync = fsync
+        # Path of a learned model upscales run through instead of a resampling filter; see upscale_models.py.
+        self.upscale_model = upscale_model
+
+    def cache_params(self, target_path):
+        # Everything that changes the bytes written; the save directory and memory budget do not. The format
+        # comes from target_path, since resized outputs keep their source's.
+        params = {'processing_mode': self.processing_mode, 'output_format': image_format_for(target_path)}
+        if self.encoder_profile != 'default':
+            params['encoder_profile'] = self.encoder_profile
+        if self.processing_mode == 'convert':
+            params['convert_to_format'] = self.convert_to_format
+            if self.convert_from_format not in (None, ANY_FORMAT):
+                # Otherwise a cached result would slip past the filter, which only runs on decode.
+                params['convert_from_format'] = self.convert_from_format
+        else:
+            params['scale_factor'] = parse_scale_factor(self.scale_factor)
+            params['resampling'] = self.resampling
+        if uses_model(self):
+            from model_registry import model_digest
+            params['upscale_model'] = model_digest(self.upscale_model)
+        if self.processing_mode == 'downscale':
+            params['downscale_speed'] = self.downscale_speed
+        return params
+
+    def as_dict(self):
+        # Every attribute is a constructor argument, which is what lets the job journal replay a run.
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
+
+    def name_template_or_default(self):
+        return self.name_template or DEFAULT_NAME_TEMPLATES[self.processing_mode]
+
+
+class ProcessingResult:
+    def __init__(self, source_path, output_path, cache_hit=False, timing=None, output_paths=None, written=None):
+        self.source_path = source_path
+        self.output_path = output_path
+        self.output_paths = output_paths or [output_path]
+        self.cache_hit = cache_hit
+        self.timing = timing
+        # A future that settles once outputs handed to an OutputWriter are on disk; None when they already are.
+        self.written = written
+
+
+def convert_formats():
+    return [info.label for info in writable_formats()]
+
+
+def source_formats():
+    return [ANY_FORMAT] + [info.label for info in readable_formats()]
+
+
+def normalize_format(name):
+    info = format_for_name(name)
+    return info.name if info is not None and info.writable else None
+
+
+def normalize_source_format(name):
+    if not name or name.lower() == ANY_FORMAT:
+        return ANY_FORMAT
+    info = format_for_name(name)
+    return info.name if info is not None and info.readable else None
+
+
+def output_file_name(file_path, settings, name=None, rendition=None):
+    # rendition is the renditions.Rendition being named, in which case its own mode and format apply.
+    # Upscales and downscales keep the source's format; the job's convert_to_format only applies to
+    # conversions, while a rendition can still give its resized output a format of its own.
+    stem, extension = os.path.splitext(os.path.basename(file_path))
+    source = rendition or settings
+    if source.processing_mode == 'convert':
+        scale, ext = '', source.convert_to_format
+    else:
+        explicit = rendition.convert_to_format if rendition is not None else None
+        scale, ext = f"{parse_scale_factor(source.scale_factor):g}x", explicit or extension.lstrip('.')
+    return settings.name_template_or_default().format(
+        name=name or stem, ext=ext, mode=MODE_NAMES[source.processing_mode], scale=scale,
+        parent=os.path.basename(os.path.dirname(os.path.abspath(file_path))),
+        rendition=rendition.name if rendition is not None else '')
+
+
+def output_path_for(file_path, settings, name=None):
+    return os.path.join(settings.save_directory, output_file_name(file_path, settings, name))
+
+
+def resolve_output_names(file_paths, settings):
+    # Returns {source path: name} for the sources whose outputs would land on a file an earlier source in
+    # the list already writes, such as two photo.jpg from different folders; the later ones become
+    # photo_2, photo_3 and so on. Only the list decides, so the same list always gets the same names and a
+    # resume given the run's full list writes exactly where the first attempt did. Files already on disk
+    # are replaced as before.
+    if settings.processing_mode == RENDITIONS_MODE:
+        # Imported here because renditions builds on this module.
+        from renditions import Rendition
+        renditions = [Rendition.from_dict(values) for values in settings.renditions]
+
+        def paths_for(file_path, name):
+            return [rendition.output_path(file_path, settings, name) for rendition in renditions]
+    else:
+        def paths_for(file_path, name):
+            return [output_path_for(file_path, settings, name)]
+
+    claimed = set()
+    names = {}
+    for file_path in file_paths:
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        name = stem
+        number = 1
+        paths = {os.path.normcase(path) for path in paths_for(file_path, name)}
+        while not claimed.isdisjoint(paths):
+            number += 1
+            name = f"{stem}_{number}"
+            paths = {os.path.normcase(path) for path in paths_for(file_path, name)}
+        claimed.update(paths)
+        if name != stem:
+            names[file_path] = name
+    return names
+
+
+def target_dimensions(size, settings):
+    if settings.processing_mode == 'convert':
+        return None
+    scale = parse_scale_factor(settings.scale_factor)
+    if settings.processing_mode == 'upscale':
+        return int(size[0] * scale), int(size[1] * scale)
+    return int(size[0] / scale), int(size[1] / scale)
+
+
+def image_format_for(target_path):
+    Image.init()
+    return Image.registered_extensions().get(os.path.splitext(target_path)[1].lower())
+
+
+def save_options(target_path, encoder_profile='default'):
+    return dict(ENCODER_PROFILES[encoder_profile].get(image_format_for(target_path), {}))
+
+
+def request_draft(img, new_dimensions, downscale_speed='quality'):
+    reducing_gap = DOWNSCALE_SPEEDS[downscale_speed]
+    if reducing_gap is not None:
+        # Only JPEG honours draft(); other formats fall through to reduce() inside resize().
+        img.draft(img.mode, (int(new_dimensions[0] * reducing_gap), int(new_dimensions[1] * reducing_gap)))
+    return reducing_gap
+
+
+def prepare_downscale(img, new_dimensions, downscale_speed='quality'):
+    reducing_gap = request_draft(img, new_dimensions, downscale_speed)
+    img.load()
+    return reducing_gap
+
+
+def bytes_per_pixel(mode):
+    # How Pillow lays pixels out in memory: one byte for the 8-bit single band modes, four for the rest.
+    return {'1': 1, 'L': 1, 'P': 1, 'I;16': 2}.get(mode, 4)
+
+
+def estimated_memory(img, new_dimensions, settings):
+    pixels = img.width * img.height
+    if new_dimensions is not None and not uses_tiling(img, new_dimensions, settings):
+        pixels += new_dimensions[0] * new_dimensions[1]
+    return pixels * bytes_per_pixel(img.mode)
+
+
+def check_memory_limit(img, new_dimensions, settings):
+    # Runs on the header alone, before any pixels are decoded, so a decompression bomb is turned away
+    # without ever being allocated.
+    if settings.memory_limit is None:
+        return
+    needed = estimated_memory(img, new_dimensions, settings)
+    if needed > settings.memory_limit:
+        raise FileMemoryError(f"{img.width}x{img.height} {img.mode} image needs about {needed // (1024 * 1024)} MB, "
+                              f"over the {settings.memory_limit // (1024 * 1024)} MB per-file limit")
+
+
+# The operations are split into decode / transform / save steps so the serial and process-pool paths
+# (run_operation) and the staged pipeline run exactly the same code.
+def check_source_format(img, settings):
+    wanted = settings.convert_from_format
+    if settings.processing_mode != 'convert' or not wanted or wanted == ANY_FORMAT:
+        return
+    info = format_for_name(wanted)
+    if info is not None and not source_format_matches(img.format, info):
+        raise SourceFormatError(f"{img.format} image, but only {info.name} files are being converted")
+
+
+def open_image(source, settings, timing=None):
+    # Everything decode_image does short of decoding the pixels, so a caller can choose where they go.
+    img = Image.open(source)
+    try:
+        check_source_format(img, settings)
+    except BaseException:
+        img.close()
+        raise
+    new_dimensions = target_dimensions(img.size, settings)
+    if timing is not None:
+        timing.input_pixels = img.width * img.height
+        timing.output_pixels = new_dimensions[0] * new_dimensions[1] if new_dimensions else timing.input_pixels
+    if settings.processing_mode == 'downscale':
+        request_draft(img, new_dimensions, settings.downscale_speed)
+    try:
+        check_memory_limit(img, new_dimensions, settings)
+    except BaseException:
+        img.close()
+        raise
+    return img, new_dimensions
+
+
+def decode_image(source, settings, timing=None):
+    img, new_dimensions = open_image(source, settings, timing)
+    try:
+        img.load()
+    except BaseException:
+        img.close()
+        raise
+    return img, new_dimensions
+
+
+def upscale_filter(resampling):
+    return RESAMPLING_FILTERS.get(resampling) or PRESET_UPSCALE_FILTERS[resampling]
+
+
+def integer_reduce_factor(size, new_dimensions):
+    # The shared factor when the target is the source divided by a whole number on both axes, once the
+    # remainder rows/columns that int() truncation dropped from the target are ignored.
+    factor = size[0] // new_dimensions[0]
+    if factor < 2 or size[1] // new_dimensions[1] != factor:
+        return None
+    if size[0] // factor != new_dimensions[0] or size[1] // factor != new_dimensions[1]:
+        return None
+    return factor
+
+
+def resample_image(img, new_dimensions, resampling='quality', reducing_gap=None):
+    if resampling in RESAMPLING_FILTERS:
+        return img.resize(new_dimensions, RESAMPLING_FILTERS[resampling], reducing_gap=reducing_gap)
+    if new_dimensions[0] > img.width:
+        return img.resize(new_dimensions, PRESET_UPSCALE_FILTERS[resampling])
+
+    if resampling == 'fast':
+        factor = integer_reduce_factor(img.size, new_dimensions)
+        if factor and img.mode in REDUCE_MODES:
+            # An exact box average, and far cheaper than any convolution.
+            return img.reduce(factor, box=(0, 0, new_dimensions[0] * factor, new_dimensions[1] * factor))
+        return img.resize(new_dimensions, Image.BILINEAR, reducing_gap=1.0)
+    if resampling == 'balanced':
+        # Box-reduce to within 2x of the target, then refine with LANCZOS.
+        return img.resize(new_dimensions, Image.LANCZOS, reducing_gap=min(reducing_gap or 2.0, 2.0))
+    return img.resize(new_dimensions, Image.LANCZOS, reducing_gap=reducing_gap)
+
+
+def uses_model(settings):
+    return settings.processing_mode == 'upscale' and bool(settings.upscale_model)
+
+
+def uses_tiling(img, new_dimensions, settings):
+    # Model upscales tile the model's input themselves.
+    return (settings.processing_mode == 'upscale' and not uses_model(settings)
+            and needs_tiling(new_dimensions, img.mode, settings.memory_budget))
+
+
+def transform_image(img, new_dimensions, settings):
+    if uses_model(settings):
+        from upscale_models import model_upscale
+        return model_upscale(img, new_dimensions, settings.upscale_model)
+    if settings.processing_mode == 'upscale':
+        return resample_image(img, new_dimensions, settings.resampling)
+    if settings.processing_mode == 'downscale':
+        return resample_image(img, new_dimensions, settings.resampling, DOWNSCALE_SPEEDS[settings.downscale_speed])
+    return img
+
+
+def encode_image(img, target_path, encoder_profile='default'):
+    buffer = io.BytesIO()
+    image_format = image_format_for(target_path)
+    compatible_image(img, image_format).save(buffer, format=image_format,
+                                             **save_options(target_path, encoder_profile))
+    return buffer.getvalue()
+
+
+def save_image(img, target_path, encoder_profile='default', fsync=False, writer=None, timing=None):
+    # Written to a temporary name and renamed into place: an interrupted run never leaves half an image,
+    # and the rename also swaps out any hardlink to a cached result instead of writing through it. With a
+    # writer the image is encoded into memory and written in the background; the write's future is returned.
+    if writer is not None:
+        return writer.submit(target_path, encode_image(img, target_path, encoder_profile), timing)
+    with atomic_path(target_path, fsync=fsync) as temp_path:
+        compatible_image(img, image_format_for(target_path)).save(temp_path,
+                                                                  **save_options(target_path, encoder_profile))
+
+
+def is_multi_frame(img, target_path):
+    return getattr(img, 'n_frames', 1) > 1 and image_format_for(target_path) in Image.SAVE_ALL
+
+
+def frame_mode(img):
+    # Palette frames are resampled in full colour, keeping alpha when the palette has a transparent
+    # entry; palette writers such as GIF quantize them again on the way out.
+    if img.mode in ('1', 'P', 'PA'):
+        return 'RGBA' if img.mode == 'PA' or 'transparency' in img.info else 'RGB'
+    return img.mode
+
+
+def iter_frames(img, new_dimensions, settings):
+    # One frame is decoded, resized and handed on at a time; convert() and resize() copy the frame's
+    # info, so per-frame durations travel with it.
+    for index in range(img.n_frames):
+        img.seek(index)
+        frame = img.convert(frame_mode(img))
+        if new_dimensions is not None:
+            frame = transform_image(frame, new_dimensions, settings)
+        yield frame
+
+
+def save_frames(img, new_dimensions, settings, target_path):
+    image_format = image_format_for(target_path)
+    options = save_options(target_path, settings.encoder_profile)
+    if 'loop' in img.info:
+        options['loop'] = img.info['loop']
+    frames = (compatible_image(frame, image_format) for frame in iter_frames(img, new_dimensions, settings))
+    with atomic_path(target_path, fsync=settings.fsync) as temp_path:
+        if image_format == 'TIFF':
+            # Each page is encoded and appended to the file before the next one is decoded.
+            with TiffImagePlugin.AppendingTiffWriter(temp_path, True) as tiff:
+                for frame in frames:
+                    frame.save(tiff, format='TIFF', **options)
+                    tiff.newFrame()
+            return
+        # Every other multi-frame writer walks the whole sequence before it encodes anything (GIF and APNG
+        # to diff frames, WebP and AVIF to build the animation), so only the source is decoded lazily.
+        frames = list(frames)
+        durations = [int(frame.info.get('duration', 0)) for frame in frames]
+        frames[0].save(temp_path, save_all=True, append_images=frames[1:], duration=durations, **options)
+
+
+def run_operation(file_path, settings, timing=None, target_path=None, writer=None):
+    # Returns the output path and, when a writer took the encoded output, the future of its write.
+    if settings.processing_mode not in PROCESSING_MODES:
+        raise ValueError(f"Unknown processing mode: {settings.processing_mode}")
+    timing = timing or FileTiming(file_path)
+
+    target_path = target_path or output_path_for(file_path, settings)
+    written = None
+    with timing.measure('decode'):
+        img, new_dimensions = decode_image(file_path, settings, timing)
+    with img:
+        if is_multi_frame(img, target_path):
+            # Frames are resized and encoded in turn, so like tiling their time is all booked as resize.
+            with timing.measure('resize'):
+                save_frames(img, new_dimensions, settings, target_path)
+        elif uses_tiling(img, new_dimensions, settings):
+            # Tiled resizes interleave resampling and encoding, so their time is all booked as resize.
+            with timing.measure('resize'), atomic_path(target_path, fsync=settings.fsync) as temp_path:
+                tiled_resize(img, new_dimensions, upscale_filter(settings.resampling), temp_path,
+                             settings.memory_budget, save_options(target_path, settings.encoder_profile))
+        else:
+            with timing.measure('resize'):
+                output = transform_image(img, new_dimensions, settings)
+            with timing.measure('encode'):
+                written = save_image(output, target_path, settings.encoder_profile, settings.fsync, writer, timing)
+    return target_path, written
+
+
+# One cache per worker process; spawned workers build theirs on first use.
+_result_caches = {}
+
+
+def get_result_cache(settings):
+    cache_id = (settings.cache_directory, settings.cache_max_bytes or DEFAULT_CACHE_BYTES)
+    if cache_id not in _result_caches:
+        _result_caches[cache_id] = ResultCache(*cache_id)
+    return _result_caches[cache_id]
+
+
+def process_file(file_path, settings, name=None, writer=None):
+    # name replaces the source's own in the output file name (see resolve_output_names). With a writer the
+    # result may come back before its output is written; its written future says when that has happened.
+    if settings.processing_mode == RENDITIONS_MODE:
+        # Imported here because renditions builds on this module.
+        from renditions import process_renditions
+        return process_renditions(file_path, settings, name, writer)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File does not exist: {file_path}")
+    timing = FileTiming(file_path, os.path.getsize(file_path))
+    target_path = output_path_for(file_path, settings, name)
+    written = cache = key = None
+
+    if settings.cache_directory is not None:
+        cache = get_result_cache(settings)
+        with timing.measure('read'):
+            key = cache.key_for(file_path, settings.cache_params(target_path))
+        with timing.measure('write'):
+            timing.cache_hit = cache.fetch(key, target_path)
+    if not timing.cache_hit:
+        _, written = run_operation(file_path, settings, timing, target_path, writer)
+
+    def finish():
+        if cache is not None and not timing.cache_hit:
+            with timing.measure('write'):
+                cache.store(key, target_path)
+        timing.output_path = target_path
+        timing.output_bytes = os.path.getsize(target_path)
+
+    result = ProcessingResult(file_path, target_path, timing.cache_hit, timing)
+    if written is None:
+        finish()
+    else:
+        result.written = writer.after([written], finish)
+    return result
+
+
+# Executors run process_file over a list of paths and yield (index, ProcessingResult, error) tuples
+# strictly in submission order, so callers see the same ordering no matter which backend is used.
+# All of them take an optional RunControl: paused runs start no new files, cancelled ones stop yielding.
+# names maps sources to output names as resolve_output_names gives them, and is worked out from file_paths
+# when not passed; a resume passes the names of the whole original run instead.
+class SerialExecutor:
+    max_workers = 1
+
+    def __init__(self, write_threads=DEFAULT_WRITE_THREADS, write_buffer_bytes=DEFAULT_WRITE_BUFFER_BYTES):
+        self.write_threads = write_threads
+        self.write_buffer_bytes = write_buffer_bytes
+
+    def run(self, file_paths, settings, control=None, names=None):
+        # Writes go to background threads so the next file decodes while the last one is still being
+        # written; results are held back until their outputs are on disk.
+        if names is None:
+            names = resolve_output_names(file_paths, settings)
+        writer = OutputWriter(self.write_threads, self.write_buffer_bytes, settings.fsync)
+        try:
+            yield from settled(self.start(file_paths, settings, control, names, writer), control)
+        finally:
+            writer.shutdown()
+
+    def start(self, file_paths, settings, control, names, writer):
+        for i, file_path in enumerate(file_paths):
+            if not should_start(control):
+                return
+            try:
+                yield i, process_file(file_path, settings, names.get(file_path), writer), None
+            except Exception as e:
+                yield i, None, e
+
+    def shutdown(self):
+        pass
+
+
+class ProcessPoolBackend:
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or default_worker_count()
+        self.pool = self.create_pool()
+
+    def create_pool(self):
+        # Spawn keeps Qt state and the QThread that owns us out of the children.
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def run(self, file_paths, settings, control=None, names=None):
+        # Keep a bounded window of in-flight futures so huge queues don't pin every path up front. With a
+        # time limit the window is one file per worker, so every submitted file is running and its clock
+        # can start at submission.
+        window = self.max_workers if settings.file_timeout else self.max_workers * 2
+        if names is None:
+            names = resolve_output_names(file_paths, settings)
+        pending = {}
+        deadlines = {}
+        next_to_submit = 0
+        for i in range(len(file_paths)):
+            while next_to_submit < len(file_paths) and next_to_submit < i + window:
+                # While paused, files already submitted still finish and are yielded; nothing new starts.
+                if control is not None and control.is_paused() and next_to_submit > i:
+                    break
+                if not should_start(control):
+                    self.terminate()
+                    return
+                pending[next_to_submit] = self.submit(next_to_submit, file_paths, settings, deadlines, names)
+                next_to_submit += 1
+
+            future = pending.pop(i)
+            deadline = deadlines.pop(i, None)
+            # Waited on in short slices so a cancel is noticed even while a long file is running.
+            while not future.done():
+                if control is not None and control.is_cancelled():
+                    self.terminate()
+                    return
+                timeout = POLL_INTERVAL
+                if deadline is not None:
+                    timeout = min(timeout, deadline - time.monotonic())
+                    if timeout <= 0:
+                        break
+                wait_futures([future], timeout=timeout)
+            if not future.done():
+                self.restart(pending, file_paths, settings, deadlines, names)
+                yield i, None, FileTimeoutError(f"gave up after {settings.file_timeout:g}s")
+                continue
+            try:
+                yield i, future.result(), None
+            except Exception as e:
+                yield i, None, e
+
+    def submit(self, i, file_paths, settings, deadlines, names):
+        if settings.file_timeout:
+            deadlines[i] = time.monotonic() + settings.file_timeout
+        # Children write their outputs themselves, synchronously; there are already several of them.
+        return self.pool.submit(process_file, file_paths[i], settings, names.get(file_paths[i]))
+
+    def restart(self, pending, file_paths, settings, deadlines, names):
+        # A worker stuck on one file can't be stopped on its own, so the pool is replaced and the files
+        # still running in its other workers start over. Outputs are renamed into place, so nothing
+        # half-written is left behind.
+        unfinished = [j for j, future in pending.items() if not future.done()]
+        self.terminate()
+        self.pool = self.create_pool()
+        for j in unfinished:
+            pending[j] = self.submit(j, file_paths, settings, deadlines, names)
+
+    def terminate(self):
+        # ProcessPoolExecutor has no public way to stop a running call, so its workers are killed outright.
+        for process in list((self.pool._processes or {}).values()):
+            process.terminate()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def create_executor(max_workers=None, backend='process', stage_workers=None, queue_size=None, batch_size=None,
+                    file_timeout=None, write_threads=None, write_buffer_bytes=None, stage_processes=None):
+    # write_threads and write_buffer_bytes size the background writer of the serial and vectorized
+    # backends; the pipeline has its own write stage and pool workers write for themselves. stage_processes
+    # names the pipeline stages that run in worker processes rather than threads.
+    if max_workers is None:
+        max_workers = default_worker_count()
+    write_threads = write_threads or DEFAULT_WRITE_THREADS
+    write_buffer_bytes = write_buffer_bytes or DEFAULT_WRITE_BUFFER_BYTES
+    if backend == 'vectorized':
+        # NumPy is optional and only needed for this backend.
+        from vector_resample import DEFAULT_BATCH_SIZE, BatchResizeExecutor
+        return BatchResizeExecutor(batch_size or DEFAULT_BATCH_SIZE, write_threads, write_buffer_bytes)
+    if backend == 'pipeline':
+        # Imported here because the pipeline builds on this module's stage functions.
+        from pipeline import PipelineExecutor, default_stage_workers
+        return PipelineExecutor({**default_stage_workers(max_workers), **(stage_workers or {})}, queue_size,
+                                stage_processes)
+    # With a time limit even a single worker runs in a child process, since only a process can be
+    # stopped partway through a file.
+    if max_workers <= 1 and not file_timeout:
+        return SerialExecutor(write_threads, write_buffer_bytes)
+    return ProcessPoolBackend(max_workers)
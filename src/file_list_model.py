@@ -0,0 +1,137 @@
+from array import array
+from bisect import bisect_left
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt, pyqtSignal
+
+RESET_RUN_THRESHOLD = 32
+
+
+class FileListModel(QAbstractListModel):
+    # Rows are kept in insertion order alongside a strictly increasing sequence number per row, so a
+    # path's current row is a dict lookup plus a binary search, and nothing is ever rescanned in Python.
+    totals_changed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.items = []
+        self.sequences = array('q')
+        self.sequence_of = {}
+        self.next_sequence = 0
+        self.total_bytes = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.items)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.items):
+            return None
+        item = self.items[index.row()]
+        if role == Qt.DisplayRole:
+            return item.displayName
+        if role == Qt.ToolTipRole:
+            # Only rows someone hovers ever have their header read.
+            header = item.image_header()
+            if header:
+                details = f", {header[0]}x{header[1]} {header[2]} {header[3]}"
+            else:
+                details = f", unreadable: {item.headerError}" if item.headerError else ""
+            return f"{item.fullPath} ({item.format_size(item.fileSize)}{details})"
+        if role == Qt.UserRole:
+            return item
+        return None
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, file_path):
+        return file_path in self.sequence_of
+
+    def item(self, row):
+        return self.items[row]
+
+    def all_items(self):
+        return list(self.items)
+
+    def items_for_rows(self, rows):
+        return [self.items[row] for row in sorted(set(rows))]
+
+    def row_of(self, file_path):
+        sequence = self.sequence_of.get(file_path)
+        return None if sequence is None else bisect_left(self.sequences, sequence)
+
+    def add_items(self, items):
+        added, duplicates = [], []
+        for item in items:
+            if item.fullPath in self.sequence_of:
+                duplicates.append(item)
+            else:
+                self.sequence_of[item.fullPath] = self.next_sequence + len(added)
+                added.append(item)
+        if added:
+            first = len(self.items)
+            self.beginInsertRows(QModelIndex(), first, first + len(added) - 1)
+            self.items.extend(added)
+            self.sequences.extend(range(self.next_sequence, self.next_sequence + len(added)))
+            self.next_sequence += len(added)
+            self.total_bytes += sum(item.fileSize for item in added)
+            self.endInsertRows()
+            self.totals_changed.emit()
+        return added, duplicates
+
+    def remove_rows(self, rows):
+        rows = sorted(set(rows), reverse=True)
+        if not rows:
+            return []
+        runs = []
+        start = 0
+        while start < len(rows):
+            end = start
+            while end + 1 < len(rows) and rows[end + 1] == rows[end] - 1:
+                end += 1
+            runs.append((rows[end], rows[start]))
+            start = end + 1
+
+        if len(runs) > RESET_RUN_THRESHOLD:
+            removed = self.remove_scattered(set(rows))
+        else:
+            # Each contiguous run is one beginRemoveRows, highest first so earlier rows keep their numbers.
+            removed = []
+            for first, last in runs:
+                self.beginRemoveRows(QModelIndex(), first, last)
+                removed.extend(self.items[first:last + 1])
+                self.forget(self.items[first:last + 1])
+                del self.items[first:last + 1]
+                del self.sequences[first:last + 1]
+                self.endRemoveRows()
+        self.totals_changed.emit()
+        return removed
+
+    def remove_scattered(self, rows):
+        # Views and selection models do per-run bookkeeping over the whole list, so thousands of scattered
+        # runs are far cheaper as a single reset with one filtering pass.
+        self.beginResetModel()
+        removed = [self.items[row] for row in sorted(rows)]
+        self.forget(removed)
+        kept = [row for row in range(len(self.items)) if row not in rows]
+        self.items = [self.items[row] for row in kept]
+        self.sequences = array('q', (self.sequences[row] for row in kept))
+        self.endResetModel()
+        return removed
+
+    def forget(self, items):
+        for item in items:
+            del self.sequence_of[item.fullPath]
+            self.total_bytes -= item.fileSize
+
+    def remove_paths(self, file_paths):
+        rows = [self.row_of(file_path) for file_path in file_paths]
+        return self.remove_rows([row for row in rows if row is not None])
+
+    def clear(self):
+        self.beginResetModel()
+        self.items = []
+        self.sequences = array('q')
+        self.sequence_of = {}
+        self.total_bytes = 0
+        self.endResetModel()
+        self.totals_changed.emit()
@@ -0,0 +1,75 @@
+import os
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def parse_extensions(text):
+    extensions = []
+    for part in text.replace(';', ',').replace(' ', ',').split(','):
+        part = part.strip().lower().lstrip('*')
+        if part:
+            extensions.append(part if part.startswith('.') else f".{part}")
+    return tuple(extensions)
+
+
+def report_skipped(path, error):
+    print(f"Skipping {path}: {error}")
+
+
+def scan_directory(root, extensions=None, recursive=True, chunk_size=DEFAULT_CHUNK_SIZE, should_stop=None,
+                   on_error=report_skipped):
+    # Yields lists of (path, name, size). scandir hands back the type and, on most platforms, the size
+    # from the directory listing itself, so this never opens a file. Symlinked directories are not
+    # followed, which keeps link cycles from turning into an endless walk. extensions defaults to every
+    # format the installed Pillow can read. Paths that can't be listed or stat'ed go to on_error, which
+    # prints them unless the caller, like the GUI, has somewhere better to show them.
+    if extensions is None:
+        from image_formats import readable_extensions
+        extensions = readable_extensions()
+    extensions = tuple(extension.lower() for extension in extensions)
+    chunk = []
+    pending = [root]
+    while pending:
+        if should_stop is not None and should_stop():
+            return
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError as e:
+            on_error(directory, e)
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file():
+                    chunk.append((entry.path, entry.name, entry.stat().st_size))
+            except OSError as e:
+                on_error(entry.path, e)
+                continue
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if recursive:
+            # Reversed so the stack pops subdirectories in name order.
+            pending.extend(reversed(subdirectories))
+    if chunk:
+        yield chunk
+
+
+def report_unreadable_header(file_path, error):
+    print(f"Could not read image header of {file_path}: {error}")
+
+
+def read_image_header(file_path, on_error=report_unreadable_header):
+    # Image.open only parses the header; pixels are decoded on load(), which never happens here.
+    from PIL import Image
+    try:
+        with Image.open(file_path) as img:
+            return img.width, img.height, img.mode, img.format
+    except Exception as e:
+        on_error(file_path, e)
+        return None
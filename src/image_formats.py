@@ -0,0 +1,114 @@
+import io
+import warnings
+from functools import lru_cache
+
+from PIL import Image
+
+# Listed first, in this order; every other format Pillow can handle follows alphabetically.
+PREFERRED_FORMATS = ('PNG', 'JPEG', 'WEBP', 'AVIF', 'TIFF', 'GIF', 'BMP', 'TGA', 'PDF')
+# The extensions shown (and the first one written) for formats whose Pillow name is not an extension.
+PREFERRED_EXTENSIONS = {'JPEG': ('jpg', 'jpeg'), 'TIFF': ('tiff', 'tif'), 'JPEG2000': ('jp2',)}
+# Pillow opens camera JPEGs with extra frames as MPO; for filtering by source format they are JPEGs.
+FORMAT_ALIASES = {'MPO': 'JPEG'}
+PROBE_MODES = ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'CMYK', 'I;16', 'I', 'F')
+
+
+class FormatInfo:
+    def __init__(self, pillow_format, extensions, readable, writable_modes, multi_frame):
+        self.pillow_format = pillow_format
+        self.extensions = extensions
+        self.name = extensions[0]
+        self.label = '/'.join(PREFERRED_EXTENSIONS.get(pillow_format, extensions[:1]))
+        self.readable = readable
+        self.writable_modes = writable_modes
+        self.multi_frame = multi_frame
+
+    @property
+    def writable(self):
+        return bool(self.writable_modes)
+
+
+@lru_cache(maxsize=None)
+def writable_modes(pillow_format):
+    # Whether a writer takes a mode is only known by trying it, so each one encodes a tiny image per
+    # mode. Plugins that are installed but missing their codec simply come back with no modes.
+    Image.init()
+    if pillow_format not in Image.SAVE:
+        return ()
+    modes = []
+    for mode in PROBE_MODES:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                Image.new(mode, (16, 16)).save(io.BytesIO(), format=pillow_format)
+        except Exception:
+            continue
+        modes.append(mode)
+    return tuple(modes)
+
+
+def format_extensions(pillow_format):
+    extensions = sorted(extension.lstrip('.') for extension, name in Image.registered_extensions().items()
+                        if name == pillow_format)
+    preferred = PREFERRED_EXTENSIONS.get(pillow_format, (pillow_format.lower(),))
+    return tuple(extension for extension in preferred if extension in extensions) + \
+        tuple(extension for extension in extensions if extension not in preferred)
+
+
+def sort_key(info):
+    if info.pillow_format in PREFERRED_FORMATS:
+        return 0, PREFERRED_FORMATS.index(info.pillow_format), ''
+    return 1, 0, info.name
+
+
+@lru_cache(maxsize=None)
+def available_formats():
+    # Discovered once per process from the plugins Pillow actually loaded, so a Pillow built with
+    # AVIF or WebP support offers them and one without never does.
+    Image.init()
+    formats = []
+    for pillow_format in set(Image.registered_extensions().values()):
+        extensions = format_extensions(pillow_format)
+        info = FormatInfo(pillow_format, extensions, pillow_format in Image.OPEN, writable_modes(pillow_format),
+                          pillow_format in Image.SAVE_ALL)
+        if info.readable or info.writable:
+            formats.append(info)
+    return tuple(sorted(formats, key=sort_key))
+
+
+def readable_formats():
+    return [info for info in available_formats() if info.readable]
+
+
+def writable_formats():
+    return [info for info in available_formats() if info.writable]
+
+
+def readable_extensions():
+    return [f".{extension}" for info in readable_formats() for extension in info.extensions]
+
+
+def format_for_name(name):
+    # Accepts any extension or label of a known format, with or without the leading dot.
+    name = name.lower().lstrip('.').split('/')[0]
+    for info in available_formats():
+        if name in info.extensions or name == info.pillow_format.lower():
+            return info
+    return None
+
+
+def source_format_matches(pillow_format, wanted):
+    return FORMAT_ALIASES.get(pillow_format, pillow_format) == wanted.pillow_format
+
+
+def compatible_image(img, pillow_format):
+    # Hands the writer an image in a mode it accepts, e.g. RGBA becomes RGB for JPEG and BMP. The
+    # alpha channel is dropped, not composited, so transparent areas keep whatever colour they hold.
+    modes = writable_modes(pillow_format)
+    if not modes or img.mode in modes:
+        return img
+    has_alpha = 'A' in img.mode or 'transparency' in img.info
+    for mode in (('RGBA', 'LA') if has_alpha else ()) + ('RGB', 'L'):
+        if mode in modes:
+            return img.convert(mode)
+    return img.convert(modes[0])
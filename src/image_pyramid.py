@@ -0,0 +1,238 @@
+import hashlib
+import json
+import math
+import mmap
+import os
+import shutil
+import tempfile
+
+from PIL import Image
+
+from thumbnails import thumbnail_key
+
+# Multi-resolution copies of an image for the comparison viewer. Each level halves the one before it, down
+# to a single tile, and is kept as raw RGBA rows in a file of its own. Levels are memory-mapped, so showing
+# a region at any zoom reads just the rows and columns it covers, however large the image is; the source
+# file is only ever decoded once, when its pyramid is built.
+
+# Bump whenever the level files change, so stale pyramids stop matching.
+PYRAMID_VERSION = 1
+DEFAULT_PYRAMID_BYTES = 2 * 1024 * 1024 * 1024
+TILE_SIZE = 256
+# Tiles are cut with this many pixels of their neighbours around them, so smoothing at a tile's edge blends
+# with the pixels beyond it rather than leaving a seam.
+TILE_MARGIN = 1
+# Rows converted and written at a time while building, so no level is ever held whole in memory.
+STRIP_ROWS = 512
+MANIFEST = 'pyramid.json'
+
+
+def default_pyramid_directory():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pyimgscale', 'pyramids')
+
+
+def level_sizes(size):
+    sizes = [size]
+    while max(sizes[-1]) > TILE_SIZE:
+        width, height = sizes[-1]
+        sizes.append((-(-width // 2), -(-height // 2)))
+    return sizes
+
+
+def level_path(directory, level):
+    return os.path.join(directory, f"level_{level}.rgba")
+
+
+def rgba_strip(strip):
+    # Higher bit depths are brought down to 8 bits rather than clipped.
+    if strip.mode.startswith('I'):
+        strip = strip.convert('I').point(lambda value: value * (1 / 256)).convert('L')
+    return strip if strip.mode == 'RGBA' else strip.convert('RGBA')
+
+
+def write_strips(path, strips, progress=None):
+    with open(path, 'wb') as f:
+        for strip in strips:
+            f.write(rgba_strip(strip).tobytes())
+            if progress is not None:
+                progress()
+
+
+def map_level(path, size):
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return buffer, Image.frombuffer('RGBA', size, buffer, 'raw', 'RGBA', 0, 1)
+
+
+def close_map(buffer):
+    try:
+        buffer.close()
+    except BufferError:
+        # An image still maps it; the memory goes once that image does.
+        pass
+
+
+def build_pyramid(file_path, directory, progress=None):
+    with Image.open(file_path) as img:
+        img.load()
+        sizes = level_sizes(img.size)
+        # Progress counts strips over all levels; each level has half the rows of the one before.
+        total = sum(-(-height // STRIP_ROWS) for _, height in sizes)
+        done = [0]
+
+        def advance():
+            done[0] += 1
+            if progress is not None:
+                progress(done[0] / total)
+
+        width, height = img.size
+        write_strips(level_path(directory, 0),
+                     (img.crop((0, y, width, min(y + STRIP_ROWS, height))) for y in range(0, height, STRIP_ROWS)),
+                     advance)
+
+    for level in range(1, len(sizes)):
+        buffer, previous = map_level(level_path(directory, level - 1), sizes[level - 1])
+        try:
+            width, height = sizes[level - 1]
+            # Strips start on even rows, so halving them one at a time gives exactly the whole level's reduce.
+            write_strips(level_path(directory, level),
+                         (previous.crop((0, y, width, min(y + 2 * STRIP_ROWS, height))).reduce(2)
+                          for y in range(0, height, 2 * STRIP_ROWS)),
+                         advance)
+        finally:
+            del previous
+            close_map(buffer)
+
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump({'version': PYRAMID_VERSION, 'source': file_path, 'sizes': sizes}, f)
+
+
+class ImagePyramid:
+    def __init__(self, key, directory, sizes):
+        self.key = key
+        self.directory = directory
+        self.sizes = [tuple(size) for size in sizes]
+        self.size = self.sizes[0]
+        self.buffers = []
+        self.levels = []
+        for level, size in enumerate(self.sizes):
+            buffer, image = map_level(level_path(directory, level), size)
+            self.buffers.append(buffer)
+            self.levels.append(image)
+
+    def level_for(self, scale):
+        # The smallest level still at least as detailed as the screen, scale being screen pixels per full
+        # resolution pixel. Past 1:1 the full resolution level is simply magnified.
+        level = 0
+        while level + 1 < len(self.sizes) and self.sizes[level + 1][0] >= self.size[0] * scale:
+            level += 1
+        return level
+
+    def level_scale(self, level):
+        # Level pixels per full resolution pixel, per axis: odd sizes round up, so the halves are not exact.
+        return self.sizes[level][0] / self.size[0], self.sizes[level][1] / self.size[1]
+
+    def tiles_for(self, level, box):
+        # The tiles of a level covering box, which is in that level's pixels.
+        width, height = self.sizes[level]
+        left, top = max(math.floor(box[0] / TILE_SIZE), 0), max(math.floor(box[1] / TILE_SIZE), 0)
+        right = min(math.ceil(box[2] / TILE_SIZE), -(-width // TILE_SIZE))
+        bottom = min(math.ceil(box[3] / TILE_SIZE), -(-height // TILE_SIZE))
+        return [(column, row) for row in range(top, bottom) for column in range(left, right)]
+
+    def tile_box(self, level, column, row):
+        width, height = self.sizes[level]
+        x, y = column * TILE_SIZE, row * TILE_SIZE
+        return x, y, min(x + TILE_SIZE, width), min(y + TILE_SIZE, height)
+
+    def tile(self, level, column, row):
+        # The tile with its margin, and where that puts the tile's own top left corner within it.
+        width, height = self.sizes[level]
+        left, top, right, bottom = self.tile_box(level, column, row)
+        box = (max(left - TILE_MARGIN, 0), max(top - TILE_MARGIN, 0),
+               min(right + TILE_MARGIN, width), min(bottom + TILE_MARGIN, height))
+        return self.levels[level].crop(box), (left - box[0], top - box[1])
+
+    def resampled_region(self, level, box, size):
+        # box is in the level's pixels and may be fractional; only the rows and columns under it are read.
+        return self.levels[level].resize(size, Image.LANCZOS, box=box)
+
+    def close(self):
+        self.levels = []
+        for buffer in self.buffers:
+            close_map(buffer)
+        self.buffers = []
+
+
+class PyramidCache:
+    def __init__(self, directory=None, max_bytes=DEFAULT_PYRAMID_BYTES):
+        self.directory = directory or default_pyramid_directory()
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key_for(self, file_path):
+        path, mtime_ns, size = thumbnail_key(file_path)
+        encoded = json.dumps({'version': PYRAMID_VERSION, 'source': os.path.abspath(path), 'mtime_ns': mtime_ns,
+                              'size': size}, sort_keys=True)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def open(self, file_path, progress=None, keep=()):
+        key = self.key_for(file_path)
+        directory = self.entry_path(key)
+        manifest_path = os.path.join(directory, MANIFEST)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            # The manifest's mtime doubles as the LRU timestamp.
+            os.utime(manifest_path)
+        except (OSError, ValueError):
+            manifest = self.build(file_path, directory, progress)
+            self.evict(keep=set(keep) | {key})
+        return ImagePyramid(key, directory, manifest['sizes'])
+
+    def build(self, file_path, directory, progress):
+        # Built next to its final place and renamed in, so a crash mid-build never leaves a partial pyramid.
+        temp_directory = tempfile.mkdtemp(dir=self.directory, prefix='.build.')
+        try:
+            build_pyramid(file_path, temp_directory, progress)
+            shutil.rmtree(directory, ignore_errors=True)
+            os.replace(temp_directory, directory)
+        except BaseException:
+            shutil.rmtree(temp_directory, ignore_errors=True)
+            raise
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+
+    def entries(self):
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or entry.name.startswith('.'):
+                continue
+            try:
+                size = sum(level.stat().st_size for level in os.scandir(entry.path))
+                mtime = os.stat(os.path.join(entry.path, MANIFEST)).st_mtime
+            except FileNotFoundError:
+                continue
+            yield entry.name, size, mtime
+
+    def total_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=()):
+        # Pyramids still open are never removed; on Windows their mapped files could not be deleted anyway.
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total_bytes = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if key in keep:
+                continue
+            shutil.rmtree(self.entry_path(key), ignore_errors=True)
+            total_bytes -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
@@ -0,0 +1,135 @@
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager
+
+TIMED_STEPS = ('read', 'decode', 'resize', 'encode', 'write')
+
+
+class FileTiming:
+    def __init__(self, source_path, input_bytes=0):
+        self.source_path = source_path
+        self.output_path = None
+        self.input_bytes = input_bytes
+        self.output_bytes = 0
+        self.input_pixels = 0
+        self.output_pixels = 0
+        self.cache_hit = False
+        # Pixel bytes handed between pipeline stages in different processes: copied on the way, or passed
+        # over in shared memory without a copy. Both stay 0 where every stage runs in one process.
+        self.copied_bytes = 0
+        self.shared_bytes = 0
+        self.seconds = dict.fromkeys(TIMED_STEPS, 0.0)
+
+    @contextmanager
+    def measure(self, step):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[step] += time.perf_counter() - start
+
+    def total_seconds(self):
+        return sum(self.seconds.values())
+
+    def as_dict(self):
+        row = {
+            'source_path': self.source_path,
+            'output_path': self.output_path,
+            'cache_hit': self.cache_hit,
+            'input_bytes': self.input_bytes,
+            'output_bytes': self.output_bytes,
+            'input_pixels': self.input_pixels,
+            'output_pixels': self.output_pixels,
+            'copied_bytes': self.copied_bytes,
+            'shared_bytes': self.shared_bytes,
+        }
+        row.update({f"{step}_seconds": round(self.seconds[step], 6) for step in TIMED_STEPS})
+        row['total_seconds'] = round(self.total_seconds(), 6)
+        return row
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+
+class RunStats:
+    def __init__(self, total_files, total_bytes):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.processed_files = 0
+        self.processed_bytes = 0
+        self.input_pixels = 0
+        self.output_pixels = 0
+        self.failed_files = 0
+        self.timings = []
+        self.failures = []
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+    def record(self, timing, failure=None):
+        self.processed_files += 1
+        self.processed_bytes += timing.input_bytes
+        if failure is not None:
+            self.failed_files += 1
+            self.failures.append(failure)
+            return
+        self.input_pixels += timing.input_pixels
+        self.output_pixels += timing.output_pixels
+        self.timings.append(timing)
+
+    def finish(self):
+        self.end_time = time.perf_counter()
+
+    def elapsed(self):
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    def fraction_done(self):
+        # Weighted by bytes so one 200 MB file counts for more than a handful of 50 KB ones.
+        if self.total_bytes:
+            return min(1.0, self.processed_bytes / self.total_bytes)
+        return self.processed_files / self.total_files if self.total_files else 1.0
+
+    def eta_seconds(self):
+        fraction = self.fraction_done()
+        if fraction <= 0:
+            return None
+        return self.elapsed() * (1 - fraction) / fraction
+
+    def megapixels_per_second(self):
+        elapsed = self.elapsed()
+        return self.input_pixels / 1e6 / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return {
+            'total_files': self.total_files,
+            'processed_files': self.processed_files,
+            'failed_files': self.failed_files,
+            'total_bytes': self.total_bytes,
+            'processed_bytes': self.processed_bytes,
+            'input_megapixels': round(self.input_pixels / 1e6, 3),
+            'output_megapixels': round(self.output_pixels / 1e6, 3),
+            'elapsed_seconds': round(self.elapsed(), 3),
+            'megapixels_per_second': round(self.megapixels_per_second(), 3),
+        }
+
+    def write_report(self, report_path, metadata=None):
+        rows = [timing.as_dict() for timing in self.timings]
+        if os.path.splitext(report_path)[1].lower() == '.csv':
+            with open(report_path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(FileTiming('').as_dict()))
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(report_path, 'w') as f:
+                json.dump({'run': {**(metadata or {}), **self.summary()}, 'files': rows,
+                           'failures': [failure.as_dict() for failure in self.failures]}, f, indent=2)
+        return report_path
@@ -0,0 +1,110 @@
+import http.client
+import json
+import os
+import socket
+
+from job_journal import default_journal_path
+
+DEFAULT_PORT = 8765
+
+
+def default_server_address():
+    # A Unix socket next to the job journal where the platform has them: only its owner can connect,
+    # which matters for a server that reads and writes files on its clients' say-so.
+    if hasattr(socket, 'AF_UNIX'):
+        return os.path.join(os.path.dirname(default_journal_path()), 'server.sock')
+    return f"127.0.0.1:{DEFAULT_PORT}"
+
+
+def parse_address(address):
+    # A path (anything with a slash) is a Unix socket; otherwise host:port, or just a port on localhost.
+    if os.sep in address or '/' in address:
+        return 'unix', address
+    host, _, port = address.rpartition(':')
+    try:
+        return 'tcp', (host or '127.0.0.1', int(port))
+    except ValueError:
+        raise ValueError(f"invalid server address '{address}', give a socket path or host:port") from None
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class JobServerError(Exception):
+    pass
+
+
+class JobClient:
+    # Talks to a job server (see job_server.py). Only needs the standard library, so thin clients such as
+    # build scripts never import the processing engine.
+    def __init__(self, address=None, timeout=30):
+        self.address = address or default_server_address()
+        self.kind, self.target = parse_address(self.address)
+        self.timeout = timeout
+
+    def connect(self, timeout):
+        if self.kind == 'unix':
+            return UnixHTTPConnection(self.target, timeout)
+        return http.client.HTTPConnection(*self.target, timeout=timeout)
+
+    def open(self, method, path, body=None, timeout=None):
+        connection = self.connect(timeout)
+        headers = {}
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise ConnectionError(f"no job server at {self.address} ({e})") from e
+        if response.status >= 400:
+            try:
+                message = json.loads(response.read()).get('error')
+            except ValueError:
+                message = None
+            connection.close()
+            raise JobServerError(message or f"{response.status} {response.reason}")
+        return connection, response
+
+    def request(self, method, path, body=None):
+        connection, response = self.open(method, path, body, self.timeout)
+        try:
+            return json.loads(response.read())
+        finally:
+            connection.close()
+
+    def submit(self, settings, file_paths, priority='normal'):
+        return self.request('POST', '/jobs', {'settings': settings, 'files': file_paths, 'priority': priority})
+
+    def jobs(self):
+        return self.request('GET', '/jobs')['jobs']
+
+    def status(self, job_id):
+        return self.request('GET', f"/jobs/{job_id}")
+
+    def results(self, job_id):
+        return self.request('GET', f"/jobs/{job_id}/results")
+
+    def cancel(self, job_id):
+        return self.request('POST', f"/jobs/{job_id}/cancel")
+
+    def events(self, job_id, after=0):
+        # Progress events as they happen, one JSON object per line, ending with the job's 'finished' event.
+        connection, response = self.open('GET', f"/jobs/{job_id}/events?after={after}")
+        try:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            connection.close()
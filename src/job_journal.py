@@ -0,0 +1,155 @@
+import json
+import os
+import sqlite3
+import time
+
+# Runs beyond this many finished ones are pruned, oldest first, whenever a new run starts.
+MAX_FINISHED_RUNS = 50
+# Per-file status updates are committed in groups; a crash loses at most this window, and those files
+# are simply redone on resume since their outputs are only ever renamed into place once complete.
+COMMIT_INTERVAL = 1.0
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    status TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    source_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    output_path TEXT,
+    error TEXT,
+    PRIMARY KEY (run_id, position)
+);
+CREATE INDEX IF NOT EXISTS files_by_path ON files (run_id, source_path);
+"""
+
+
+def default_journal_path():
+    base = os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    return os.path.join(base, 'pyimgscale', 'journal.sqlite3')
+
+
+class JournalRun:
+    def __init__(self, row):
+        self.id, self.origin, self.status, settings, self.created, self.updated = row
+        self.settings = json.loads(settings)
+
+
+class JobJournal:
+    # SQLite connections belong to the thread that opened them, so open the journal where it is used.
+    def __init__(self, path=None):
+        self.path = path or default_journal_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('PRAGMA foreign_keys=ON')
+        self.connection.executescript(SCHEMA)
+        self.last_commit = time.monotonic()
+
+    def start_run(self, file_paths, settings, origin):
+        now = time.time()
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (origin, status, settings, created, updated) VALUES (?, ?, ?, ?, ?)',
+                (origin, 'running', json.dumps(settings), now, now))
+            run_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO files (run_id, position, source_path, status) VALUES (?, ?, ?, ?)',
+                ((run_id, position, file_path, PENDING) for position, file_path in enumerate(file_paths)))
+        self.prune()
+        return run_id
+
+    def resume_run(self, run_id):
+        with self.connection:
+            self.connection.execute('UPDATE runs SET status = ?, updated = ? WHERE id = ?',
+                                    ('running', time.time(), run_id))
+
+    def mark_done(self, run_id, source_path, output_path):
+        self.connection.execute(
+            'UPDATE files SET status = ?, output_path = ?, error = NULL WHERE run_id = ? AND source_path = ?',
+            (DONE, output_path, run_id, source_path))
+        self.commit_if_due()
+
+    def mark_failed(self, run_id, source_path, error):
+        self.connection.execute('UPDATE files SET status = ?, error = ? WHERE run_id = ? AND source_path = ?',
+                                (FAILED, str(error), run_id, source_path))
+        self.commit_if_due()
+
+    def commit_if_due(self):
+        if time.monotonic() - self.last_commit >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.last_commit = time.monotonic()
+
+    def finish_run(self, run_id, interrupted=False):
+        # A run is only finished once every file is done; failures stay resumable.
+        remaining = self.connection.execute('SELECT COUNT(*) FROM files WHERE run_id = ? AND status != ?',
+                                            (run_id, DONE)).fetchone()[0]
+        status = 'interrupted' if interrupted else 'completed' if remaining == 0 else 'failed'
+        with self.connection:
+            self.connection.execute('UPDATE runs SET status = ?, updated = ? WHERE id = ?',
+                                    (status, time.time(), run_id))
+        self.last_commit = time.monotonic()
+        return status
+
+    def abandon_run(self, run_id):
+        with self.connection:
+            self.connection.execute('UPDATE runs SET status = ?, updated = ? WHERE id = ?',
+                                    ('abandoned', time.time(), run_id))
+
+    def get_run(self, run_id):
+        row = self.connection.execute('SELECT * FROM runs WHERE id = ?', (run_id,)).fetchone()
+        return JournalRun(row) if row else None
+
+    def latest_unfinished_run(self, origin=None):
+        # 'running' here means the process that owned the run died without finishing it.
+        query = "SELECT * FROM runs WHERE status IN ('running', 'interrupted', 'failed')"
+        params = ()
+        if origin is not None:
+            query += ' AND origin = ?'
+            params = (origin,)
+        row = self.connection.execute(query + ' ORDER BY id DESC LIMIT 1', params).fetchone()
+        return JournalRun(row) if row else None
+
+    def list_runs(self, limit=20):
+        rows = self.connection.execute(
+            "SELECT runs.*, SUM(files.status = 'done'), COUNT(files.position) FROM runs "
+            "LEFT JOIN files ON files.run_id = runs.id GROUP BY runs.id ORDER BY runs.id DESC LIMIT ?",
+            (limit,)).fetchall()
+        return [(JournalRun(row[:6]), row[6] or 0, row[7]) for row in rows]
+
+    def files(self, run_id, statuses=None):
+        query = 'SELECT source_path, status, output_path FROM files WHERE run_id = ?'
+        params = [run_id]
+        if statuses:
+            query += f" AND status IN ({', '.join('?' * len(statuses))})"
+            params.extend(statuses)
+        return self.connection.execute(query + ' ORDER BY position', params).fetchall()
+
+    def unfinished_files(self, run_id):
+        return [source_path for source_path, _, _ in self.files(run_id, (PENDING, FAILED))]
+
+    def prune(self):
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM runs WHERE status IN ('completed', 'abandoned') AND id NOT IN "
+                "(SELECT id FROM runs WHERE status IN ('completed', 'abandoned') ORDER BY id DESC LIMIT ?)",
+                (MAX_FINISHED_RUNS,))
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
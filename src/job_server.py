@@ -0,0 +1,458 @@
+import ipaddress
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait as wait_futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+from engine import (POLL_INTERVAL, PROCESSING_MODES, RENDITIONS_MODE, ProcessPoolBackend, ProcessingSettings,
+                    check_name_template, default_worker_count, normalize_format, parse_scale_factor, process_file,
+                    resolve_output_names)
+from instrumentation import FileTiming, RunStats
+from job_client import default_server_address, parse_address
+from job_journal import JobJournal
+from processing_options import PRIORITIES
+from run_control import FileTimeoutError, failure_record
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED_STATES = ('completed', 'failed', 'cancelled', 'interrupted')
+# Finished jobs beyond this many are forgotten, oldest first; the job journal keeps the longer record.
+MAX_FINISHED_JOBS = 100
+# How often an event stream wakes up to look again while its job is quiet.
+STREAM_WAIT = 1.0
+
+
+def warm_up():
+    # Run once in every pool worker at startup, so the first job doesn't pay for the imports.
+    Image.init()
+    return os.getpid()
+
+
+def check_settings(settings):
+    # The checks the command line makes before a run, for settings that arrive over the API instead.
+    if settings.processing_mode not in PROCESSING_MODES + (RENDITIONS_MODE,):
+        raise ValueError(f"unknown processing mode '{settings.processing_mode}'")
+    if not os.path.isabs(settings.save_directory or ''):
+        raise ValueError("save_directory must be an absolute path")
+    if settings.processing_mode == 'convert':
+        if normalize_format(settings.convert_to_format or '') is None:
+            raise ValueError(f"unsupported format '{settings.convert_to_format}'")
+    elif settings.processing_mode == RENDITIONS_MODE:
+        if not settings.renditions:
+            raise ValueError("a renditions job needs renditions")
+    else:
+        try:
+            if parse_scale_factor(settings.scale_factor) <= 0:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"invalid scale factor '{settings.scale_factor}'") from None
+    if settings.name_template is not None:
+        check_name_template(settings.name_template, settings.processing_mode)
+    if settings.upscale_model is not None and not os.path.isfile(settings.upscale_model):
+        raise ValueError(f"upscale model {settings.upscale_model} does not exist on the server")
+
+
+class Job:
+    def __init__(self, job_id, settings, file_paths, priority):
+        self.id = job_id
+        self.settings = settings
+        self.file_paths = file_paths
+        self.names = resolve_output_names(file_paths, settings)
+        self.priority = priority
+        self.status = QUEUED
+        self.cancelled = False
+        self.created = time.time()
+        self.run_id = None
+        # Index of the next file to start, and how many of this job's files are in the pool right now.
+        self.next_file = 0
+        self.running = 0
+        self.pass_value = 0.0
+        self.file_sizes = [os.path.getsize(path) if os.path.isfile(path) else 0 for path in file_paths]
+        self.stats = RunStats(len(file_paths), sum(self.file_sizes))
+        self.results = [{'source': path, 'status': 'pending'} for path in file_paths]
+        self.cache_hits = 0
+        self.skipped = 0
+        self.events = []
+
+    def runnable(self):
+        return not self.cancelled and self.next_file < len(self.file_paths)
+
+    def is_finished(self):
+        return self.status in FINISHED_STATES
+
+    def progress(self):
+        eta = self.stats.eta_seconds()
+        return {'done': self.stats.processed_files - self.stats.failed_files - self.skipped,
+                'failed': self.stats.failed_files, 'skipped': self.skipped, 'total': len(self.file_paths),
+                'fraction_done': round(self.stats.fraction_done(), 4),
+                'eta_seconds': round(eta, 1) if eta is not None and not self.is_finished() else None}
+
+    def as_dict(self):
+        return {'id': self.id, 'status': self.status, 'priority': self.priority,
+                'processing_mode': self.settings.processing_mode, 'save_directory': self.settings.save_directory,
+                'run_id': self.run_id, 'created': self.created, 'running': self.running,
+                'cache_hits': self.cache_hits, 'elapsed_seconds': round(self.stats.elapsed(), 3),
+                'megapixels_per_second': round(self.stats.megapixels_per_second(), 3), **self.progress()}
+
+
+class JobScheduler:
+    # Runs every client's jobs on one shared, warm process pool. Files are handed to the pool one at a
+    # time, as workers free up, so a job submitted while a big one is running starts straight away
+    # instead of queueing behind it. A single dispatcher thread owns the pool and the job journal; the
+    # HTTP threads only add jobs, flag cancels and read state, all under self.condition.
+    def __init__(self, max_workers=None, journal_path=None, use_journal=True):
+        self.max_workers = max_workers or default_worker_count()
+        self.journal_path = journal_path
+        self.use_journal = use_journal
+        self.backend = ProcessPoolBackend(self.max_workers)
+        self.jobs = {}
+        self.next_id = 1
+        self.virtual_time = 0.0
+        self.stopping = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.dispatch, name='job-dispatcher', daemon=True)
+
+    def start(self):
+        wait_futures([self.backend.pool.submit(warm_up) for _ in range(self.max_workers)])
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def submit(self, settings, file_paths, priority='normal'):
+        job = Job(None, settings, file_paths, priority)
+        with self.condition:
+            job.id = self.next_id
+            self.next_id += 1
+            # A new job starts level with whatever is running now rather than with the credit of a job
+            # that has been waiting all along.
+            job.pass_value = self.virtual_time
+            self.jobs[job.id] = job
+            self.add_event(job, 'queued')
+            self.prune()
+            self.condition.notify_all()
+            return job
+
+    def cancel(self, job):
+        # Files already in the pool finish; the rest never start.
+        with self.condition:
+            if not job.is_finished():
+                job.cancelled = True
+                self.condition.notify_all()
+
+    def add_event(self, job, event, **fields):
+        job.events.append({'event': event, 'job': job.id, 'seq': len(job.events) + 1, **fields})
+        self.condition.notify_all()
+
+    def prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished()]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def next_job(self):
+        # Stride scheduling: each file a job starts advances its pass by 1 / its priority weight, and the
+        # runnable job with the lowest pass goes next. Waiting jobs therefore share the pool in proportion
+        # to their weights (4:2:1 for high:normal:low), equal jobs take turns file by file, and a low
+        # priority job still moves while higher ones run.
+        candidates = [job for job in self.jobs.values() if job.runnable()]
+        if not candidates:
+            return None
+        job = min(candidates, key=lambda job: (job.pass_value, job.id))
+        self.virtual_time = job.pass_value
+        job.pass_value += 1 / PRIORITIES[job.priority]
+        return job
+
+    def start_file(self, job, index, in_flight):
+        settings = job.settings
+        deadline = time.monotonic() + settings.file_timeout if settings.file_timeout else None
+        file_path = job.file_paths[index]
+        future = self.backend.pool.submit(process_file, file_path, settings, job.names.get(file_path))
+        in_flight[future] = (job, index, deadline)
+
+    def dispatch(self):
+        journal = JobJournal(self.journal_path) if self.use_journal else None
+        in_flight = {}
+        try:
+            while True:
+                with self.condition:
+                    if self.stopping:
+                        return
+                    self.update_jobs(journal)
+                    while len(in_flight) < self.max_workers:
+                        job = self.next_job()
+                        if job is None:
+                            break
+                        if job.status == QUEUED:
+                            job.status = RUNNING
+                            job.stats.start_time = time.perf_counter()
+                            self.add_event(job, 'started')
+                        job.running += 1
+                        job.next_file += 1
+                        self.start_file(job, job.next_file - 1, in_flight)
+                    if not in_flight:
+                        self.condition.wait()
+                        continue
+                done, _ = wait_futures(list(in_flight), timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                with self.condition:
+                    for future in done:
+                        job, index, _ = in_flight.pop(future)
+                        try:
+                            self.record(job, index, future.result(), None, journal)
+                        except Exception as e:
+                            self.record(job, index, None, e, journal)
+                    now = time.monotonic()
+                    expired = [future for future, (_, _, deadline) in in_flight.items()
+                               if deadline is not None and deadline <= now and not future.done()]
+                    if expired:
+                        self.restart(in_flight, expired, journal)
+        finally:
+            self.backend.terminate()
+            with self.condition:
+                for job in self.jobs.values():
+                    if not job.is_finished():
+                        job.running = 0
+                        self.finish(job, journal, 'interrupted')
+            if journal is not None:
+                journal.close()
+
+    def restart(self, in_flight, expired, journal):
+        # Same as ProcessPoolBackend.restart: the pool goes, and other jobs' files that were running in it
+        # start over in the new one.
+        for future in expired:
+            job, index, _ = in_flight.pop(future)
+            self.record(job, index, None, FileTimeoutError(f"gave up after {job.settings.file_timeout:g}s"),
+                        journal)
+        unfinished = [(job, index) for future, (job, index, _) in in_flight.items()]
+        in_flight.clear()
+        self.backend.terminate()
+        self.backend.pool = self.backend.create_pool()
+        for job, index in unfinished:
+            self.start_file(job, index, in_flight)
+
+    def update_jobs(self, journal):
+        for job in self.jobs.values():
+            if job.is_finished():
+                continue
+            if journal is not None and job.run_id is None:
+                # Recorded as soon as the dispatcher sees it, so a job the server never got to is still
+                # there for 'pyimgscale resume' after a crash.
+                job.run_id = journal.start_run(job.file_paths, job.settings.as_dict(), 'server')
+            if job.running == 0 and (job.cancelled or job.next_file == len(job.file_paths)):
+                self.finish(job, journal, 'cancelled' if job.cancelled else
+                            'failed' if job.stats.failed_files else 'completed')
+        self.prune()
+
+    def finish(self, job, journal, status):
+        job.status = status
+        job.stats.finish()
+        if journal is not None and job.run_id is not None:
+            journal.finish_run(job.run_id, interrupted=status in ('cancelled', 'interrupted'))
+        self.add_event(job, 'finished', **job.as_dict())
+
+    def record(self, job, index, result, error, journal):
+        job.running -= 1
+        file_path = job.file_paths[index]
+        if error is None:
+            job.cache_hits += result.cache_hit
+            job.stats.record(result.timing)
+            if journal is not None:
+                journal.mark_done(job.run_id, file_path, result.output_path)
+            entry = {'source': file_path, 'status': 'done', 'outputs': result.output_paths,
+                     'cache_hit': result.cache_hit}
+        else:
+            failure = failure_record(file_path, error)
+            if failure.kind == 'skipped':
+                # Filtered out by convert_from_format; done as far as a resume is concerned.
+                job.skipped += 1
+                job.stats.record(FileTiming(file_path, job.file_sizes[index]))
+                if journal is not None:
+                    journal.mark_done(job.run_id, file_path, None)
+            else:
+                job.stats.record(FileTiming(file_path, job.file_sizes[index]), failure)
+                if journal is not None:
+                    journal.mark_failed(job.run_id, file_path, failure)
+            entry = {'source': file_path, 'status': 'skipped' if failure.kind == 'skipped' else 'failed',
+                     'error': {'kind': failure.kind, 'message': failure.message}}
+        job.results[index] = entry
+        self.add_event(job, 'file', index=index, **entry, **job.progress())
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    # GET /jobs, POST /jobs, GET /jobs/ID, GET /jobs/ID/results, GET /jobs/ID/events?after=N (NDJSON,
+    # streamed until the job finishes) and POST /jobs/ID/cancel. Everything else is JSON both ways.
+    server_version = 'pyimgscale'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, value, status=200):
+        body = json.dumps(value).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json({'error': message}, status)
+
+    def route(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        if not parts or parts[0] != 'jobs' or len(parts) > 3:
+            return None, None, url
+        if len(parts) == 1:
+            return None, '', url
+        with self.server.scheduler.condition:
+            job = self.server.scheduler.jobs.get(int(parts[1])) if parts[1].isdigit() else None
+        if job is None:
+            return None, None, url
+        return job, parts[2] if len(parts) == 3 else '', url
+
+    def do_GET(self):
+        scheduler = self.server.scheduler
+        job, action, url = self.route()
+        if action is None:
+            self.send_error_json(404, f"no such job or resource: {url.path}")
+        elif job is None:
+            with scheduler.condition:
+                self.send_json({'jobs': [job.as_dict() for job in scheduler.jobs.values()]})
+        elif action == '':
+            with scheduler.condition:
+                self.send_json(job.as_dict())
+        elif action == 'results':
+            with scheduler.condition:
+                self.send_json({'job': job.as_dict(), 'files': list(job.results)})
+        elif action == 'events':
+            after = parse_qs(url.query).get('after', ['0'])[0]
+            self.stream_events(job, int(after) if after.isdigit() else 0)
+        else:
+            self.send_error_json(404, f"no such resource: {url.path}")
+
+    def do_POST(self):
+        scheduler = self.server.scheduler
+        job, action, url = self.route()
+        if action == '' and job is None:
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                settings = ProcessingSettings.from_dict(body['settings'])
+                file_paths = body['files']
+                priority = body.get('priority', 'normal')
+                if priority not in PRIORITIES:
+                    raise ValueError(f"unknown priority '{priority}', use {', '.join(PRIORITIES)}")
+                if not file_paths or not all(isinstance(path, str) and os.path.isabs(path) for path in file_paths):
+                    raise ValueError("files must be a non-empty list of absolute paths")
+                check_settings(settings)
+                os.makedirs(settings.save_directory, exist_ok=True)
+            except (KeyError, TypeError, ValueError, OSError) as e:
+                self.send_error_json(400, f"invalid job: {e}")
+                return
+            job = scheduler.submit(settings, file_paths, priority)
+            with scheduler.condition:
+                self.send_json(job.as_dict(), 201)
+        elif job is not None and action == 'cancel':
+            scheduler.cancel(job)
+            with scheduler.condition:
+                self.send_json(job.as_dict())
+        else:
+            self.send_error_json(404, f"no such job or resource: {url.path}")
+
+    def stream_events(self, job, after):
+        # HTTP/1.0 with no length: the stream ends when the server closes it, after the 'finished' event.
+        scheduler = self.server.scheduler
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        position = after
+        while True:
+            with scheduler.condition:
+                scheduler.condition.wait_for(lambda: len(job.events) > position or scheduler.stopping,
+                                             timeout=STREAM_WAIT)
+                events = job.events[position:]
+                finished = job.is_finished()
+            for event in events:
+                self.wfile.write(json.dumps(event).encode() + b'\n')
+            self.wfile.flush()
+            position += len(events)
+            if finished and position >= len(job.events):
+                return
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = False
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        os.chmod(self.server_address, 0o600)
+
+
+def check_loopback(host):
+    # Jobs name any file the server's user can read or write and there is no authentication, so TCP is only
+    # served on this machine's loopback interface; every address the host resolves to must be one.
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)}
+    except socket.gaierror as e:
+        raise ValueError(f"cannot resolve '{host}': {e}") from None
+    if not all(ipaddress.ip_address(address.split('%')[0]).is_loopback for address in addresses):
+        raise ValueError(f"refusing to listen on '{host}': the job server has no authentication and only serves "
+                         f"TCP on localhost; use a loopback address or a Unix socket")
+
+
+def create_server(address, scheduler):
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        if os.path.exists(target):
+            # Left behind by a server that didn't shut down cleanly, unless one is still answering on it.
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(target)
+            except OSError:
+                os.unlink(target)
+            else:
+                raise OSError(f"a job server is already listening on {target}")
+            finally:
+                probe.close()
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        server = ThreadingUnixHTTPServer(target, JobRequestHandler)
+    else:
+        check_loopback(target[0])
+        server = ThreadingHTTPServer(target, JobRequestHandler)
+        # Closing the server waits for its request threads, so event streams get to send 'finished'.
+        server.daemon_threads = False
+    server.scheduler = scheduler
+    return server
+
+
+def serve(address=None, max_workers=None, journal_path=None, use_journal=True):
+    # Blocks until interrupted (Ctrl+C or SIGTERM). Unfinished jobs are then recorded as interrupted in
+    # the journal, where 'pyimgscale resume' picks them up.
+    address = address or default_server_address()
+    scheduler = JobScheduler(max_workers, journal_path, use_journal)
+    server = create_server(address, scheduler)
+    previous_handler = signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        scheduler.start()
+        print(f"Job server listening on {address} with {scheduler.max_workers} worker(s)", flush=True)
+        server.serve_forever(poll_interval=0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+        scheduler.stop()
+        server.server_close()
+        if parse_address(address)[0] == 'unix' and os.path.exists(address):
+            os.unlink(address)
+        print("Job server stopped")
+    return 0
@@ -0,0 +1,60 @@
+import importlib.util
+import os
+from functools import lru_cache
+
+from result_cache import hash_file
+
+# Where upscale models are found and what they are. Kept apart from the inference code in upscale_models.py
+# so listing models, as the GUI does at startup, needs neither NumPy nor onnxruntime.
+MODEL_BACKENDS = {'.onnx': 'onnx', '.npz': 'numpy'}
+
+
+def default_models_directory():
+    base = os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(base, 'pyimgscale', 'models')
+
+
+def onnx_available():
+    return importlib.util.find_spec('onnxruntime') is not None
+
+
+class ModelInfo:
+    def __init__(self, path):
+        self.path = path
+        self.name, extension = os.path.splitext(os.path.basename(path))
+        self.backend = MODEL_BACKENDS[extension.lower()]
+
+    @property
+    def usable(self):
+        return self.backend != 'onnx' or onnx_available()
+
+
+def available_models(directory=None):
+    directory = directory or default_models_directory()
+    try:
+        entries = sorted(os.listdir(directory))
+    except OSError:
+        return []
+    return [ModelInfo(os.path.join(directory, entry)) for entry in entries
+            if os.path.splitext(entry)[1].lower() in MODEL_BACKENDS]
+
+
+def resolve_model(name, directory=None):
+    # A model file, or the name of one in the models directory; returns its absolute path.
+    if os.path.isfile(name):
+        info = ModelInfo(os.path.abspath(name)) if os.path.splitext(name)[1].lower() in MODEL_BACKENDS else None
+    else:
+        info = next((info for info in available_models(directory) if info.name == name), None)
+    if info is None:
+        names = ', '.join(info.name for info in available_models(directory)) or 'none installed'
+        raise ValueError(f"unknown upscale model '{name}' (models in {directory or default_models_directory()}: "
+                         f"{names}; .onnx and .npz files can also be given by path)")
+    if not info.usable:
+        raise ValueError(f"{info.name} is an ONNX model and needs onnxruntime (pip install onnxruntime)")
+    return info.path
+
+
+@lru_cache(maxsize=None)
+def model_digest(path):
+    # What the result cache keys a model by, so retraining a model under the same name is noticed.
+    return hash_file(path)
@@ -0,0 +1,100 @@
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from atomic_files import write_bytes_atomic
+
+DEFAULT_WRITE_THREADS = 4
+DEFAULT_WRITE_BUFFER_BYTES = 256 * 1024 * 1024
+
+
+class OutputWriter:
+    # Encoded outputs are handed over as bytes and written on a few I/O threads, so the next file is
+    # already decoding while slow storage (a network share, say) catches up. submit() blocks once
+    # max_buffer_bytes are waiting to be written, which bounds the memory held no matter how slow the
+    # disk is. Every write is atomic; fsync trades speed for outputs that survive a power cut.
+    def __init__(self, threads=DEFAULT_WRITE_THREADS, max_buffer_bytes=DEFAULT_WRITE_BUFFER_BYTES, fsync=False):
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='output-writer')
+        self.max_buffer_bytes = max_buffer_bytes
+        self.fsync = fsync
+        self.buffered_bytes = 0
+        self.condition = threading.Condition()
+
+    def submit(self, target_path, data, timing=None):
+        size = len(data)
+        with self.condition:
+            # A buffer bigger than the whole budget still goes through, once nothing else is waiting.
+            self.condition.wait_for(lambda: self.buffered_bytes == 0
+                                    or self.buffered_bytes + size <= self.max_buffer_bytes)
+            self.buffered_bytes += size
+        return self.pool.submit(self.write, target_path, data, timing)
+
+    def write(self, target_path, data, timing):
+        try:
+            if timing is None:
+                write_bytes_atomic(target_path, data, self.fsync)
+            else:
+                with timing.measure('write'):
+                    write_bytes_atomic(target_path, data, self.fsync)
+        finally:
+            with self.condition:
+                self.buffered_bytes -= len(data)
+                self.condition.notify_all()
+
+    def after(self, futures, function):
+        # A future for function(), run on whichever I/O thread finishes the last of futures, and failed
+        # with the first error among them instead if any write failed.
+        chained = Future()
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def finished(_):
+            if futures:
+                with lock:
+                    remaining[0] -= 1
+                    if remaining[0]:
+                        return
+            errors = [future.exception() for future in futures if future.exception() is not None]
+            try:
+                if errors:
+                    raise errors[0]
+                chained.set_result(function())
+            except BaseException as e:
+                chained.set_exception(e)
+
+        if not futures:
+            finished(None)
+        for future in futures:
+            future.add_done_callback(finished)
+        return chained
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+def is_settled(entry):
+    result = entry[1]
+    return result is None or result.written is None or result.written.done()
+
+
+def settle(entry):
+    i, result, error = entry
+    if result is not None and result.written is not None:
+        try:
+            result.written.result()
+        except Exception as e:
+            return i, None, e
+    return i, result, error
+
+
+def settled(results, control=None):
+    # Passes on an executor's (index, result, error) tuples in the same order, each one only once its
+    # outputs are on disk; a failed write turns into that file's error. A paused run hands over everything
+    # it has finished before it stops to wait.
+    waiting = deque()
+    for entry in results:
+        waiting.append(entry)
+        while waiting and (is_settled(waiting[0]) or (control is not None and control.is_paused())):
+            yield settle(waiting.popleft())
+    while waiting:
+        yield settle(waiting.popleft())
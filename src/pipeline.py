@@ -0,0 +1,514 @@
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import UnidentifiedImageError
+
+from atomic_files import atomic_path, write_bytes_atomic
+from engine import (POLL_INTERVAL, RENDITIONS_MODE, ProcessingResult, decode_image, encode_image, get_result_cache,
+                    is_multi_frame, open_image, output_path_for, resolve_output_names, save_frames, save_options,
+                    transform_image, upscale_filter, uses_tiling)
+from instrumentation import FileTiming
+from processing_options import PROCESS_STAGES
+from renditions import decode_renditions, plan_renditions, render_renditions
+from result_cache import hash_bytes
+from run_control import FileTimeoutError, should_start
+from shared_buffers import (PICKLE_COPIES, SharedBufferPool, SharedImage, attached_buffer, attached_image, can_share,
+                            copy_into, image_bytes, map_image, palette_of)
+from tiling import tiled_resize
+
+STAGES = ('read', 'decode', 'resize', 'encode', 'write')
+DEFAULT_QUEUE_SIZE = 4
+
+_STOP = object()
+
+
+def default_stage_workers(resize_workers=None):
+    cpus = os.cpu_count() or 1
+    return {
+        'read': 2,
+        'decode': max(1, cpus // 2),
+        'resize': resize_workers or cpus,
+        'encode': max(1, cpus // 2),
+        'write': 2,
+    }
+
+
+def parse_stage_workers(text):
+    stage_workers = {}
+    for part in filter(None, text.split(',')):
+        name, _, count = part.partition('=')
+        name = name.strip()
+        if name not in STAGES or not count.strip().isdigit() or int(count) < 1:
+            raise ValueError(f"expected STAGE=COUNT with STAGE one of {', '.join(STAGES)}, got '{part}'")
+        stage_workers[name] = int(count)
+    return stage_workers
+
+
+def parse_stage_processes(text):
+    stages = tuple(name.strip() for name in filter(None, text.split(',')))
+    for name in stages:
+        if name not in PROCESS_STAGES:
+            raise ValueError(f"only the {', '.join(PROCESS_STAGES)} stages can run in processes, got '{name}'")
+    return stages
+
+
+# What the process stages run in the workers. Images arrive as SharedImages and leave through the buffer the
+# parent set aside for them; an image that can't take that route comes back pickled instead.
+def decode_into(data, settings, shared):
+    # Decoded straight into the shared buffer, so the resize stage gets the pixels without a copy.
+    img, _ = open_image(io.BytesIO(data), settings)
+    with img:
+        target = map_image(shared, attached_buffer(shared.name))
+        img.im = target.im
+        img.load()
+        if (img.mode, img.size) != (shared.mode, shared.size):
+            # Loading changed the mode or size, so the image goes back pickled.
+            return img.copy(), None, None, 0
+        copied = 0
+        if img.im is not target.im:
+            # The plugin decoded into memory of its own.
+            copy_into(target, img)
+            copied = shared.nbytes()
+        return None, img.info, palette_of(img), copied
+
+
+def resize_into(image, new_dimensions, settings, target):
+    output = transform_image(attached_image(image), new_dimensions, settings)
+    if target is None or (output.mode, output.size) != (target.mode, target.size):
+        return output
+    # Pillow always resizes into memory of its own, so this is the one copy left between resize and encode.
+    copy_into(map_image(target, attached_buffer(target.name)), output)
+    return None
+
+
+def encode_shared(image, target_path, encoder_profile):
+    return encode_image(attached_image(image), target_path, encoder_profile)
+
+
+class PipelineItem:
+    def __init__(self, index, source_path, target_path, name=None, buffer_pool=None):
+        self.index = index
+        self.source_path = source_path
+        self.target_path = target_path
+        self.name = name
+        self.data = None
+        self.image = None
+        self.new_dimensions = None
+        self.output = None
+        self.cache_key = None
+        # Rendition jobs: every planned output, those still to be produced, and their cache keys.
+        self.targets = None
+        self.wanted = None
+        self.cache_keys = {}
+        self.timing = FileTiming(source_path)
+        self.result = None
+        self.error = None
+        self.timeout = None
+        self.deadline = None
+        # Shared buffers holding this item's pixels while it moves between process stages.
+        self.buffer_pool = buffer_pool
+        self.buffers = []
+
+    def finished(self):
+        return self.result is not None or self.error is not None
+
+    def start_clock(self, timeout):
+        if timeout:
+            self.timeout = timeout
+            self.deadline = time.monotonic() + timeout
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def release(self):
+        self.data = self.image = self.output = None
+        self.release_buffers()
+
+    def release_buffers(self, names=None):
+        for name in list(self.buffers) if names is None else names:
+            self.buffers.remove(name)
+            self.buffer_pool.release(name)
+
+
+class StageMetrics:
+    def __init__(self, name, workers, queue_capacity):
+        self.name = name
+        self.workers = workers
+        self.queue_capacity = queue_capacity
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.queue_depth_total = 0
+
+    def record(self, elapsed, queue_depth):
+        with self.lock:
+            self.latencies.append(elapsed)
+            self.queue_depth_total += queue_depth
+
+    def summary(self, wall_seconds):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            queue_depth_total = self.queue_depth_total
+        items = len(latencies)
+        busy_seconds = sum(latencies)
+        return {
+            'stage': self.name,
+            'workers': self.workers,
+            'items': items,
+            'mean_latency': busy_seconds / items if items else 0.0,
+            'p95_latency': latencies[min(items - 1, int(items * 0.95))] if items else 0.0,
+            # Share of the stage's worker time spent working; the bottleneck sits near 100%.
+            'utilization': busy_seconds / (self.workers * wall_seconds) if wall_seconds > 0 else 0.0,
+            # Average backlog waiting in front of the stage, as a fraction of the bounded queue.
+            'occupancy': queue_depth_total / items / self.queue_capacity if items else 0.0,
+        }
+
+
+class PipelineExecutor:
+    def __init__(self, stage_workers=None, queue_size=DEFAULT_QUEUE_SIZE, stage_processes=None):
+        self.stage_workers = {**default_stage_workers(), **(stage_workers or {})}
+        self.queue_size = queue_size or DEFAULT_QUEUE_SIZE
+        self.max_workers = self.stage_workers['resize']
+        self.stage_processes = tuple(stage_processes or ())
+        self.metrics = {}
+        self.wall_seconds = 0.0
+        self.copied_bytes = 0
+        self.shared_bytes = 0
+        self.stop_event = threading.Event()
+        # Started on the first run that needs them and kept for the executor's lifetime. A process stage's
+        # threads hand their work to the pool and wait for it, so queues and metrics work as for threads.
+        self.processes = None
+        self.buffer_pool = None
+
+    def put(self, target_queue, item):
+        # Blocking puts are what give us backpressure; the timeout only lets an abandoned run unwind.
+        while not self.stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def run(self, file_paths, settings, control=None, names=None):
+        self.stop_event.clear()
+        if names is None:
+            names = resolve_output_names(file_paths, settings)
+        if self.stage_processes and self.processes is None:
+            # Spawned like the process pool backend's workers, keeping Qt state out of the children.
+            self.processes = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            self.buffer_pool = SharedBufferPool()
+        self.copied_bytes = self.shared_bytes = 0
+        cache = get_result_cache(settings) if settings.cache_directory is not None else None
+        stage_functions = {
+            'read': lambda item: self.read(item, settings, cache),
+            'decode': lambda item: self.decode(item, settings),
+            'resize': lambda item: self.resize(item, settings),
+            'encode': lambda item: self.encode(item, settings),
+            'write': lambda item: self.write(item, settings, cache),
+        }
+
+        inputs = [queue.Queue(maxsize=self.queue_size) for _ in STAGES]
+        done = queue.Queue()
+        outputs = inputs[1:] + [done]
+        self.metrics = {name: StageMetrics(name, self.stage_workers[name], self.queue_size) for name in STAGES}
+
+        threads = []
+        for position, name in enumerate(STAGES):
+            # Workers of a stage share one counter so only the last one to stop signals downstream.
+            remaining = [self.stage_workers[name]]
+            lock = threading.Lock()
+            downstream = self.stage_workers[STAGES[position + 1]] if position + 1 < len(STAGES) else 1
+            for _ in range(self.stage_workers[name]):
+                threads.append(threading.Thread(
+                    target=self.stage_loop, daemon=True,
+                    args=(stage_functions[name], self.metrics[name], inputs[position], outputs[position],
+                          remaining, lock, downstream)))
+
+        def feed():
+            # A pause holds back new files while those already in the stages drain; a cancel stops feeding
+            # altogether and the run ends once what was fed has come out the other end.
+            for i, file_path in enumerate(file_paths):
+                if not should_start(control):
+                    break
+                # Rendition jobs learn their output paths when the read stage plans them.
+                renditions = settings.processing_mode == RENDITIONS_MODE
+                name = names.get(file_path)
+                target_path = None if renditions else output_path_for(file_path, settings, name)
+                self.put(inputs[0], PipelineItem(i, file_path, target_path, name, self.buffer_pool))
+            for _ in range(self.stage_workers[STAGES[0]]):
+                self.put(inputs[0], _STOP)
+
+        threads.append(threading.Thread(target=feed, daemon=True))
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        # Items finish out of order; hold them until every earlier index has been yielded.
+        finished = {}
+        next_index = 0
+        try:
+            while next_index < len(file_paths):
+                # A cancel abandons whatever is still in the stages rather than waiting for it to drain.
+                if control is not None and control.is_cancelled():
+                    break
+                try:
+                    item = done.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                if item is _STOP:
+                    break
+                finished[item.index] = item
+                self.copied_bytes += item.timing.copied_bytes
+                self.shared_bytes += item.timing.shared_bytes
+                while next_index in finished:
+                    item = finished.pop(next_index)
+                    yield item.index, item.result, item.error
+                    next_index += 1
+        finally:
+            self.wall_seconds = time.perf_counter() - start
+            self.stop_event.set()
+
+    def stage_loop(self, function, metrics, input_queue, output_queue, remaining, lock, downstream):
+        while True:
+            try:
+                item = input_queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    return
+                continue
+
+            if item is _STOP:
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    for _ in range(downstream):
+                        self.put(output_queue, _STOP)
+                return
+
+            if not item.finished() and item.expired():
+                # Stage threads can't be interrupted, so the time limit is enforced between stages.
+                item.error = FileTimeoutError(f"gave up after {item.timeout:g}s")
+                item.release()
+            if not item.finished():
+                queue_depth = input_queue.qsize()
+                start = time.perf_counter()
+                try:
+                    with item.timing.measure(metrics.name):
+                        function(item)
+                except Exception as e:
+                    item.error = e
+                    item.release()
+                metrics.record(time.perf_counter() - start, queue_depth)
+            self.put(output_queue, item)
+
+    def read(self, item, settings, cache):
+        item.start_clock(settings.file_timeout)
+        if not os.path.exists(item.source_path):
+            raise FileNotFoundError(f"File does not exist: {item.source_path}")
+        with open(item.source_path, 'rb') as f:
+            item.data = f.read()
+        item.timing.input_bytes = len(item.data)
+        if settings.processing_mode == RENDITIONS_MODE:
+            self.read_renditions(item, settings, cache)
+        elif cache is not None:
+            item.cache_key = cache.key_from_digest(hash_bytes(item.data), settings.cache_params(item.target_path))
+            if cache.fetch(item.cache_key, item.target_path):
+                item.timing.cache_hit = True
+                self.finish(item)
+                item.release()
+
+    def read_renditions(self, item, settings, cache):
+        item.targets = plan_renditions(item.source_path, settings, item.name)
+        item.target_path = item.targets[0].target_path
+        item.wanted = set(item.targets)
+        if cache is not None:
+            digest = hash_bytes(item.data)
+            for target in item.targets:
+                item.cache_keys[target] = cache.key_from_digest(digest, target.cache_params())
+                if cache.fetch(item.cache_keys[target], target.target_path):
+                    item.wanted.discard(target)
+            if not item.wanted:
+                item.timing.cache_hit = True
+                self.finish(item)
+                item.release()
+
+    def decode(self, item, settings):
+        try:
+            if item.targets is not None:
+                item.image = decode_renditions(io.BytesIO(item.data), item.targets, item.timing)
+            elif 'decode' in self.stage_processes:
+                self.decode_shared(item, settings)
+            else:
+                item.image, item.new_dimensions = decode_image(io.BytesIO(item.data), settings, item.timing)
+        except UnidentifiedImageError:
+            raise UnidentifiedImageError(f"cannot identify image file '{item.source_path}'") from None
+        item.data = None
+
+    def decode_shared(self, item, settings):
+        # The header is read here as well, to size the buffer the worker decodes into.
+        img, item.new_dimensions = open_image(io.BytesIO(item.data), settings, item.timing)
+        if is_multi_frame(img, item.target_path) or not can_share(img):
+            # Animations are decoded frame by frame in the resize stage, so they stay in this process.
+            img.load()
+            item.image = img
+            return
+        with img:
+            shared = SharedImage(self.acquire_buffer(item, image_bytes(img.mode, img.size)), img.mode, img.size)
+        image, shared.info, shared.palette, copied = self.processes.submit(decode_into, item.data, settings,
+                                                                           shared).result()
+        if image is not None:
+            self.release_buffer(item, shared)
+            item.image = self.received(item, image)
+            return
+        item.timing.copied_bytes += copied
+        item.timing.shared_bytes += shared.nbytes() - copied
+        item.image = shared
+
+    def resize(self, item, settings):
+        if item.targets is not None:
+            # Outputs streamed to disk come back as None and skip the encode stage.
+            item.image = list(render_renditions(item.image, item.targets, item.wanted))
+            return
+        if not isinstance(item.image, SharedImage) and is_multi_frame(item.image, item.target_path):
+            # Frames are decoded, resized and written one after another, so they skip encode/write too.
+            save_frames(item.image, item.new_dimensions, settings, item.target_path)
+            item.image = None
+            return
+        if uses_tiling(item.image, item.new_dimensions, settings):
+            # Oversized outputs are streamed straight to disk, bypassing the encode/write stages.
+            with atomic_path(item.target_path, fsync=settings.fsync) as temp_path:
+                tiled_resize(self.local_image(item.image), item.new_dimensions, upscale_filter(settings.resampling),
+                             temp_path, settings.memory_budget,
+                             save_options(item.target_path, settings.encoder_profile))
+            item.image = None
+            return
+        if item.new_dimensions is None:
+            # Convert runs pass the decoded pixels on as they are.
+            return
+        if 'resize' in self.stage_processes:
+            self.resize_shared(item, settings)
+            return
+        item.image = transform_image(self.local_image(item.image), item.new_dimensions, settings)
+
+    def resize_shared(self, item, settings):
+        source = self.sent(item, item.image)
+        target = None
+        if isinstance(source, SharedImage):
+            target = SharedImage(self.acquire_buffer(item, image_bytes(source.mode, item.new_dimensions)),
+                                 source.mode, item.new_dimensions, source.info, source.palette)
+        output = self.processes.submit(resize_into, source, item.new_dimensions, settings, target).result()
+        if isinstance(source, SharedImage):
+            self.release_buffer(item, source)
+        if output is not None:
+            if target is not None:
+                self.release_buffer(item, target)
+            item.image = self.received(item, output)
+            return
+        item.timing.copied_bytes += target.nbytes()
+        item.image = target
+
+    def encode(self, item, settings):
+        if item.targets is not None:
+            item.output = [(target, None if output is None else
+                            encode_image(output, target.target_path, target.settings.encoder_profile))
+                           for target, output in item.image]
+            item.image = None
+        elif item.image is not None:
+            if 'encode' in self.stage_processes:
+                item.output = self.processes.submit(encode_shared, self.sent(item, item.image), item.target_path,
+                                                    settings.encoder_profile).result()
+            else:
+                item.output = encode_image(self.local_image(item.image), item.target_path, settings.encoder_profile)
+            item.image = None
+            item.release_buffers()
+
+    # Handing images between this process and the process stages. What each hand-over costs is recorded on
+    # the item's timing: pixels passed in shared memory as shared_bytes, each copy made on the way as
+    # copied_bytes.
+    def acquire_buffer(self, item, nbytes):
+        name = self.buffer_pool.acquire(nbytes)
+        item.buffers.append(name)
+        return name
+
+    def release_buffer(self, item, shared):
+        item.release_buffers([shared.name])
+
+    def local_image(self, image):
+        # An image left in shared memory by a process stage, mapped here without a copy.
+        return self.buffer_pool.image(image) if isinstance(image, SharedImage) else image
+
+    def sent(self, item, image):
+        # A SharedImage was accounted for by the stage that filled its buffer.
+        if isinstance(image, SharedImage):
+            return image
+        if not can_share(image):
+            item.timing.copied_bytes += PICKLE_COPIES * image_bytes(image.mode, image.size)
+            return image
+        shared = self.buffer_pool.share(image)
+        item.buffers.append(shared.name)
+        item.timing.copied_bytes += shared.nbytes()
+        return shared
+
+    def received(self, item, image):
+        item.timing.copied_bytes += PICKLE_COPIES * image_bytes(image.mode, image.size)
+        return image
+
+    def write(self, item, settings, cache):
+        if item.targets is not None:
+            for target, output in item.output:
+                if output is not None:
+                    write_bytes_atomic(target.target_path, output, settings.fsync)
+                if cache is not None:
+                    cache.store(item.cache_keys[target], target.target_path)
+            item.output = None
+            self.finish(item)
+            return
+        if item.output is not None:
+            write_bytes_atomic(item.target_path, item.output, settings.fsync)
+            item.output = None
+        if item.cache_key is not None:
+            cache.store(item.cache_key, item.target_path)
+        self.finish(item)
+
+    def finish(self, item):
+        output_paths = [target.target_path for target in item.targets] if item.targets else [item.target_path]
+        item.timing.output_path = item.target_path
+        item.timing.output_bytes = sum(os.path.getsize(output_path) for output_path in output_paths)
+        item.result = ProcessingResult(item.source_path, item.target_path, item.timing.cache_hit, item.timing,
+                                       output_paths)
+
+    def metrics_summary(self):
+        return [self.metrics[name].summary(self.wall_seconds) for name in STAGES if name in self.metrics]
+
+    def metrics_report(self):
+        summaries = self.metrics_summary()
+        lines = [f"{'stage':<8}{'workers':>8}{'items':>8}{'mean':>10}{'p95':>10}{'busy':>7}{'queue':>7}"]
+        for summary in summaries:
+            lines.append(f"{summary['stage']:<8}{summary['workers']:>8}{summary['items']:>8}"
+                         f"{summary['mean_latency'] * 1000:>8.1f}ms{summary['p95_latency'] * 1000:>8.1f}ms"
+                         f"{summary['utilization']:>7.0%}{summary['occupancy']:>7.0%}")
+        if summaries:
+            bottleneck = max(summaries, key=lambda summary: summary['utilization'])
+            lines.append(f"Bottleneck: {bottleneck['stage']} stage ({bottleneck['utilization']:.0%} busy)")
+        if self.stage_processes and self.buffer_pool is not None:
+            lines.append(self.handoff_report())
+        return '\n'.join(lines)
+
+    def handoff_report(self):
+        megabytes = 1024 * 1024
+        return (f"Stage processes ({', '.join(self.stage_processes)}): {self.shared_bytes / megabytes:.1f} MB "
+                f"passed in shared memory, {self.copied_bytes / megabytes:.1f} MB copied; "
+                f"{self.buffer_pool.allocated} buffer(s) allocated, {self.buffer_pool.reused} reused")
+
+    def shutdown(self):
+        self.stop_event.set()
+        if self.processes is not None:
+            self.processes.shutdown(wait=True, cancel_futures=True)
+            self.buffer_pool.close()
+            self.processes = None
@@ -0,0 +1,261 @@
+import os
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QRect, QSize, Qt, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QImage, QImageReader, QPixmap
+from PyQt5.QtWidgets import QListView, QStyle, QStyledItemDelegate
+
+from thumbnails import thumbnail_key
+
+# Every thumbnail arrives twice: a draft scaled with nearest-neighbour as soon as the image is decoded, then
+# the smooth one made from the same decode.
+DRAFT, FINAL = 0, 1
+CAPTION_HEIGHT = 18
+TILE_PADDING = 6
+# Requests for tiles that have scrolled out of view are dropped once scrolling pauses for this long.
+SCROLL_SETTLE_MS = 100
+
+
+def reduced_decode_size(size, target):
+    # libjpeg decodes at 1/2, 1/4 or 1/8 scale for little more than the cost of reading the file. Asking for
+    # exactly one of those sizes gets the pixels before Qt smooth-scales them, so both the draft and the
+    # thumbnail can be made from them.
+    factor = 1
+    while (factor < 8 and size.width() // (factor * 2) >= target.width()
+           and size.height() // (factor * 2) >= target.height()):
+        factor *= 2
+    return QSize(-(-size.width() // factor), -(-size.height() // factor))
+
+
+class ThumbnailLoader(QThread):
+    thumbnail_ready = pyqtSignal(str, object, QImage, int)
+    thumbnail_failed = pyqtSignal(str, object, str)
+
+    def __init__(self, width, height):
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.condition = threading.Condition()
+        # Newest requests first: they are the tiles the user is looking at now.
+        self.pending = OrderedDict()
+        self.stopped = False
+        self.decoded = 0
+
+    def request(self, file_path, key):
+        with self.condition:
+            self.pending.pop(key, None)
+            self.pending[key] = file_path
+            self.condition.notify()
+        if not self.isRunning():
+            self.stopped = False
+            self.start()
+
+    def retain(self, keys):
+        with self.condition:
+            for key in [key for key in self.pending if key not in keys]:
+                del self.pending[key]
+
+    def stop(self):
+        if self.isRunning():
+            with self.condition:
+                self.stopped = True
+                self.condition.notify()
+            self.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                key, file_path = self.pending.popitem()
+            self.load(file_path, key)
+
+    def load(self, file_path, key):
+        # QImage, unlike QPixmap, is safe to build off the GUI thread.
+        reader = QImageReader(file_path)
+        size = reader.size()
+        target = size.scaled(self.width, self.height, Qt.KeepAspectRatio) if size.isValid() else None
+        if target is not None and reader.format() == b'jpeg':
+            reader.setScaledSize(reduced_decode_size(size, target))
+        image = reader.read()
+        self.decoded += 1
+        if image.isNull():
+            self.thumbnail_failed.emit(file_path, key, reader.errorString())
+            return
+        if target is None or not target.isValid():
+            target = image.size().scaled(self.width, self.height, Qt.KeepAspectRatio)
+        if image.size() != target:
+            self.thumbnail_ready.emit(file_path, key, image.scaled(target, Qt.IgnoreAspectRatio,
+                                                                   Qt.FastTransformation), DRAFT)
+            image = image.scaled(target, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        self.thumbnail_ready.emit(file_path, key, image, FINAL)
+
+
+class PreviewModel(QAbstractListModel):
+    # Only paths and their cache keys; pixels live in the thumbnail cache and are fetched when a tile is painted.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.paths = []
+        self.keys = []
+        self.rows = {}
+        # Why a preview couldn't be made, shown in its tile's tooltip.
+        self.errors = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.paths):
+            return None
+        if role == Qt.DisplayRole:
+            return os.path.basename(self.paths[index.row()])
+        if role == Qt.ToolTipRole:
+            file_path = self.paths[index.row()]
+            error = self.errors.get(file_path)
+            return f"{file_path}\nCould not load preview: {error}" if error else file_path
+        return None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add_paths(self, file_paths):
+        keys = []
+        for file_path in file_paths:
+            try:
+                keys.append(thumbnail_key(file_path))
+            except OSError as e:
+                self.errors[file_path] = str(e)
+                keys.append(None)
+        first = len(self.paths)
+        self.beginInsertRows(QModelIndex(), first, first + len(file_paths) - 1)
+        for file_path in file_paths:
+            self.rows.setdefault(file_path, []).append(len(self.paths))
+            self.paths.append(file_path)
+        self.keys.extend(keys)
+        self.endInsertRows()
+
+    def tile(self, row):
+        return self.paths[row], self.keys[row]
+
+    def refresh(self, file_path):
+        for row in self.rows.get(file_path, []):
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class PreviewDelegate(QStyledItemDelegate):
+    def __init__(self, grid):
+        super().__init__(grid)
+        self.grid = grid
+
+    def sizeHint(self, option, index):
+        return self.grid.tile_size()
+
+    def paint(self, painter, option, index):
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+        image_rect = QRect(option.rect.left() + TILE_PADDING, option.rect.top() + TILE_PADDING,
+                           self.grid.thumbnail_width, self.grid.thumbnail_height)
+        pixmap = self.grid.pixmap_for(index.row())
+        if pixmap is None:
+            painter.setPen(option.palette.mid().color())
+            painter.drawRect(image_rect.adjusted(0, 0, -1, -1))
+        else:
+            size = pixmap.size().scaled(image_rect.size(), Qt.KeepAspectRatio)
+            painter.drawPixmap(QRect(image_rect.left() + (image_rect.width() - size.width()) // 2,
+                                     image_rect.top() + (image_rect.height() - size.height()) // 2,
+                                     size.width(), size.height()), pixmap)
+        caption_rect = QRect(option.rect.left() + TILE_PADDING, image_rect.bottom() + 1,
+                             image_rect.width(), CAPTION_HEIGHT)
+        painter.setPen(option.palette.highlightedText().color() if option.state & QStyle.State_Selected
+                       else option.palette.text().color())
+        caption = option.fontMetrics.elidedText(index.data(Qt.DisplayRole), Qt.ElideMiddle, caption_rect.width())
+        painter.drawText(caption_rect, Qt.AlignCenter, caption)
+        painter.restore()
+
+
+class PreviewGrid(QListView):
+    # A virtualized thumbnail grid: tiles are only decoded when painted, which Qt does for the visible ones
+    # alone, and the LRU thumbnail cache drops the tiles painted longest ago, the offscreen ones, once it
+    # is over its budget.
+    preview_failed = pyqtSignal(str, str)
+
+    def __init__(self, model, cache, thumbnail_width, thumbnail_height, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.thumbnail_width = thumbnail_width
+        self.thumbnail_height = thumbnail_height
+        self.failed = set()
+        self.loader = ThumbnailLoader(thumbnail_width, thumbnail_height)
+        self.loader.thumbnail_ready.connect(self.on_thumbnail_ready)
+        self.loader.thumbnail_failed.connect(self.on_thumbnail_failed)
+
+        self.setViewMode(QListView.IconMode)
+        self.setResizeMode(QListView.Adjust)
+        self.setMovement(QListView.Static)
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.Batched)
+        self.setSelectionMode(QListView.ExtendedSelection)
+        self.setItemDelegate(PreviewDelegate(self))
+        self.setModel(model)
+
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.setInterval(SCROLL_SETTLE_MS)
+        self.settle_timer.timeout.connect(self.drop_offscreen_requests)
+        self.verticalScrollBar().valueChanged.connect(self.settle_timer.start)
+
+    def tile_size(self):
+        return QSize(self.thumbnail_width + 2 * TILE_PADDING,
+                     self.thumbnail_height + CAPTION_HEIGHT + 2 * TILE_PADDING)
+
+    def pixmap_for(self, row):
+        file_path, key = self.model().tile(row)
+        if key is None or key in self.failed:
+            return None
+        entry = self.cache.get(key)
+        if entry is None:
+            # A draft needs no request of its own: the thumbnail made from the same decode follows it.
+            self.loader.request(file_path, key)
+            return None
+        return entry[0]
+
+    def visible_keys(self):
+        # Rows run left to right, then top to bottom, so the visible ones are a contiguous range.
+        keys = set()
+        model = self.model()
+        viewport = self.viewport().rect()
+        first = self.indexAt(viewport.topLeft())
+        for row in range(first.row() if first.isValid() else 0, model.rowCount()):
+            rect = self.visualRect(model.index(row))
+            if rect.top() > viewport.bottom():
+                break
+            if rect.intersects(viewport):
+                keys.add(model.tile(row)[1])
+        return keys
+
+    def drop_offscreen_requests(self):
+        visible = self.visible_keys()
+        self.loader.retain(visible)
+        self.cache.pin(visible)
+
+    def on_thumbnail_ready(self, file_path, key, image, level):
+        entry = self.cache.get(key)
+        if entry is not None and entry[1] > level:
+            return
+        self.cache.pin(self.visible_keys())
+        self.cache.put(key, (QPixmap.fromImage(image), level), image.sizeInBytes())
+        self.model().refresh(file_path)
+
+    def on_thumbnail_failed(self, file_path, key, error):
+        self.failed.add(key)
+        self.model().errors[file_path] = error
+        self.model().refresh(file_path)
+        self.preview_failed.emit(file_path, error)
+
+    def stop(self):
+        self.loader.stop()
@@ -0,0 +1,130 @@
+import importlib.util
+import os
+
+# The choices a run is configured with, and the cheap checks on them. Nothing here imports Pillow up front,
+# so the GUI can build its option widgets and the command line can validate arguments before paying for the
+# imaging stack; engine.py re-exports all of it next to the code that acts on it.
+
+PROCESSING_MODES = ('upscale', 'downscale', 'convert')
+# Several outputs per source, each one of the processing modes above; see renditions.py.
+RENDITIONS_MODE = 'renditions'
+SCALE_FACTORS = ["1.5x", "2x", "4x", "6x", "8x"]
+# Convert accepts every source format unless told to pick out just one.
+ANY_FORMAT = 'any'
+
+# Downscale speed presets map to the reducing gap used for JPEG draft decoding and Image.reduce:
+# the source is shrunk in the DCT domain / by box averaging to no less than gap * target size
+# before the final LANCZOS pass. None keeps the full decode and a single LANCZOS resize.
+DOWNSCALE_SPEEDS = {
+    'quality': None,
+    'balanced': 3.0,
+    'fast': 1.0,
+}
+
+# Resampling strategies. The presets pick a filter per direction and take shortcuts for exact integer
+# ratios; the plain filter names apply that filter to everything (engine.RESAMPLING_FILTERS maps each
+# name to its Pillow filter).
+RESAMPLING_PRESETS = ('quality', 'balanced', 'fast')
+RESAMPLING_FILTER_NAMES = ('lanczos', 'bicubic', 'bilinear', 'box', 'nearest')
+RESAMPLING_STRATEGIES = RESAMPLING_PRESETS + RESAMPLING_FILTER_NAMES
+
+# Encoder profiles map to Pillow save options per output format. 'default' passes none, which is what
+# every save did before profiles existed. Lossy formats keep the same quality in every profile; the
+# profiles only trade encoding time for bytes. benchmarks/bench_encoders.py measures the trade.
+ENCODER_PROFILES = {
+    'default': {},
+    'fast': {
+        'PNG': {'compress_level': 1},
+        'JPEG': {'quality': 75, 'subsampling': '4:2:0'},
+        'WEBP': {'quality': 80, 'method': 0},
+        'TIFF': {'compression': 'raw'},
+    },
+    'balanced': {
+        'PNG': {'compress_level': 4},
+        'JPEG': {'quality': 75, 'subsampling': '4:2:0', 'optimize': True},
+        'WEBP': {'quality': 80, 'method': 4},
+        'TIFF': {'compression': 'tiff_lzw'},
+    },
+    'smallest': {
+        'PNG': {'compress_level': 9, 'optimize': True},
+        'JPEG': {'quality': 75, 'subsampling': '4:2:0', 'optimize': True, 'progressive': True},
+        'WEBP': {'quality': 80, 'method': 6},
+        'TIFF': {'compression': 'tiff_adobe_deflate'},
+        'TGA': {'compression': 'tga_rle'},
+    },
+}
+
+# Output file name templates. {name} is the source file name without its extension, {ext} the output
+# extension, {mode} upscaled, downscaled or converted, {scale} the scale factor, {parent} the name of the
+# source's folder and, in rendition jobs, {rendition} the rendition's name. The defaults are the names
+# outputs have always had.
+NAME_FIELDS = ('name', 'ext', 'mode', 'scale', 'parent', 'rendition')
+DEFAULT_NAME_TEMPLATES = {
+    'upscale': '{mode}_{name}.{ext}',
+    'downscale': '{mode}_{name}.{ext}',
+    'convert': '{name}.{ext}',
+    RENDITIONS_MODE: '{name}_{rendition}.{ext}',
+}
+MODE_NAMES = {'upscale': 'upscaled', 'downscale': 'downscaled', 'convert': 'converted'}
+
+# Outputs bigger than this are resized in strips; see tiling.py.
+DEFAULT_MEMORY_BUDGET = 1024 * 1024 * 1024
+
+EXECUTION_BACKENDS = ('process', 'pipeline', 'vectorized')
+# Share of a job server's worker pool each priority class gets while jobs of several classes are waiting;
+# see job_server.JobScheduler.next_job.
+PRIORITIES = {'high': 4, 'normal': 2, 'low': 1}
+# The pipeline stages that can run in worker processes; images pass between them in shared memory
+# (see shared_buffers.py).
+PROCESS_STAGES = ('decode', 'resize', 'encode')
+
+
+def parse_scale_factor(scale_factor):
+    return float(str(scale_factor).rstrip('x'))
+
+
+def writable_extension(extension):
+    # Only reached for a template that spells out its own extension, so Pillow is imported here.
+    from PIL import Image
+    Image.init()
+    return Image.registered_extensions().get(extension.lower()) in Image.SAVE
+
+
+def check_name_template(template, processing_mode):
+    # Formatted against placeholder values so a bad template fails before the run rather than per file.
+    fields = dict.fromkeys(NAME_FIELDS, 'x')
+    try:
+        name = template.format(**fields)
+    except KeyError as e:
+        raise ValueError(f"unknown field {{{e.args[0]}}} in name template, use {', '.join(NAME_FIELDS)}") from None
+    except (IndexError, ValueError) as e:
+        raise ValueError(f"invalid name template '{template}': {e}") from None
+    if '{name}' not in template:
+        raise ValueError("the name template needs {name}, or every source would write the same file")
+    if processing_mode == RENDITIONS_MODE and '{rendition}' not in template:
+        raise ValueError("a rendition job's name template needs {rendition} to tell its outputs apart")
+    if os.sep in name or (os.altsep and os.altsep in name) or not name.strip('.'):
+        raise ValueError(f"the name template '{template}' must give a plain file name")
+    # Pillow picks the encoder from the extension. {ext} always gives one it can write, standing in as png here.
+    extension = os.path.splitext(template.format(**dict(fields, ext='png')))[1]
+    if extension != '.png' and not writable_extension(extension):
+        raise ValueError(f"the name template '{template}' must end in .{{ext}} or an image extension, "
+                         f"or outputs could not be saved")
+
+
+def default_worker_count():
+    return os.cpu_count() or 1
+
+
+def vectorized_available():
+    return importlib.util.find_spec('numpy') is not None
+
+
+def quality_metrics_available():
+    # PSNR and SSIM in the comparison viewer are computed with NumPy.
+    return importlib.util.find_spec('numpy') is not None
+
+
+def upscale_models_available():
+    # Every model backend needs NumPy; ONNX models also need onnxruntime.
+    return importlib.util.find_spec('numpy') is not None
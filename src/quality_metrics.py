@@ -0,0 +1,78 @@
+import numpy as np
+
+# Difference metrics between two equally sized regions, for the comparison viewer. Everything is whole-array
+# NumPy: SSIM's local statistics come from summed-area tables rather than a window slid pixel by pixel, and
+# the per-block figures are reductions over the same arrays.
+
+MAX_VALUE = 255.0
+# Side of SSIM's square window, in pixels. A uniform window rather than the paper's Gaussian, so every local
+# mean is four lookups in a summed-area table.
+SSIM_WINDOW = 8
+SSIM_C1 = (0.01 * MAX_VALUE) ** 2
+SSIM_C2 = (0.03 * MAX_VALUE) ** 2
+# Rec. 601 weights; SSIM is computed on luma, as is usual.
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+
+class RegionMetrics:
+    def __init__(self, psnr, ssim, block_psnr, block_ssim):
+        self.psnr = psnr
+        self.ssim = ssim
+        # One value per block of a rows x columns grid over the region.
+        self.block_psnr = block_psnr
+        self.block_ssim = block_ssim
+
+
+def rgb_pixels(img):
+    # float32 holds 8-bit values and their squared differences exactly; sums are taken in float64.
+    return np.asarray(img.convert('RGB'), dtype=np.float32)
+
+
+def psnr_from_mse(mse):
+    with np.errstate(divide='ignore'):
+        return 10 * np.log10(MAX_VALUE ** 2 / mse)
+
+
+def window_sums(values, window):
+    # Sums over every window x window square, from a summed-area table padded with a leading zero row and
+    # column: (height - window + 1) x (width - window + 1) of them.
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1))
+    np.cumsum(np.cumsum(values, axis=0), axis=1, out=table[1:, 1:])
+    return (table[window:, window:] - table[:-window, window:] - table[window:, :-window]
+            + table[:-window, :-window])
+
+
+def ssim_map(reference, image, window=SSIM_WINDOW):
+    # SSIM of every window position, on luma.
+    x = reference.astype(np.float64) @ LUMA_WEIGHTS
+    y = image.astype(np.float64) @ LUMA_WEIGHTS
+    window = min(window, x.shape[0], x.shape[1])
+    count = window * window
+    mean_x = window_sums(x, window) / count
+    mean_y = window_sums(y, window) / count
+    variance_x = window_sums(x * x, window) / count - mean_x * mean_x
+    variance_y = window_sums(y * y, window) / count - mean_y * mean_y
+    covariance = window_sums(x * y, window) / count - mean_x * mean_y
+    return (((2 * mean_x * mean_y + SSIM_C1) * (2 * covariance + SSIM_C2))
+            / ((mean_x * mean_x + mean_y * mean_y + SSIM_C1) * (variance_x + variance_y + SSIM_C2)))
+
+
+def block_means(values, rows, columns):
+    # Means over a rows x columns grid of nearly equal blocks. reduceat sums each block along one axis and
+    # then the other, so there is no loop over blocks.
+    rows, columns = min(rows, values.shape[0]), min(columns, values.shape[1])
+    row_edges = np.linspace(0, values.shape[0], rows + 1).astype(int)
+    column_edges = np.linspace(0, values.shape[1], columns + 1).astype(int)
+    sums = np.add.reduceat(np.add.reduceat(values, row_edges[:-1], axis=0), column_edges[:-1], axis=1)
+    return sums / np.outer(np.diff(row_edges), np.diff(column_edges))
+
+
+def region_metrics(reference, image, rows=1, columns=1):
+    # reference and image are Pillow images of the same size; alpha is ignored.
+    x = rgb_pixels(reference)
+    y = rgb_pixels(image)
+    squared_error = ((x - y) ** 2).mean(axis=2, dtype=np.float64)
+    similarity = ssim_map(x, y)
+    return RegionMetrics(float(psnr_from_mse(squared_error.mean())), float(similarity.mean()),
+                         psnr_from_mse(block_means(squared_error, rows, columns)),
+                         block_means(similarity, rows, columns))
@@ -0,0 +1,265 @@
+import json
+import os
+
+from PIL import Image
+
+from atomic_files import atomic_path
+from engine import (DOWNSCALE_SPEEDS, ENCODER_PROFILES, PROCESSING_MODES, ProcessingResult, ProcessingSettings,
+                    check_memory_limit, get_result_cache, is_multi_frame, normalize_format, output_file_name,
+                    parse_scale_factor, request_draft, save_frames, save_image, save_options, target_dimensions,
+                    transform_image, upscale_filter, uses_tiling)
+from instrumentation import FileTiming
+from result_cache import hash_file
+from tiling import tiled_resize
+
+# A downscale is resampled from a larger downscale of the same file instead of the full source when that
+# one is at least this many times its size; Pillow documents a reducing gap of 3 as indistinguishable
+# from resampling the original. The balanced and fast downscale speeds use their own, smaller gaps.
+DERIVE_GAP = 3.0
+# Keys of one rendition in a job spec, and in --rendition on the command line.
+SPEC_KEYS = ('mode', 'scale', 'format', 'encoder', 'name')
+
+
+class Rendition:
+    def __init__(self, processing_mode, scale_factor=None, convert_to_format=None, encoder_profile=None, name=None):
+        if processing_mode not in PROCESSING_MODES:
+            raise ValueError(f"unknown rendition mode '{processing_mode}', choose from {', '.join(PROCESSING_MODES)}")
+        if processing_mode == 'convert':
+            if not convert_to_format:
+                raise ValueError("a convert rendition needs a format")
+            scale_factor = None
+        else:
+            try:
+                if parse_scale_factor(scale_factor) <= 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid scale factor '{scale_factor}' for a {processing_mode} rendition") from None
+        if convert_to_format is not None:
+            target_format = normalize_format(convert_to_format)
+            if target_format is None:
+                raise ValueError(f"unsupported format '{convert_to_format}'")
+            convert_to_format = target_format
+        if encoder_profile is not None and encoder_profile not in ENCODER_PROFILES:
+            raise ValueError(f"unknown encoder profile '{encoder_profile}', choose from {', '.join(ENCODER_PROFILES)}")
+        self.processing_mode = processing_mode
+        self.scale_factor = scale_factor
+        self.convert_to_format = convert_to_format
+        self.encoder_profile = encoder_profile
+        if name is None:
+            name = 'converted' if processing_mode == 'convert' else f"{processing_mode}d_{scale_factor}"
+        self.name = name
+
+    @classmethod
+    def from_dict(cls, values):
+        unknown = set(values) - set(SPEC_KEYS)
+        if unknown:
+            raise ValueError(f"unknown rendition key(s) {', '.join(sorted(unknown))}, "
+                             f"expected {', '.join(SPEC_KEYS)}")
+        return cls(values.get('mode'), values.get('scale'), values.get('format'), values.get('encoder'),
+                   values.get('name'))
+
+    def as_dict(self):
+        return {'mode': self.processing_mode, 'scale': self.scale_factor, 'format': self.convert_to_format,
+                'encoder': self.encoder_profile, 'name': self.name}
+
+    def factor(self):
+        # How many times smaller than the source the output is.
+        if self.processing_mode == 'convert':
+            return 1.0
+        scale = parse_scale_factor(self.scale_factor)
+        return scale if self.processing_mode == 'downscale' else 1 / scale
+
+    def output_path(self, file_path, settings, name=None):
+        # settings are the job's, whose name template applies to all of its renditions.
+        return os.path.join(settings.save_directory, output_file_name(file_path, settings, name, self))
+
+    def settings_for(self, settings):
+        # Anything the rendition leaves out, including its encoder profile, comes from the job.
+        values = dict(settings.as_dict(), processing_mode=self.processing_mode, scale_factor=self.scale_factor,
+                      convert_to_format=self.convert_to_format, renditions=None,
+                      encoder_profile=self.encoder_profile or settings.encoder_profile)
+        return ProcessingSettings.from_dict(values)
+
+
+def parse_rendition(text):
+    # "mode=downscale,scale=2x,format=webp", the command line form of one job spec entry.
+    values = {}
+    for part in text.split(','):
+        key, separator, value = part.partition('=')
+        if not separator:
+            raise ValueError(f"expected KEY=VALUE, got '{part}'")
+        values[key.strip()] = value.strip()
+    return Rendition.from_dict(values)
+
+
+def load_job_spec(path):
+    # A JSON list of renditions, or an object holding one under "renditions".
+    with open(path, encoding='utf-8') as f:
+        spec = json.load(f)
+    if isinstance(spec, dict):
+        spec = spec.get('renditions')
+    if not isinstance(spec, list) or not spec:
+        raise ValueError(f"{path} does not list any renditions")
+    return [Rendition.from_dict(values) for values in spec]
+
+
+def check_renditions(renditions):
+    seen = set()
+    for rendition in renditions:
+        output = (rendition.name, rendition.convert_to_format)
+        if output in seen:
+            raise ValueError(f"two renditions are both named '{rendition.name}'; give one a different name")
+        seen.add(output)
+
+
+class RenditionTarget:
+    def __init__(self, rendition, target_path, settings):
+        self.rendition = rendition
+        self.target_path = target_path
+        self.settings = settings
+        self.factor = rendition.factor()
+        self.derived_from = None
+        self.new_dimensions = None
+
+    def cache_params(self):
+        # A derived output depends on the rendition it was resampled from, so that is part of its key.
+        params = self.settings.cache_params(self.target_path)
+        if self.derived_from is not None:
+            params['derived_from'] = self.derived_from.cache_params()
+        return params
+
+
+def plan_renditions(file_path, settings, name=None):
+    targets = [RenditionTarget(rendition, rendition.output_path(file_path, settings, name),
+                               rendition.settings_for(settings))
+               for rendition in map(Rendition.from_dict, settings.renditions)]
+    gap = DOWNSCALE_SPEEDS[settings.downscale_speed] or DERIVE_GAP
+    downscales = [target for target in targets if target.settings.processing_mode == 'downscale']
+    for target in downscales:
+        # The smallest larger downscale that still leaves the gap; the planning is done on scale factors
+        # alone so it is known before the file is opened, which is what cache keys need.
+        candidates = [other for other in downscales
+                      if other.factor < target.factor and target.factor / other.factor >= gap]
+        target.derived_from = max(candidates, key=lambda other: other.factor, default=None)
+    return targets
+
+
+def decode_renditions(source, targets, timing=None):
+    # One decode for every rendition. The JPEG draft shortcut only applies when all of them are
+    # downscales, and then only down to what the largest one needs.
+    img = Image.open(source)
+    try:
+        for target in targets:
+            target.new_dimensions = target_dimensions(img.size, target.settings)
+        areas = [(target.new_dimensions or img.size)[0] * (target.new_dimensions or img.size)[1] for target in targets]
+        largest = targets[areas.index(max(areas))]
+        if timing is not None:
+            timing.input_pixels = img.width * img.height
+            timing.output_pixels = sum(areas)
+        if all(target.settings.processing_mode == 'downscale' for target in targets):
+            request_draft(img, largest.new_dimensions, largest.settings.downscale_speed)
+        check_memory_limit(img, largest.new_dimensions, largest.settings)
+        img.load()
+    except BaseException:
+        img.close()
+        raise
+    return img
+
+
+def render_renditions(img, targets, wanted):
+    # Yields (target, image) for each wanted target; the image is None when the output was streamed
+    # straight to disk. Renditions a wanted one derives from are rendered too, even when their own
+    # output is already cached. Largest outputs go first so the smaller ones can be derived from them,
+    # and multi-frame outputs go last because writing them seeks the source away from its first frame.
+    needed = set()
+    for target in wanted:
+        while target is not None:
+            needed.add(target)
+            target = target.derived_from
+    single = sorted((target for target in targets if target in needed and not is_multi_frame(img, target.target_path)),
+                    key=lambda target: target.factor)
+    multi = [target for target in targets if target in needed and is_multi_frame(img, target.target_path)]
+
+    intermediates = {}
+    for target in single + multi:
+        settings = target.settings
+        streamed = target in multi or uses_tiling(img, target.new_dimensions, settings)
+        if streamed and target not in wanted:
+            # Nothing is ever derived from a streamed output, so a cached one needs no work at all.
+            continue
+        if target in multi:
+            save_frames(img, target.new_dimensions, settings, target.target_path)
+            yield target, None
+            continue
+        if streamed:
+            with atomic_path(target.target_path, fsync=settings.fsync) as temp_path:
+                tiled_resize(img, target.new_dimensions, upscale_filter(settings.resampling), temp_path,
+                             settings.memory_budget, save_options(target.target_path, settings.encoder_profile))
+            yield target, None
+            continue
+        output = transform_image(intermediates.get(target.derived_from, img), target.new_dimensions, settings)
+        if settings.processing_mode == 'downscale':
+            intermediates[target] = output
+        if target in wanted:
+            yield target, output
+
+
+def process_renditions(file_path, settings, name=None, writer=None):
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File does not exist: {file_path}")
+    timing = FileTiming(file_path, os.path.getsize(file_path))
+    targets = plan_renditions(file_path, settings, name)
+    wanted = set(targets)
+    cache = None
+    keys = {}
+    if settings.cache_directory is not None:
+        # Each rendition is cached on its own, keyed off a single hash of the source.
+        cache = get_result_cache(settings)
+        with timing.measure('read'):
+            digest = hash_file(file_path)
+        for target in targets:
+            keys[target] = cache.key_from_digest(digest, target.cache_params())
+            with timing.measure('write'):
+                if cache.fetch(keys[target], target.target_path):
+                    wanted.discard(target)
+        timing.cache_hit = not wanted
+
+    # Outputs handed to the writer are cached once all of them have been written.
+    buffered = {}
+    if wanted:
+        with timing.measure('decode'):
+            img = decode_renditions(file_path, targets, timing)
+        with img:
+            renders = render_renditions(img, targets, wanted)
+            while True:
+                with timing.measure('resize'):
+                    target, output = next(renders, (None, None))
+                if target is None:
+                    break
+                if output is not None:
+                    with timing.measure('encode'):
+                        written = save_image(output, target.target_path, target.settings.encoder_profile,
+                                             settings.fsync, writer, timing)
+                    if written is not None:
+                        buffered[target] = written
+                        continue
+                if cache is not None:
+                    with timing.measure('write'):
+                        cache.store(keys[target], target.target_path)
+
+    output_paths = [target.target_path for target in targets]
+
+    def finish():
+        if cache is not None:
+            with timing.measure('write'):
+                for target in buffered:
+                    cache.store(keys[target], target.target_path)
+        timing.output_path = output_paths[0]
+        timing.output_bytes = sum(os.path.getsize(output_path) for output_path in output_paths)
+
+    result = ProcessingResult(file_path, output_paths[0], timing.cache_hit, timing, output_paths)
+    if buffered:
+        result.written = writer.after(list(buffered.values()), finish)
+    else:
+        finish()
+    return result
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from atomic_files import atomic_path
+
+# Bump whenever an operation's output changes for the same inputs, so stale entries stop matching.
+CACHE_VERSION = 2
+DEFAULT_CACHE_BYTES = 1024 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def default_cache_directory():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pyimgscale', 'results')
+
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def same_file(path, other_path):
+    try:
+        return os.path.samefile(path, other_path)
+    except FileNotFoundError:
+        return False
+
+
+class ResultCache:
+    def __init__(self, directory=None, max_bytes=DEFAULT_CACHE_BYTES):
+        self.directory = directory or default_cache_directory()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self.entries())
+
+    def key_for(self, file_path, params):
+        return self.key_from_digest(hash_file(file_path), params)
+
+    def key_from_digest(self, source_digest, params):
+        encoded = json.dumps({'version': CACHE_VERSION, 'source': source_digest, 'params': params}, sort_keys=True)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def entries(self):
+        for prefix in os.scandir(self.directory):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def fetch(self, key, target_path):
+        entry_path = self.entry_path(key)
+        try:
+            # The mtime doubles as the LRU timestamp.
+            os.utime(entry_path)
+            if same_file(entry_path, target_path):
+                # Linked to this entry by an earlier hit. Renaming a link over another link to the same file
+                # does nothing, which would leave the temporary link behind.
+                self.hits += 1
+                return True
+            # Outputs are always replaced by rename, never rewritten in place, so a hardlinked hit can't
+            # be written through into the cache entry. mode=None: chmod would change the shared inode.
+            with atomic_path(target_path, mode=None) as temp_path:
+                os.unlink(temp_path)
+                link_or_copy(entry_path, temp_path)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, output_path):
+        entry_path = self.entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(output_path, temp_path)
+            # mkstemp creates owner-only files; hits are hardlinked, so keep the output's permissions.
+            shutil.copymode(output_path, temp_path)
+            os.replace(temp_path, entry_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        self.total_bytes += os.path.getsize(entry_path)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # Other worker processes share the directory, so re-measure instead of trusting our running total.
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.total_bytes = sum(size for _, size, _ in entries)
+        for entry_path, size, _ in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(entry_path)
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+        self.total_bytes = 0
@@ -0,0 +1,93 @@
+import threading
+
+FAILURE_KINDS = ('missing', 'unreadable', 'skipped', 'timeout', 'memory', 'error')
+
+
+class FileTimeoutError(Exception):
+    pass
+
+
+class FileMemoryError(MemoryError):
+    pass
+
+
+class SourceFormatError(Exception):
+    # The file is fine, just not in the format a convert run was told to pick out.
+    pass
+
+
+class RunControl:
+    # Shared between whoever drives a run and the UI. Executors check it before starting each file, so a
+    # pause lets the files already in flight finish and a cancel stops the run at the next file boundary.
+    def __init__(self):
+        self.running = threading.Event()
+        self.running.set()
+        self.cancelled = threading.Event()
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.running.set()
+
+    def is_paused(self):
+        return not self.running.is_set()
+
+    def is_cancelled(self):
+        return self.cancelled.is_set()
+
+    def wait_if_paused(self):
+        # Blocks while paused; False once the run has been cancelled.
+        self.running.wait()
+        return not self.cancelled.is_set()
+
+
+def should_start(control):
+    return control is None or control.wait_if_paused()
+
+
+class FailureRecord:
+    def __init__(self, source_path, kind, message, error_type=None):
+        self.source_path = source_path
+        self.kind = kind
+        self.message = message
+        self.error_type = error_type
+
+    def as_dict(self):
+        return {'source_path': self.source_path, 'kind': self.kind, 'error_type': self.error_type,
+                'message': self.message}
+
+    def __str__(self):
+        return f"{self.kind}: {self.message}"
+
+
+def failure_kind(error):
+    # Imported here so the GUI can set up run controls without loading Pillow.
+    from PIL import Image, UnidentifiedImageError
+
+    if isinstance(error, FileNotFoundError):
+        return 'missing'
+    if isinstance(error, (FileTimeoutError, TimeoutError)):
+        return 'timeout'
+    if isinstance(error, (MemoryError, Image.DecompressionBombError)):
+        return 'memory'
+    if isinstance(error, UnidentifiedImageError):
+        return 'unreadable'
+    if isinstance(error, SourceFormatError):
+        return 'skipped'
+    return 'error'
+
+
+def failure_record(source_path, error):
+    return FailureRecord(source_path, failure_kind(error), str(error) or type(error).__name__, type(error).__name__)
+
+
+def summarize_failures(failures):
+    counts = {}
+    for failure in failures:
+        counts[failure.kind] = counts.get(failure.kind, 0) + 1
+    return ', '.join(f"{counts[kind]} {kind}" for kind in FAILURE_KINDS if kind in counts)
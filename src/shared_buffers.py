@@ -0,0 +1,152 @@
+import threading
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+from PIL import Image
+
+from engine import bytes_per_pixel
+
+# Decoded pixels kept in shared memory, so pipeline stages running in worker processes hand images to each
+# other by naming a buffer instead of pickling the pixels through a pipe. The parent owns every buffer
+# through a SharedBufferPool and reuses them from file to file; the workers only map them.
+
+# Pickling an image copies its pixels four times on the way to another process: tobytes, the pickle
+# itself, unpickling and frombytes.
+PICKLE_COPIES = 4
+# Pillow maps every other mode onto a buffer laid out the way it keeps that mode in memory.
+UNSHARED_MODES = ('1', 'I;16L', 'I;16B', 'I;16N', 'BGR;15', 'BGR;16', 'BGR;24')
+# Buffers are allocated in whole granules. An idle buffer is reused for any image that needs at least
+# half of it, so files of similar size keep cycling through the same few buffers.
+BUFFER_GRANULE = 1024 * 1024
+DEFAULT_IDLE_BYTES = 256 * 1024 * 1024
+# Buffers a worker process keeps mapped between calls.
+ATTACHED_BUFFERS = 8
+
+
+def image_bytes(mode, size):
+    return size[0] * size[1] * bytes_per_pixel(mode)
+
+
+def can_share(img):
+    return img.mode not in UNSHARED_MODES
+
+
+def palette_of(img):
+    if img.mode not in ('P', 'PA') or img.palette is None:
+        return None
+    return img.palette.mode, img.palette.tobytes()
+
+
+class SharedImage:
+    # Stands in for an image between stages: which buffer holds its pixels and how to map them.
+    def __init__(self, name, mode, size, info=None, palette=None):
+        self.name = name
+        self.mode = mode
+        self.size = size
+        self.info = info or {}
+        self.palette = palette
+
+    def nbytes(self):
+        return image_bytes(self.mode, self.size)
+
+
+def map_image(shared, buffer):
+    # An image whose pixels are the buffer's memory: nothing is copied, and writes to it land in the buffer.
+    img = Image.new(shared.mode, (0, 0))._new(Image.core.map_buffer(buffer, shared.size, 'raw', 0,
+                                                                     (shared.mode, 0, 1)))
+    img.info = dict(shared.info)
+    if shared.palette is not None:
+        palette_mode, data = shared.palette
+        img.putpalette(data, palette_mode)
+    return img
+
+
+def copy_into(target, img):
+    target.im.paste(img.im, (0, 0) + img.size)
+
+
+def close_buffer(block):
+    try:
+        block.close()
+    except BufferError:
+        # An image still maps it; the memory goes once that image does.
+        pass
+
+
+_attached = OrderedDict()
+
+
+def attached_buffer(name):
+    # Called in worker processes. Pool buffers come round again and again, so the last few stay mapped.
+    if name in _attached:
+        _attached.move_to_end(name)
+    else:
+        _attached[name] = shared_memory.SharedMemory(name)
+        while len(_attached) > ATTACHED_BUFFERS:
+            close_buffer(_attached.popitem(last=False)[1])
+    return _attached[name].buf
+
+
+def attached_image(image):
+    # Stages take either a SharedImage or, for modes that can't be shared, the pickled image itself.
+    return map_image(image, attached_buffer(image.name)) if isinstance(image, SharedImage) else image
+
+
+class SharedBufferPool:
+    def __init__(self, max_idle_bytes=DEFAULT_IDLE_BYTES):
+        self.max_idle_bytes = max_idle_bytes
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.idle = []
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self, nbytes):
+        with self.lock:
+            fits = [block for block in self.idle if nbytes <= block.size <= max(2 * nbytes, BUFFER_GRANULE)]
+            if fits:
+                block = min(fits, key=lambda block: block.size)
+                self.idle.remove(block)
+                self.reused += 1
+                return block.name
+        size = -(-max(nbytes, 1) // BUFFER_GRANULE) * BUFFER_GRANULE
+        block = shared_memory.SharedMemory(create=True, size=size)
+        with self.lock:
+            self.buffers[block.name] = block
+            self.allocated += 1
+        return block.name
+
+    def release(self, name):
+        with self.lock:
+            block = self.buffers.get(name)
+            if block is None or block in self.idle:
+                return
+            self.idle.append(block)
+            # The longest idle buffers are freed once too much memory sits unused.
+            while sum(block.size for block in self.idle) > self.max_idle_bytes:
+                self.free(self.idle.pop(0))
+
+    def free(self, block):
+        del self.buffers[block.name]
+        block.unlink()
+        close_buffer(block)
+
+    def image(self, shared):
+        return map_image(shared, self.buffers[shared.name].buf)
+
+    def share(self, img):
+        # The one copy it takes to get an image the parent decoded or resized over to another process.
+        shared = SharedImage(self.acquire(image_bytes(img.mode, img.size)), img.mode, img.size, img.info,
+                             palette_of(img))
+        copy_into(self.image(shared), img)
+        return shared
+
+    def held_bytes(self):
+        with self.lock:
+            return sum(block.size for block in self.buffers.values())
+
+    def close(self):
+        with self.lock:
+            for block in list(self.buffers.values()):
+                self.free(block)
+            self.idle = []
@@ -0,0 +1,61 @@
+import os
+from collections import OrderedDict
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def thumbnail_key(file_path):
+    # mtime and size are part of the key so a file rewritten in place never serves a stale thumbnail.
+    stat = os.stat(file_path)
+    return file_path, stat.st_mtime_ns, stat.st_size
+
+
+class ThumbnailCache:
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        # Entries in use on screen, which eviction passes over even when that leaves the cache over budget.
+        self.pinned = set()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, cost):
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key)[1]
+        if cost > self.max_bytes:
+            return
+        self.entries[key] = (value, cost)
+        self.total_bytes += cost
+        self.evict()
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def pin(self, keys):
+        self.pinned = set(keys)
+        self.evict()
+
+    def evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key in [key for key in self.entries if key not in self.pinned]:
+            self.total_bytes -= self.entries.pop(key)[1]
+            if self.total_bytes <= self.max_bytes:
+                return
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
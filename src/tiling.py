@@ -0,0 +1,194 @@
+import math
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+
+from PIL import Image
+
+from processing_options import DEFAULT_MEMORY_BUDGET
+
+# Half-width of each Pillow filter in source pixels. When downsampling Pillow widens the kernel by the
+# scale ratio, so the real footprint is support * max(scale, 1).
+FILTER_SUPPORT = {
+    Image.NEAREST: 0.5,
+    Image.BOX: 0.5,
+    Image.BILINEAR: 1.0,
+    Image.HAMMING: 1.0,
+    Image.BICUBIC: 2.0,
+    Image.LANCZOS: 3.0,
+}
+
+# mode -> (bit depth, PNG colour type, raw mode the rows are serialised in)
+PNG_MODES = {
+    '1': (1, 0, '1'),
+    'L': (8, 0, 'L'),
+    'LA': (8, 4, 'LA'),
+    'I;16': (16, 0, 'I;16B'),
+    'RGB': (8, 2, 'RGB'),
+    'RGBA': (8, 6, 'RGBA'),
+    'P': (8, 3, 'P'),
+}
+
+# Modes Image.frombuffer can wrap around a memory map without copying. RGB is stored padded as RGBX,
+# which is how Pillow lays it out in memory anyway.
+MAPPED_MODES = {
+    'L': ('L', 1),
+    'RGB': ('RGBX', 4),
+    'RGBA': ('RGBA', 4),
+    'CMYK': ('CMYK', 4),
+}
+
+
+def bytes_per_pixel(mode):
+    return 1 if mode in ('1', 'L', 'P') else 4
+
+
+def estimate_resize_bytes(size, mode):
+    return size[0] * size[1] * bytes_per_pixel(mode)
+
+
+def needs_tiling(size, mode, memory_budget):
+    return memory_budget is not None and estimate_resize_bytes(size, mode) > memory_budget
+
+
+def source_window(out_start, out_end, scale, support, in_size):
+    # Source rows feeding output rows [out_start, out_end), padded by the kernel radius plus a guard
+    # pixel for rounding so the seam rows see exactly the same neighbourhood as a whole-image resize.
+    radius = support * max(scale, 1.0)
+    start = max(int(math.floor(out_start * scale - radius)) - 1, 0)
+    end = min(int(math.ceil(out_end * scale + radius)) + 1, in_size)
+    return start, end
+
+
+def strip_height_for_budget(img, size, resample, memory_budget):
+    in_width, in_height = img.size
+    out_width, out_height = size
+    scale = in_height / out_height
+    radius = FILTER_SUPPORT.get(resample, 3.0) * max(scale, 1.0)
+    pixel_bytes = bytes_per_pixel(img.mode)
+
+    # Per output row we hold the output strip, its serialised copy, the horizontally resampled
+    # intermediate and the cropped source rows; the kernel overlap is a fixed cost per strip.
+    per_row = pixel_bytes * (out_width * (2 + scale) + in_width * scale)
+    overlap = pixel_bytes * (out_width + in_width) * (2 * radius + 2)
+    return max(1, min(out_height, int((memory_budget - overlap) // per_row)))
+
+
+def iter_resized_strips(img, size, resample, strip_height):
+    in_width, in_height = img.size
+    out_width, out_height = size
+    scale = in_height / out_height
+    support = FILTER_SUPPORT.get(resample, 3.0)
+
+    for y0 in range(0, out_height, strip_height):
+        y1 = min(y0 + strip_height, out_height)
+        src_start, src_end = source_window(y0, y1, scale, support, in_height)
+        source_strip = img.crop((0, src_start, in_width, src_end))
+        # Offsets are formed from integers before dividing so seam rows land on the same sample
+        # positions as a whole-image resize, up to float rounding.
+        box = (0, (y0 * in_height - src_start * out_height) / out_height,
+               in_width, (y1 * in_height - src_start * out_height) / out_height)
+        yield y0, source_strip.resize((out_width, y1 - y0), resample, box=box)
+
+
+class StreamingPngWriter:
+    def __init__(self, fp, size, mode, info=None, palette=None, compress_level=6):
+        self.fp = fp
+        self.mode = mode
+        bit_depth, color_type, self.rawmode = PNG_MODES[mode]
+        info = info or {}
+
+        fp.write(b'\x89PNG\r\n\x1a\n')
+        self.write_chunk(b'IHDR', struct.pack('>IIBBBBB', size[0], size[1], bit_depth, color_type, 0, 0, 0))
+
+        icc_profile = info.get('icc_profile')
+        if icc_profile:
+            self.write_chunk(b'iCCP', b'ICC Profile\x00\x00' + zlib.compress(icc_profile))
+
+        if mode == 'P':
+            self.write_chunk(b'PLTE', bytes(palette[:len(palette) - len(palette) % 3]))
+
+        transparency = info.get('transparency')
+        if transparency is not None:
+            if mode == 'P':
+                alpha = transparency if isinstance(transparency, bytes) else b'\xff' * transparency + b'\x00'
+                self.write_chunk(b'tRNS', alpha)
+            elif mode in ('1', 'L', 'I;16') and isinstance(transparency, int):
+                self.write_chunk(b'tRNS', struct.pack('>H', transparency))
+            elif mode == 'RGB' and isinstance(transparency, tuple):
+                self.write_chunk(b'tRNS', struct.pack('>HHH', *transparency))
+
+        self.compressor = zlib.compressobj(compress_level)
+
+    def write_chunk(self, chunk_type, data):
+        self.fp.write(struct.pack('>I', len(data)))
+        self.fp.write(chunk_type)
+        self.fp.write(data)
+        self.fp.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    def write(self, strip):
+        # Rows use PNG filter type 0, so each scanline is just a zero byte followed by the raw pixels.
+        raw = memoryview(strip.tobytes('raw', self.rawmode))
+        stride = len(raw) // strip.height
+        chunks = []
+        for offset in range(0, len(raw), stride):
+            chunks.append(self.compressor.compress(b'\x00'))
+            chunks.append(self.compressor.compress(raw[offset:offset + stride]))
+        data = b''.join(chunks)
+        if data:
+            self.write_chunk(b'IDAT', data)
+
+    def close(self):
+        self.write_chunk(b'IDAT', self.compressor.flush())
+        self.write_chunk(b'IEND', b'')
+
+
+def resize_to_png(img, size, resample, target_path, strip_height, compress_level=6):
+    with open(target_path, 'wb') as fp:
+        writer = StreamingPngWriter(fp, size, img.mode, img.info, img.getpalette() if img.mode == 'P' else None,
+                                    compress_level)
+        for _, strip in iter_resized_strips(img, size, resample, strip_height):
+            writer.write(strip)
+        writer.close()
+
+
+def resize_to_mapped_buffer(img, size, resample, target_path, strip_height, save_options):
+    storage_mode, pixel_bytes = MAPPED_MODES[img.mode]
+    row_bytes = size[0] * pixel_bytes
+
+    # The output lives in a file-backed map next to the target, so the kernel can page it out
+    # instead of the process holding the whole upscaled image in anonymous memory.
+    with tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(target_path))) as backing:
+        backing.truncate(row_bytes * size[1])
+        with mmap.mmap(backing.fileno(), row_bytes * size[1]) as buffer:
+            for y0, strip in iter_resized_strips(img, size, resample, strip_height):
+                data = strip.tobytes('raw', storage_mode)
+                buffer[y0 * row_bytes:y0 * row_bytes + len(data)] = data
+
+            output = Image.frombuffer(storage_mode, size, buffer, 'raw', storage_mode, 0, 1)
+            output.info = dict(img.info)
+            try:
+                output.save(target_path, **save_options)
+            except OSError:
+                # Formats without RGBX support (BMP, TGA, PDF) need a real RGB copy of the output.
+                output.convert(img.mode).save(target_path, **save_options)
+            del output
+
+
+def tiled_resize(img, size, resample, target_path, memory_budget=DEFAULT_MEMORY_BUDGET, save_options=None):
+    img.load()
+    strip_height = strip_height_for_budget(img, size, resample, memory_budget)
+    save_options = save_options or {}
+
+    if os.path.splitext(target_path)[1].lower() == '.png' and img.mode in PNG_MODES:
+        # Rows are compressed as they stream out, so only the zlib level carries over; PNG optimize
+        # needs the whole image and is skipped.
+        resize_to_png(img, size, resample, target_path, strip_height, save_options.get('compress_level', 6))
+    elif img.mode in MAPPED_MODES:
+        resize_to_mapped_buffer(img, size, resample, target_path, strip_height, save_options)
+    else:
+        print(f"Tiled resize does not support mode {img.mode}, resizing {target_path} in one piece.")
+        img.resize(size, resample).save(target_path, **save_options)
+    return target_path
@@ -0,0 +1,225 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from model_registry import MODEL_BACKENDS
+
+# Learned upscaling runs on the CPU. .onnx models go through ONNX Runtime (optional, pip install
+# onnxruntime); .npz files hold a small convolutional network that NumPy runs itself:
+#   weight0, bias0, weight1, bias1, ...  conv layers in PyTorch layout (out, in, k, k), zero padded
+#   scale                                the upscale factor; the last layer has channels * scale**2
+#                                        outputs, rearranged into pixels like PyTorch's PixelShuffle
+#   activation                           'relu' (default) or 'tanh', applied between layers
+# Networks with one input channel are run on luma, with the chroma resized by bicubic, as ESPCN does.
+# Models are found and listed by model_registry.py.
+
+# Images are fed to the model in overlapping tiles, several tiles per call. In each overlap the outer
+# quarter of a tile, whose pixels the zero padding reaches into, is ignored and the rest cross-fades
+# linearly, so tile borders don't show.
+DEFAULT_TILE_SIZE = 128
+DEFAULT_TILE_OVERLAP = 16
+DEFAULT_TILE_BATCH = 4
+ACTIVATIONS = {
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'tanh': lambda x: np.tanh(x, out=x),
+}
+
+
+def conv2d(x, weight, bias):
+    # x is NHWC and weight (k, k, in, out): one matrix product per kernel tap instead of a large im2col copy.
+    k = weight.shape[0]
+    pad = k // 2
+    n, h, w, _ = x.shape
+    padded = np.pad(x, ((0, 0), (pad, pad), (pad, pad), (0, 0))) if pad else x
+    out = np.empty((n, h, w, weight.shape[3]), dtype=np.float32)
+    out[...] = bias
+    for dy in range(k):
+        for dx in range(k):
+            out += padded[:, dy:dy + h, dx:dx + w, :] @ weight[dy, dx]
+    return out
+
+
+def pixel_shuffle(x, scale):
+    n, h, w, channels = x.shape
+    channels //= scale * scale
+    x = x.reshape(n, h, w, channels, scale, scale).transpose(0, 1, 4, 2, 5, 3)
+    return x.reshape(n, h * scale, w * scale, channels)
+
+
+class NumpyModel:
+    backend = 'numpy'
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            count = sum(1 for key in data.files if key.startswith('weight'))
+            self.layers = [(np.ascontiguousarray(data[f'weight{i}'].transpose(2, 3, 1, 0), dtype=np.float32),
+                            data[f'bias{i}'].astype(np.float32)) for i in range(count)]
+            self.scale = int(data['scale'])
+            self.activation = ACTIVATIONS[str(data['activation']) if 'activation' in data.files else 'relu']
+        if not self.layers:
+            raise ValueError(f"{path} has no weight0")
+        self.channels = self.layers[0][0].shape[2]
+        if self.layers[-1][0].shape[3] != self.channels * self.scale ** 2:
+            raise ValueError(f"{path}: the last layer needs {self.channels * self.scale ** 2} outputs for "
+                             f"{self.channels} channel(s) at {self.scale}x")
+        self.tile_size = None
+        self.max_batch = None
+
+    def run(self, batch):
+        x = batch
+        for index, (weight, bias) in enumerate(self.layers):
+            x = conv2d(x, weight, bias)
+            if index < len(self.layers) - 1:
+                x = self.activation(x)
+        return pixel_shuffle(x, self.scale)
+
+
+class OnnxModel:
+    backend = 'onnx'
+
+    def __init__(self, path, threads=None):
+        # Imported here because ONNX Runtime is optional and heavy.
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads or 0
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # NCHW; a dimension given as a string or None is dynamic.
+        batch, channels, height, width = model_input.shape
+        self.channels = channels if isinstance(channels, int) else 3
+        self.max_batch = batch if isinstance(batch, int) else None
+        self.tile_size = height if isinstance(height, int) and height == width else None
+        probe = self.tile_size or 16
+        output = self.session.run(None, {self.input_name: np.zeros((1, self.channels, probe, probe), np.float32)})[0]
+        self.scale = output.shape[2] // probe
+
+    def run(self, batch):
+        output = self.session.run(None, {self.input_name: np.ascontiguousarray(batch.transpose(0, 3, 1, 2))})[0]
+        return output.transpose(0, 2, 3, 1)
+
+
+# One loaded model per process: each worker pays for loading a model once, not once per file.
+_models = {}
+_models_lock = threading.Lock()
+_tile_pools = {}
+
+
+def load_model(path):
+    with _models_lock:
+        if path not in _models:
+            if MODEL_BACKENDS.get(os.path.splitext(path)[1].lower()) == 'onnx':
+                _models[path] = OnnxModel(path)
+            else:
+                _models[path] = NumpyModel(path)
+        return _models[path]
+
+
+def tile_pool(threads):
+    # NumPy's matrix products release the GIL, so batches of tiles run in parallel on plain threads.
+    with _models_lock:
+        if threads not in _tile_pools:
+            _tile_pools[threads] = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='model-tiles')
+        return _tile_pools[threads]
+
+
+def blend_ramp(length, overlap, leading=True, trailing=True):
+    # Rising and falling ramps of neighbouring tiles sum to one across the overlap; a side on the image
+    # border has no neighbour and keeps full weight. Weights never reach zero, so the normalization in
+    # run_tiled stays defined where ramps meet in an unusually wide overlap.
+    margin = overlap // 4
+    ramp = np.clip((np.arange(length, dtype=np.float32) + 0.5 - margin) / max(overlap - 2 * margin, 1), 1e-4, 1.0)
+    ones = np.ones(length, dtype=np.float32)
+    return np.minimum(ramp if leading else ones, ramp[::-1] if trailing else ones)
+
+
+def tile_weights(starts, length, overlap):
+    return [blend_ramp(length, overlap, index > 0, index < len(starts) - 1) for index in range(len(starts))]
+
+
+def tile_starts(length, tile_size, step):
+    # Every tile lies wholly inside the image, the last one moved back to end at the border, so the model
+    # only ever sees the image edge where the image really ends.
+    if length <= tile_size:
+        return [0]
+    return list(range(0, length - tile_size, step)) + [length - tile_size]
+
+
+def run_tiled(model, pixels, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_TILE_OVERLAP, batch_size=DEFAULT_TILE_BATCH,
+              threads=None):
+    # pixels is HWC float32 in 0..1; returns the upscaled HWC float32. Tiles are processed a row at a time
+    # and each row's finished output rows are written out before the next, so only one row of tiles is
+    # ever held at full precision.
+    tile_size = model.tile_size or tile_size
+    batch_size = min(batch_size, model.max_batch or batch_size)
+    overlap = min(overlap, tile_size // 4)
+    scale = model.scale
+    height, width, channels = pixels.shape
+    tile_height, tile_width = min(tile_size, height), min(tile_size, width)
+    output = np.empty((height * scale, width * scale, channels), dtype=np.float32)
+    ys = tile_starts(height, tile_size, tile_size - overlap)
+    xs = tile_starts(width, tile_size, tile_size - overlap)
+    row_weights = tile_weights(ys, tile_height * scale, overlap * scale)
+    column_weights = tile_weights(xs, tile_width * scale, overlap * scale)
+    pool = tile_pool(threads or os.cpu_count() or 1)
+
+    carry = None
+    for index, y in enumerate(ys):
+        tiles = [pixels[y:y + tile_height, x:x + tile_width] for x in xs]
+        if model.tile_size:
+            # Models built for one input size get images smaller than that zero padded up to it.
+            padding = ((0, tile_size - tile_height), (0, tile_size - tile_width), (0, 0))
+            tiles = [np.pad(tile, padding) for tile in tiles]
+        batches = [np.stack(tiles[i:i + batch_size]) for i in range(0, len(tiles), batch_size)]
+        results = np.concatenate(list(pool.map(model.run, batches)))[:, :tile_height * scale, :tile_width * scale]
+
+        total = np.zeros((tile_height * scale, width * scale, channels), dtype=np.float32)
+        weights = np.zeros((tile_height * scale, width * scale, 1), dtype=np.float32)
+        if carry is not None:
+            total[:len(carry[0])] += carry[0]
+            weights[:len(carry[1])] += carry[1]
+        for x, column_weight, result in zip(xs, column_weights, results):
+            weight = (row_weights[index][:, None] * column_weight[None, :])[..., None]
+            total[:, x * scale:(x + tile_width) * scale] += result * weight
+            weights[:, x * scale:(x + tile_width) * scale] += weight
+
+        next_y = ys[index + 1] if index + 1 < len(ys) else height
+        done = (next_y - y) * scale
+        output[y * scale:next_y * scale] = total[:done] / weights[:done]
+        carry = (total[done:], weights[done:])
+    return output
+
+
+def model_pass(model, img, **tile_options):
+    # One run of the model over an RGB image.
+    if model.channels == 1:
+        luma, cb, cr = img.convert('YCbCr').split()
+        pixels = np.asarray(luma, dtype=np.float32)[..., None] / 255
+        upscaled = run_tiled(model, pixels, **tile_options)
+        luma = Image.fromarray(np.clip(upscaled[..., 0] * 255 + 0.5, 0, 255).astype(np.uint8), 'L')
+        chroma = [band.resize(luma.size, Image.BICUBIC) for band in (cb, cr)]
+        return Image.merge('YCbCr', [luma] + chroma).convert('RGB')
+    pixels = np.asarray(img, dtype=np.float32) / 255
+    upscaled = run_tiled(model, pixels, **tile_options)
+    return Image.fromarray(np.clip(upscaled * 255 + 0.5, 0, 255).astype(np.uint8), 'RGB')
+
+
+def model_upscale(img, new_dimensions, model_path, **tile_options):
+    # The model runs once, and again for as long as another pass doesn't overshoot the target; LANCZOS
+    # then takes the result to the exact size asked for. Alpha is resized with LANCZOS alongside.
+    model = load_model(model_path)
+    alpha = img.convert('RGBA').getchannel('A') if 'A' in img.getbands() or 'transparency' in img.info else None
+    output = model_pass(model, img.convert('RGB'), **tile_options)
+    while output.width * model.scale <= new_dimensions[0] and output.height * model.scale <= new_dimensions[1]:
+        output = model_pass(model, output, **tile_options)
+    if output.size != tuple(new_dimensions):
+        output = output.resize(new_dimensions, Image.LANCZOS)
+    if img.mode in ('1', 'L', 'LA', 'I', 'I;16', 'F'):
+        output = output.convert('L')
+    if alpha is not None:
+        output.putalpha(alpha.resize(new_dimensions, Image.LANCZOS))
+    return output
@@ -0,0 +1,353 @@
+import math
+import os
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from engine import (DEFAULT_WRITE_BUFFER_BYTES, DEFAULT_WRITE_THREADS, DOWNSCALE_SPEEDS, RENDITIONS_MODE,
+                    ProcessingResult, SerialExecutor, decode_image, get_result_cache, is_multi_frame,
+                    output_path_for, resolve_output_names, run_operation, save_image, transform_image, uses_model,
+                    uses_tiling)
+from instrumentation import FileTiming
+from output_writer import OutputWriter, settled
+from run_control import FileTimeoutError, should_start
+
+DEFAULT_BATCH_SIZE = 16
+# Dense coefficient matrices grow with in_size * out_size; past this the per-image PIL path is cheaper.
+MAX_COEFFICIENT_BYTES = 64 * 1024 * 1024
+VECTOR_MODES = {'L': 1, 'LA': 2, 'RGB': 3, 'RGBA': 4}
+PREMULTIPLIED_MODES = {'LA': 'La', 'RGBA': 'RGBa'}
+BLOCK_OUTPUTS = 128
+# Pillow rounds its weights to this many fractional bits and sums in integers.
+PRECISION_BITS = 22
+
+
+def sinc(x):
+    if x == 0.0:
+        return 1.0
+    x *= math.pi
+    return math.sin(x) / x
+
+
+def box_filter(x):
+    return 1.0 if -0.5 < x <= 0.5 else 0.0
+
+
+def bilinear_filter(x):
+    x = abs(x)
+    return 1.0 - x if x < 1.0 else 0.0
+
+
+def bicubic_filter(x, a=-0.5):
+    x = abs(x)
+    if x < 1.0:
+        return ((a + 2.0) * x - (a + 3.0)) * x * x + 1
+    if x < 2.0:
+        return (((x - 5) * x + 8) * x - 4) * a
+    return 0.0
+
+
+def lanczos_filter(x):
+    return sinc(x) * sinc(x / 3) if -3.0 <= x < 3.0 else 0.0
+
+
+# name -> (kernel, support), with the same supports Pillow uses so the taps line up.
+FILTERS = {
+    'box': (box_filter, 0.5),
+    'bilinear': (bilinear_filter, 1.0),
+    'bicubic': (bicubic_filter, 2.0),
+    'lanczos': (lanczos_filter, 3.0),
+}
+PRESET_FILTERS = {
+    # preset -> (upscale filter, downscale filter). The balanced and fast downscales reduce() before or
+    # instead of filtering, which has no batched equivalent, so those run through the engine.
+    'quality': ('lanczos', 'lanczos'),
+    'balanced': ('bicubic', None),
+    'fast': ('bilinear', None),
+}
+
+
+def vector_filter_for(settings):
+    # The filter giving what transform_image would, or None when only transform_image can. Batched results
+    # share the engine's cache entries, so a preset must not take a different path here.
+    upscale = settings.processing_mode == 'upscale'
+    if not upscale and DOWNSCALE_SPEEDS[settings.downscale_speed] is not None:
+        # A reducing gap box-reduces first as well.
+        return None
+    if settings.resampling in FILTERS:
+        return settings.resampling
+    if settings.resampling in PRESET_FILTERS:
+        return PRESET_FILTERS[settings.resampling][0 if upscale else 1]
+    return None
+
+
+@lru_cache(maxsize=64)
+def coefficients(in_size, out_size, filter_name):
+    # Mirrors Pillow's precompute_coeffs: each output sample is a normalised window of source samples,
+    # widened by the scale when downsampling so the filter also low-passes.
+    kernel, support = FILTERS[filter_name]
+    scale = in_size / out_size
+    filter_scale = max(scale, 1.0)
+    support *= filter_scale
+    matrix = np.zeros((out_size, in_size), dtype=np.float64)
+    for out_index in range(out_size):
+        center = (out_index + 0.5) * scale
+        start = max(int(center - support + 0.5), 0)
+        end = min(int(center + support + 0.5), in_size)
+        weights = [kernel((x - center + 0.5) / filter_scale) for x in range(start, end)]
+        total = sum(weights)
+        if total:
+            matrix[out_index, start:end] = [fixed_point(weight / total) for weight in weights]
+    matrix.setflags(write=False)
+    return matrix
+
+
+@lru_cache(maxsize=64)
+def coefficient_blocks(in_size, out_size, filter_name):
+    # The matrix is banded, so a dense product mostly multiplies zeros. Splitting the outputs into tiles
+    # and keeping only the source columns each tile touches cuts that waste while staying one GEMM per tile.
+    matrix = coefficients(in_size, out_size, filter_name)
+    blocks = []
+    for out_start in range(0, out_size, BLOCK_OUTPUTS):
+        rows = matrix[out_start:out_start + BLOCK_OUTPUTS]
+        columns = np.flatnonzero(rows.any(axis=0))
+        start, end = (columns[0], columns[-1] + 1) if len(columns) else (0, 0)
+        blocks.append((out_start, out_start + len(rows), start, end, np.ascontiguousarray(rows[:, start:end])))
+    return blocks
+
+
+def fixed_point(weight):
+    # Rounded half away from zero, as Pillow's normalize_coeffs_8bpc does. Weights like 0.3 and 0.7 land many
+    # sums exactly on a half, and only the same rounded weights break those ties the way Pillow does.
+    scale = 1 << PRECISION_BITS
+    return math.trunc(weight * scale + math.copysign(0.5, weight)) / scale
+
+
+def coefficient_bytes(size, new_dimensions):
+    return 8 * (size[0] * new_dimensions[0] + size[1] * new_dimensions[1])
+
+
+def round_to_bytes(values):
+    # Pillow keeps 8-bit intermediates between the passes, rounding half up.
+    values += 0.5
+    np.floor(values, out=values)
+    return np.clip(values, 0, 255, out=values)
+
+
+def resize_batch(stack, new_dimensions, filter_name):
+    # stack is (images, height, width, bands) uint8. Working on band planes turns each pass into a few
+    # large matrix products over the whole batch, which is where BLAS is efficient. float64 holds Pillow's
+    # integer sums of 8-bit samples times 22-bit weights exactly; in float32 they round, and near-ties come
+    # out a level off, which the second pass can double.
+    count, height, width, bands = stack.shape
+    out_width, out_height = new_dimensions
+    planes = stack.transpose(0, 3, 1, 2).astype(np.float64, order='C')
+    if out_width != width:
+        rows = planes.reshape(-1, width)
+        resized = np.empty((rows.shape[0], out_width), dtype=np.float64)
+        for out_start, out_end, start, end, block in coefficient_blocks(width, out_width, filter_name):
+            np.matmul(rows[:, start:end], block.T, out=resized[:, out_start:out_end])
+        planes = round_to_bytes(resized).reshape(count, bands, height, out_width)
+    if out_height != height:
+        columns = planes.reshape(count * bands, height, out_width)
+        resized = np.empty((count * bands, out_height, out_width), dtype=np.float64)
+        for out_start, out_end, start, end, block in coefficient_blocks(height, out_height, filter_name):
+            np.matmul(block, columns[:, start:end], out=resized[:, out_start:out_end])
+        planes = round_to_bytes(resized).reshape(count, bands, out_height, out_width)
+    # Narrow to bytes before interleaving the bands again; the strided copy is four times cheaper.
+    return np.ascontiguousarray(planes.astype(np.uint8).transpose(0, 2, 3, 1))
+
+
+def resize_images(images, new_dimensions, filter_name):
+    mode = images[0].mode
+    # Resample premultiplied like Pillow does, or transparent pixels bleed their colour into edges.
+    working_mode = PREMULTIPLIED_MODES.get(mode, mode)
+    stack = np.stack([np.asarray(img.convert(working_mode) if working_mode != mode else img) for img in images])
+    if stack.ndim == 3:
+        stack = stack[:, :, :, None]
+    resized = resize_batch(stack, new_dimensions, filter_name)
+    outputs = []
+    for array in resized:
+        output = Image.frombuffer(working_mode, new_dimensions, array.tobytes(), 'raw', working_mode, 0, 1)
+        outputs.append(output.convert(mode) if working_mode != mode else output)
+    return outputs
+
+
+def batch_limit(size, new_dimensions, bands, batch_size, memory_budget):
+    # The float64 planes are held at input, intermediate and output size at once.
+    per_image = 8 * bands * (size[0] * size[1] + new_dimensions[0] * size[1] + new_dimensions[0] * new_dimensions[1])
+    return max(1, min(batch_size, memory_budget // per_image if memory_budget else batch_size))
+
+
+class PendingFile:
+    def __init__(self, index, source_path, timing, cache_key=None):
+        self.index = index
+        self.source_path = source_path
+        self.target_path = None
+        self.timing = timing
+        self.cache_key = cache_key
+        self.image = None
+        self.new_dimensions = None
+        # The future of the output's background write, once it has been handed to the writer.
+        self.written = None
+
+
+class BatchResizeExecutor:
+    max_workers = 1
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, write_threads=DEFAULT_WRITE_THREADS,
+                 write_buffer_bytes=DEFAULT_WRITE_BUFFER_BYTES):
+        self.batch_size = batch_size
+        self.write_threads = write_threads
+        self.write_buffer_bytes = write_buffer_bytes
+
+    def run(self, file_paths, settings, control=None, names=None):
+        # Consecutive files that decode to the same size and mode are resized together. Files that can't
+        # be batched flush whatever is pending first, so results still come out in queue order.
+        if names is None:
+            names = resolve_output_names(file_paths, settings)
+        if settings.processing_mode == RENDITIONS_MODE:
+            # Each file already shares one decode across its renditions, and their sizes differ, so there
+            # is nothing to batch; they run one file at a time.
+            yield from SerialExecutor(self.write_threads, self.write_buffer_bytes).run(file_paths, settings,
+                                                                                       control, names)
+            return
+        writer = OutputWriter(self.write_threads, self.write_buffer_bytes, settings.fsync)
+        try:
+            yield from settled(self.start(file_paths, settings, control, names, writer), control)
+        finally:
+            writer.shutdown()
+
+    def start(self, file_paths, settings, control, names, writer):
+        cache = get_result_cache(settings) if settings.cache_directory is not None else None
+        batch = []
+        for i, file_path in enumerate(file_paths):
+            if control is not None and control.is_paused():
+                # Finish what is batched so its results aren't held back for the length of the pause.
+                yield from self.flush(batch, settings, cache, writer, control)
+            if not should_start(control):
+                self.discard(batch)
+                return
+            try:
+                pending = self.prepare(i, file_path, settings, cache, names.get(file_path), writer)
+            except Exception as e:
+                yield from self.flush(batch, settings, cache, writer, control)
+                yield i, None, e
+                continue
+
+            if pending.image is None:
+                yield from self.flush(batch, settings, cache, writer, control)
+                yield i, self.finish(pending, cache, writer), None
+                continue
+
+            if batch and not self.compatible(batch, pending, settings):
+                yield from self.flush(batch, settings, cache, writer, control)
+            batch.append(pending)
+        yield from self.flush(batch, settings, cache, writer, control)
+
+    def prepare(self, index, file_path, settings, cache, name, writer):
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File does not exist: {file_path}")
+        pending = PendingFile(index, file_path, FileTiming(file_path, os.path.getsize(file_path)))
+        pending.target_path = output_path_for(file_path, settings, name)
+        if cache is not None:
+            with pending.timing.measure('read'):
+                pending.cache_key = cache.key_for(file_path, settings.cache_params(pending.target_path))
+            with pending.timing.measure('write'):
+                pending.timing.cache_hit = cache.fetch(pending.cache_key, pending.target_path)
+            if pending.timing.cache_hit:
+                return pending
+
+        if settings.processing_mode == 'convert' or uses_model(settings):
+            # Nothing to batch: conversions don't resize and models run their own batches of tiles.
+            self.process_single(pending, settings, writer)
+            return pending
+
+        with pending.timing.measure('decode'):
+            img, new_dimensions = decode_image(file_path, settings, pending.timing)
+        if settings.file_timeout and pending.timing.total_seconds() > settings.file_timeout:
+            # Decoding runs on this thread and can't be interrupted, so the limit is checked once it returns.
+            img.close()
+            raise FileTimeoutError(f"gave up after {settings.file_timeout:g}s")
+        filter_name = vector_filter_for(settings)
+        if (img.mode not in VECTOR_MODES or filter_name is None or uses_tiling(img, new_dimensions, settings)
+                or is_multi_frame(img, pending.target_path)
+                or coefficient_bytes(img.size, new_dimensions) > MAX_COEFFICIENT_BYTES):
+            img.close()
+            self.process_single(pending, settings, writer)
+            return pending
+        pending.image, pending.new_dimensions = img, new_dimensions
+        return pending
+
+    def process_single(self, pending, settings, writer):
+        _, pending.written = run_operation(pending.source_path, settings, pending.timing, pending.target_path, writer)
+
+    def compatible(self, batch, pending, settings):
+        first = batch[0]
+        if (first.image.size, first.image.mode, first.new_dimensions) != \
+                (pending.image.size, pending.image.mode, pending.new_dimensions):
+            return False
+        limit = batch_limit(first.image.size, first.new_dimensions, VECTOR_MODES[first.image.mode],
+                            self.batch_size, settings.memory_budget)
+        return len(batch) < limit
+
+    def flush(self, batch, settings, cache, writer, control=None):
+        if not batch:
+            return
+        filter_name = vector_filter_for(settings)
+        outputs = [None] * len(batch)
+        try:
+            with batch[0].timing.measure('resize'):
+                outputs = resize_images([pending.image for pending in batch], batch[0].new_dimensions, filter_name)
+            # The batch shares one resize; spread its time across the files in it.
+            share = batch[0].timing.seconds['resize'] / len(batch)
+            for pending in batch:
+                pending.timing.seconds['resize'] = share
+        except Exception as e:
+            # Fall back image by image, so one odd file can't fail the rest of its batch.
+            print(f"Batched resize failed, resizing {len(batch)} file(s) one at a time: {e}")
+
+        for pending, output in zip(batch, outputs):
+            if control is not None and control.is_cancelled():
+                self.discard(batch)
+                return
+            try:
+                if output is None:
+                    with pending.timing.measure('resize'):
+                        output = transform_image(pending.image, pending.new_dimensions, settings)
+                with pending.timing.measure('encode'):
+                    pending.written = save_image(output, pending.target_path, settings.encoder_profile,
+                                                 settings.fsync, writer, pending.timing)
+                result, error = self.finish(pending, cache, writer), None
+            except Exception as e:
+                result, error = None, e
+            finally:
+                pending.image.close()
+                pending.image = None
+            yield pending.index, result, error
+        batch.clear()
+
+    def discard(self, batch):
+        for pending in batch:
+            if pending.image is not None:
+                pending.image.close()
+        batch.clear()
+
+    def finish(self, pending, cache, writer):
+        def written():
+            if cache is not None and not pending.timing.cache_hit:
+                with pending.timing.measure('write'):
+                    cache.store(pending.cache_key, pending.target_path)
+            pending.timing.output_path = pending.target_path
+            pending.timing.output_bytes = os.path.getsize(pending.target_path)
+
+        result = ProcessingResult(pending.source_path, pending.target_path, pending.timing.cache_hit, pending.timing)
+        if pending.written is None:
+            written()
+        else:
+            result.written = writer.after([pending.written], written)
+        return result
+
+    def shutdown(self):
+        pass
@@ -0,0 +1,47 @@
+from PIL import Image
+
+from cli import expand_inputs
+from folder_scanner import read_image_header, scan_directory
+from image_formats import readable_extensions
+
+
+def scanned_names(root, extensions=None):
+    return sorted(name for chunk in scan_directory(str(root), extensions) for _, name, _ in chunk)
+
+
+def test_default_scan_finds_every_readable_format(tmp_path):
+    for name in ('a.png', 'b.ppm', 'c.ico', 'd.psd', 'notes.txt'):
+        (tmp_path / name).write_bytes(b'')
+    expected = sorted(name for name in ('a.png', 'b.ppm', 'c.ico', 'd.psd')
+                      if name[name.index('.'):] in readable_extensions())
+    assert 'b.ppm' in expected
+    assert scanned_names(tmp_path) == expected
+
+
+def test_extensions_narrow_the_scan(tmp_path):
+    for name in ('a.png', 'b.PPM', 'c.jpg'):
+        (tmp_path / name).write_bytes(b'')
+    assert scanned_names(tmp_path, ('.ppm', '.png')) == ['a.png', 'b.PPM']
+
+
+def test_command_line_directories_use_readable_formats(tmp_path):
+    Image.new('RGB', (4, 4)).save(tmp_path / 'frame.ppm')
+    (tmp_path / 'frame.avif').write_bytes(b'')
+    found = [path.rsplit('/', 1)[-1] for path in expand_inputs([str(tmp_path)])]
+    assert 'frame.ppm' in found
+    assert ('frame.avif' in found) == ('.avif' in readable_extensions())
+
+
+def test_unreadable_paths_go_to_on_error(tmp_path):
+    errors = []
+    chunks = list(scan_directory(str(tmp_path / 'missing'), on_error=lambda path, e: errors.append(path)))
+    assert chunks == []
+    assert errors == [str(tmp_path / 'missing')]
+
+
+def test_unreadable_header_goes_to_on_error(tmp_path, capsys):
+    (tmp_path / 'broken.png').write_bytes(b'not an image')
+    errors = []
+    assert read_image_header(str(tmp_path / 'broken.png'), lambda path, e: errors.append(path)) is None
+    assert errors == [str(tmp_path / 'broken.png')]
+    assert capsys.readouterr().out == ''
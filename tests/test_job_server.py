@@ -0,0 +1,19 @@
+import pytest
+
+from job_server import check_loopback, create_server
+
+
+@pytest.mark.parametrize('host', ['127.0.0.1', 'localhost', '::1'])
+def test_loopback_hosts_allowed(host):
+    check_loopback(host)
+
+
+@pytest.mark.parametrize('host', ['0.0.0.0', '::', '192.168.1.20'])
+def test_other_hosts_refused(host):
+    with pytest.raises(ValueError, match='refusing'):
+        check_loopback(host)
+
+
+def test_server_refuses_to_bind_a_public_address():
+    with pytest.raises(ValueError, match='refusing'):
+        create_server('0.0.0.0:0', scheduler=None)
@@ -0,0 +1,27 @@
+import pytest
+
+from processing_options import RENDITIONS_MODE, check_name_template
+
+
+@pytest.mark.parametrize('template', ['{name}.{ext}', '{parent}_{name}@{scale}.{ext}', '{name}.jpg', '{name}.TIF'])
+def test_name_template_accepted(template):
+    check_name_template(template, 'upscale')
+
+
+@pytest.mark.parametrize('template', ['{name}', '{mode}_{name}', '{name}.{ext}.bak', '{name}.txt', '{name}_{ext}'])
+def test_name_template_without_saveable_extension_rejected(template):
+    with pytest.raises(ValueError, match='extension'):
+        check_name_template(template, 'upscale')
+
+
+@pytest.mark.parametrize('template, message', [('{stem}.{ext}', 'unknown field'), ('x.{ext}', '{name}'),
+                                               ('{name}/x.{ext}', 'plain file name')])
+def test_name_template_other_mistakes_rejected(template, message):
+    with pytest.raises(ValueError, match=message):
+        check_name_template(template, 'upscale')
+
+
+def test_rendition_template_needs_rendition():
+    with pytest.raises(ValueError, match='rendition'):
+        check_name_template('{name}.{ext}', RENDITIONS_MODE)
+    check_name_template('{name}_{rendition}.{ext}', RENDITIONS_MODE)
@@ -0,0 +1,38 @@
+from PIL import Image
+
+from engine import ProcessingSettings, process_file
+from processing_options import RENDITIONS_MODE
+from renditions import Rendition
+
+
+def test_cache_params_include_output_format():
+    settings = ProcessingSettings('upscale', '/out', '2x', 'any', 'png')
+    assert settings.cache_params('/out/upscaled_photo.jpg') != settings.cache_params('/out/upscaled_photo.png')
+
+
+def test_renditions_differing_only_in_format_are_cached_apart(tmp_path):
+    # Same source, scale and name: before the output format was part of the key, the second and third runs
+    # were served the first one's WEBP bytes.
+    source = tmp_path / 'photo.png'
+    Image.linear_gradient('L').convert('RGB').save(source)
+    (tmp_path / 'out').mkdir()
+    for image_format, expected in (('webp', 'WEBP'), ('png', 'PNG'), ('gif', 'GIF')):
+        rendition = Rendition('downscale', '2x', image_format, name='small')
+        settings = ProcessingSettings(RENDITIONS_MODE, str(tmp_path / 'out'), None, None, None,
+                                      cache_directory=str(tmp_path / 'cache'), renditions=[rendition.as_dict()])
+        result = process_file(str(source), settings)
+        assert result.output_paths[0].endswith(f".{image_format}")
+        with Image.open(result.output_paths[0]) as output:
+            assert output.format == expected
+
+
+def test_repeated_hit_leaves_no_temporary_files(tmp_path):
+    source = tmp_path / 'photo.png'
+    Image.linear_gradient('L').convert('RGB').save(source)
+    (tmp_path / 'out').mkdir()
+    settings = ProcessingSettings('downscale', str(tmp_path / 'out'), '2x', 'any', 'png',
+                                  cache_directory=str(tmp_path / 'cache'))
+    # The second run links the output to its cache entry; the third finds it linked already.
+    results = [process_file(str(source), settings) for _ in range(3)]
+    assert [result.cache_hit for result in results] == [False, True, True]
+    assert sorted(path.name for path in (tmp_path / 'out').iterdir()) == ['downscaled_photo.png']
@@ -0,0 +1,91 @@
+import pytest
+from PIL import Image, ImageChops
+
+from tiling import MAPPED_MODES, iter_resized_strips, resize_to_mapped_buffer, strip_height_for_budget, tiled_resize
+
+# Small enough that every output below is cut into many strips.
+BUDGET = 16 * 1024
+SCALES = [0.37, 1.5, 3.7, 8.0]
+
+
+def synthetic_image(mode, size=(173, 121)):
+    noise = Image.effect_noise(size, 48)
+    gradient = Image.linear_gradient('L').resize(size)
+    rgb = Image.merge('RGB', [noise, gradient, noise.transpose(Image.FLIP_LEFT_RIGHT)])
+    if mode == 'P':
+        return rgb.quantize(64)
+    if mode == 'RGBA':
+        return Image.merge('RGBA', [*rgb.split(), gradient.rotate(180)])
+    return rgb if mode == 'RGB' else noise
+
+
+def scaled_size(img, scale):
+    return max(int(img.width * scale), 1), max(int(img.height * scale), 1)
+
+
+def max_difference(a, b):
+    # Pillow resamples alpha images premultiplied, so they are compared there; palette images by colour.
+    if a.mode == 'RGBA':
+        a, b = a.convert('RGBa'), b.convert('RGBa')
+    elif a.mode == 'P':
+        a, b = a.convert('RGB'), b.convert('RGB')
+    extrema = ImageChops.difference(a, b).getextrema()
+    return extrema[1] if isinstance(extrema[0], int) else max(high for _, high in extrema)
+
+
+def decoded(img, path):
+    # Written and read back the way the tiled output is, so formats that drop something (BMP drops alpha)
+    # drop it from both sides of a comparison.
+    img.save(path)
+    with Image.open(path) as saved:
+        saved.load()
+        return saved
+
+
+def assembled_strips(img, size):
+    strip_height = strip_height_for_budget(img, size, Image.LANCZOS, BUDGET)
+    assert strip_height < size[1]
+    assembled = Image.new(img.mode, size)
+    if img.mode == 'P':
+        assembled.putpalette(img.getpalette())
+    for y0, strip in iter_resized_strips(img, size, Image.LANCZOS, strip_height):
+        assembled.paste(strip, (0, y0))
+    return assembled
+
+
+@pytest.mark.parametrize('scale', SCALES)
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA', 'L', 'P'])
+def test_strips_match_whole_image_resize(mode, scale):
+    img = synthetic_image(mode)
+    size = scaled_size(img, scale)
+    assert max_difference(img.resize(size, Image.LANCZOS), assembled_strips(img, size)) <= 1
+
+
+@pytest.mark.parametrize('scale', SCALES)
+@pytest.mark.parametrize('extension', ['png', 'bmp', 'tif'])
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA', 'L', 'P'])
+def test_tiled_output_decodes_to_strips(tmp_path, mode, extension, scale):
+    if extension != 'png' and mode not in MAPPED_MODES:
+        pytest.skip("only PNG streams palette images; other formats resize them in one piece")
+    img = synthetic_image(mode)
+    size = scaled_size(img, scale)
+    target = tmp_path / f"out.{extension}"
+    tiled_resize(img, size, Image.LANCZOS, str(target), BUDGET)
+    expected = decoded(assembled_strips(img, size), tmp_path / f"expected.{extension}")
+    with Image.open(target) as output:
+        assert output.size == size
+        assert max_difference(expected, output.convert(expected.mode)) == 0
+
+
+@pytest.mark.parametrize('extension', ['png', 'bmp', 'tif'])
+@pytest.mark.parametrize('mode', sorted(set(MAPPED_MODES) - {'CMYK'}))
+def test_mapped_buffer_decodes_to_strips(tmp_path, mode, extension):
+    # The memory-mapped output path on its own, PNG included, which tiled_resize would otherwise stream.
+    img = synthetic_image(mode)
+    size = scaled_size(img, 3.7)
+    target = tmp_path / f"out.{extension}"
+    resize_to_mapped_buffer(img, size, Image.LANCZOS, str(target),
+                            strip_height_for_budget(img, size, Image.LANCZOS, BUDGET), {})
+    expected = decoded(assembled_strips(img, size), tmp_path / f"expected.{extension}")
+    with Image.open(target) as output:
+        assert max_difference(expected, output.convert(expected.mode)) == 0